@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+@summary: On-disk cache of the accounts derived from the MNEMONIC.
+
+Deriving the master key (PBKDF2, 2048 rounds) and the hardened path on every
+launch is slow. The cache file, named after a hash of the mnemonic and path,
+keeps the key at the end of the path and fixed-width account records:
+
+    header   magic (8 bytes), sha256(mnemonic, path) (32 bytes), flags (1 byte),
+             salt (16 bytes), CTR nonce (8 bytes), GCM nonce (12 bytes),
+             GCM tag (16 bytes), path key (78 bytes, BIP-32 serialization)
+    records  per account index: address (20 bytes) + private key (32 bytes)
+
+With a password the path key is encrypted with AES-GCM and the private keys
+with AES-CTR, whose counter is derived from the record index, so any account
+is still read in O(1).
+"""
+import os
+import struct
+import hashlib
+
+from Crypto.Cipher import AES
+
+from crypto import HDPrivateKey, HDKey
+
+MAGIC = b"HMRACCT1"
+HEADER = struct.Struct(">8s32sB16s8s12s16s78s")
+RECORD = struct.Struct(">20s32s")
+FLAG_ENCRYPTED = 0x1
+KDF_ROUNDS = 100000
+
+
+class AccountCacheError(Exception):
+    pass
+
+
+def cache_id(mnemonic, path):
+    return hashlib.sha256(("%s\0%s" % (mnemonic, path)).encode('utf-8')).digest()
+
+
+class AccountCache:
+    """
+    Accounts at `path`/index of the mnemonic, derived once and then read from disk.
+
+    >>> cache = AccountCache(MNEMONIC, "m/44'/60'/0'/0", "account-cache")
+    >>> address, private_key = cache.accounts(10)[3]
+    """
+
+    def __init__(self, mnemonic, path, directory, password=None, processes=None):
+        self.mnemonic = mnemonic
+        self.path = path
+        self.password = password
+        self.processes = processes
+        self.id = cache_id(mnemonic, path)
+        self.file = os.path.join(directory, "%s.bin" % self.id.hex()[:32])
+        self._path_key = None
+        self._header = None
+        self._cipher_keys = {}
+
+    def _cipher_key(self, salt):
+        if self._cipher_keys.get(salt) is None:
+            self._cipher_keys[salt] = hashlib.pbkdf2_hmac('sha256', self.password.encode('utf-8'), salt, KDF_ROUNDS)
+        return self._cipher_keys[salt]
+
+    def _key_stream(self, salt, ctr_nonce, index):
+        # 32 bytes of private key = 2 AES blocks per record
+        return AES.new(self._cipher_key(salt), AES.MODE_CTR, nonce=ctr_nonce, initial_value=index * 2)
+
+    def _create(self):
+        """ Derives the key at the end of the path (the slow part) and writes an empty cache """
+        master_key = HDPrivateKey.master_key_from_mnemonic(self.mnemonic)
+        path_key = HDKey.from_path(master_key, self.path)[-1]
+        self._path_key = path_key
+
+        salt, ctr_nonce, gcm_nonce = os.urandom(16), os.urandom(8), os.urandom(12)
+        flags, tag, key_bytes = 0, bytes(16), bytes(path_key)
+        if self.password:
+            flags |= FLAG_ENCRYPTED
+            cipher = AES.new(self._cipher_key(salt), AES.MODE_GCM, nonce=gcm_nonce)
+            key_bytes, tag = cipher.encrypt_and_digest(key_bytes)
+
+        header = HEADER.pack(MAGIC, self.id, flags, salt, ctr_nonce, gcm_nonce, tag, key_bytes)
+        os.makedirs(os.path.dirname(self.file) or ".", exist_ok=True)
+        with open(self.file, "wb") as f:
+            f.write(header)
+        return HEADER.unpack(header)
+
+    def _read_header(self, f):
+        header = HEADER.unpack(f.read(HEADER.size))
+        magic, identifier, flags = header[:3]
+        if magic != MAGIC or identifier != self.id:
+            raise AccountCacheError("%s is not an account cache of this mnemonic and path" % self.file)
+        if flags & FLAG_ENCRYPTED and not self.password:
+            raise AccountCacheError("%s is encrypted, a password is needed" % self.file)
+        if not flags & FLAG_ENCRYPTED and self.password:
+            raise AccountCacheError("%s is not encrypted, remove it to encrypt it" % self.file)
+        return header
+
+    def path_key(self):
+        """ The HDPrivateKey at the end of the path, new accounts are derived from it """
+        if self._path_key is None:
+            _, _, flags, salt, _, gcm_nonce, tag, key_bytes = self._header
+            if flags & FLAG_ENCRYPTED:
+                cipher = AES.new(self._cipher_key(salt), AES.MODE_GCM, nonce=gcm_nonce)
+                try:
+                    key_bytes = cipher.decrypt_and_verify(key_bytes, tag)
+                except ValueError:
+                    raise AccountCacheError("Wrong password for %s" % self.file)
+            self._path_key = HDKey.from_bytes(key_bytes)
+        return self._path_key
+
+    def _extend(self, first, how_many):
+        """ Derives the accounts first .. how_many - 1 and appends them """
+        path_key = self.path_key()
+        _, _, flags, salt, ctr_nonce = self._header[:5]
+
+        addresses, keys = HDPrivateKey.derive_packed(path_key, first, how_many - first, self.processes)
+        if flags & FLAG_ENCRYPTED:
+            keys = self._key_stream(salt, ctr_nonce, first).encrypt(keys)
+
+        with open(self.file, "r+b") as f:
+            f.seek(HEADER.size + first * RECORD.size)
+            f.write(b"".join(RECORD.pack(addresses[i * 20:(i + 1) * 20], keys[i * 32:(i + 1) * 32])
+                             for i in range(how_many - first)))
+
+    def accounts(self, how_many):
+        """
+        (address bytes, private key bytes) of the accounts 0 .. how_many - 1.
+        Only the accounts missing from the cache are derived.
+        """
+        if not os.path.exists(self.file):
+            self._header = self._create()
+            cached = 0
+        else:
+            with open(self.file, "rb") as f:
+                self._header = self._read_header(f)
+            cached = (os.path.getsize(self.file) - HEADER.size) // RECORD.size
+            if self.password:
+                # checks the password, a wrong one would decrypt garbage keys
+                self.path_key()
+
+        if cached < how_many:
+            print("> Deriving %d accounts, %d are cached on %s" % (how_many - cached, cached, self.file))
+            self._extend(cached, how_many)
+
+        with open(self.file, "rb") as f:
+            f.seek(HEADER.size)
+            data = f.read(how_many * RECORD.size)
+
+        addresses = [data[i * RECORD.size:i * RECORD.size + 20] for i in range(how_many)]
+        keys = b"".join(data[i * RECORD.size + 20:(i + 1) * RECORD.size] for i in range(how_many))
+        _, _, flags, salt, ctr_nonce = self._header[:5]
+        if flags & FLAG_ENCRYPTED:
+            keys = self._key_stream(salt, ctr_nonce, 0).decrypt(keys)
+
+        return [(addresses[i], keys[i * 32:(i + 1) * 32]) for i in range(how_many)]
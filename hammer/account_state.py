@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+@summary: nonces and balances of many accounts, in concurrent JSON-RPC batches
+
+One blocking eth_getTransactionCount per account makes the start of a run with
+thousands of accounts a long chain of round trips. Here the latest and pending
+nonces and the balance of STATE_BATCH accounts go in one JSON-RPC batch, and
+STATE_THREADS batches are in flight at once, over the shared HTTP session.
+The AtomicNonce of the accounts and the funding use the result.
+"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from config import RPC_NODE_SEND, STATE_BATCH, STATE_THREADS
+from transport import rpc_batch
+
+AccountState = namedtuple("AccountState", ["latest_nonce", "pending_nonce", "balance"])
+
+CALLS = (("eth_getTransactionCount", "latest"), ("eth_getTransactionCount", "pending"), ("eth_getBalance", "latest"))
+
+
+def load_chunk(addresses, url):
+    calls = [(method, (address, block)) for address in addresses for method, block in CALLS]
+    results = rpc_batch(calls, url, chunk=len(calls))
+    values = [int(result["result"], 16) for result in results]
+    return [AccountState(*values[i:i + len(CALLS)]) for i in range(0, len(values), len(CALLS))]
+
+
+def load_account_states(addresses, url=RPC_NODE_SEND, chunk=STATE_BATCH, threads=STATE_THREADS):
+    """
+    AccountState of every address, in order.
+    Raises transport.RPCError when a batch fails, KeyError when a call of a batch does.
+    """
+    chunks = [addresses[start:start + chunk] for start in range(0, len(addresses), chunk)]
+    if len(chunks) <= 1:
+        return [state for addresses in chunks for state in load_chunk(addresses, url)]
+    with ThreadPoolExecutor(min(threads, len(chunks))) as executor:
+        return [state for states in executor.map(lambda addresses: load_chunk(addresses, url), chunks)
+                for state in states]
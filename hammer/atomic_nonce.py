@@ -1,23 +1,101 @@
 #!/usr/bin/env python3
 """
 @summary: An atomic, thread-safe incrementing nonce. To deal with transaction on same account
+
+Signers reserve nonces by ranges, `reserve(n)`, one lock round trip per range
+instead of per transaction. Nonces reserved but not sent (a failed job, a
+stopped run) are given back with `release(range)`, and handed out again to
+the first reservation they can hold, so they do not leave a gap. SharedAtomicNonce keeps the same state in
+shared memory, for signers in other processes.
 """
 from threading import Lock
+from multiprocessing import RawArray, Lock as ProcessLock
+
+
+class NonceError(Exception):
+    pass
+
+
+def merge_ranges(released):
+    """ (start, stop) pairs sorted, adjacent and overlapping ones merged """
+    merged = []
+    for start, stop in sorted(released):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(stop, merged[-1][1]))
+        else:
+            merged.append((start, stop))
+    return merged
 
 
-class AtomicNonce:
+class NonceRanges:
+    """
+    reserve() and release() over the state of a subclass: the last nonce handed
+    out, and the released (start, stop) pairs, read by _state() and written by _save()
+    under its _lock
+    """
+
+    def reserve(self, num=1):
+        """
+        Reserves `num` consecutive nonces, returned as a range: the lowest released
+        ones when a released range holds them, new ones otherwise.
+        """
+        with self._lock:
+            value, released = self._state()
+            for i, (start, stop) in enumerate(released):
+                if stop - start >= num:
+                    nonces = range(start, start + num)
+                    if nonces.stop < stop:
+                        released[i] = (nonces.stop, stop)
+                    else:
+                        del released[i]
+                    break
+            else:
+                nonces = range(value + 1, value + 1 + num)
+                value += num
+            self._save(value, released)
+            return nonces
+
+    def increment(self, num=1):
+        """ Reserves `num` nonces, see reserve(), and returns the last one """
+        return self.reserve(num)[-1]
+
+    def release(self, nonces):
+        """
+        Gives back reserved nonces that were not sent, for reserve() to hand them out again.
+        Raises NonceError for nonces not handed out, or already released.
+        """
+        if not nonces:
+            return
+        with self._lock:
+            value, released = self._state()
+            if nonces.stop > value + 1:
+                raise NonceError("Nonces %s of %s were not reserved" % (nonces, self.address))
+            if any(nonces.start < stop and start < nonces.stop for start, stop in released):
+                raise NonceError("Nonces %s of %s were already released" % (nonces, self.address))
+            released = merge_ranges(released + [(nonces.start, nonces.stop)])
+            # released nonces up to the last one handed out are not a gap anymore
+            if released[-1][1] == value + 1:
+                value = released.pop()[0] - 1
+            self._save(value, released)
+
+    def released(self):
+        with self._lock:
+            return [range(start, stop) for start, stop in self._state()[1]]
+
+
+class AtomicNonce(NonceRanges):
     """An atomic, thread-safe incrementing nonce.
-    >>> nonce = AtomicNonce()
+    >>> nonce = AtomicNonce(w3, address, 41)
     >>> nonce.increment()
-    1
-    >>> nonce.increment(4)
-    5
-    >>> nonce = AtomicNonce(42.5)
-    >>> nonce.value
-    42.5
-    >>> nonce.increment(0.5)
-    43.0
-    >>> nonce = AtomicNonce()
+    42
+    >>> nonce.reserve(4)
+    range(43, 47)
+    >>> nonce.release(range(44, 46))
+    >>> nonce.reserve(4)
+    range(47, 51)
+    >>> nonce.reserve(2)
+    range(44, 46)
+    >>> nonce = AtomicNonce(w3, address, -1)
     >>> def incrementor():
     ...     for i in range(100000):
     ...         nonce.increment()
@@ -29,19 +107,63 @@ class AtomicNonce:
     >>> for thread in threads:
     ...     thread.join()
     >>> nonce.value
-    400000
+    399999
     """
 
-    def __init__(self, w3, address):
-        """Initialize a new atomic nonce to given initial value"""
+    def __init__(self, w3, address, value=None):
+        """Initialize a new atomic nonce to given initial value, the last nonce used.
+        Without value, it is read from the node.
+        """
         self.address = address
-        self.value = w3.eth.getTransactionCount(self.address) - 1
+        self.value = w3.eth.getTransactionCount(self.address) - 1 if value is None else value
+        self._released = []
         self._lock = Lock()
 
-    def increment(self, num=1):
-        """Atomically increment the nonce by num (default 1) and return the
-        new value.
-        """
+    def _state(self):
+        return self.value, list(self._released)
+
+    def _save(self, value, released):
+        self.value = value
+        self._released = released
+
+    def shared(self, capacity=64):
+        """ A SharedAtomicNonce from this one, to pass to processes when they are started """
         with self._lock:
-            self.value = self.value + num
-            return self.value
+            nonce = SharedAtomicNonce(self.address, self.value, capacity)
+            nonce._save(self.value, list(self._released))
+            return nonce
+
+
+class SharedAtomicNonce(NonceRanges):
+    """
+    AtomicNonce in shared memory, for the processes of a pool: pass it at their start
+    (e.g. in the initializer arguments), it cannot be pickled in a task.
+    Holds at most `capacity` released ranges.
+
+    >>> nonce = AtomicNonce(w3, address).shared()
+    >>> Pool(processes, initializer=init_worker, initargs=(nonce,))
+    """
+
+    def __init__(self, address, value, capacity=64):
+        self.address = address
+        self.capacity = capacity
+        # value, number of released ranges, then their (start, stop)
+        self._array = RawArray("q", 2 + 2 * capacity)
+        self._array[0] = value
+        self._lock = ProcessLock()
+
+    @property
+    def value(self):
+        return self._array[0]
+
+    def _state(self):
+        count = self._array[1]
+        pairs = self._array[2:2 + 2 * count]
+        return self._array[0], [(pairs[i], pairs[i + 1]) for i in range(0, len(pairs), 2)]
+
+    def _save(self, value, released):
+        if len(released) > self.capacity:
+            raise NonceError("More than %d released nonce ranges for %s" % (self.capacity, self.address))
+        self._array[0] = value
+        self._array[1] = len(released)
+        self._array[2:2 + 2 * len(released)] = [n for pair in released for n in pair]
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+@summary: adaptive size of the JSON-RPC batches of transactions (BATCH_TX)
+
+Every account sizes its batches with additive increase, multiplicative
+decrease (AIMD): a full batch answered within BATCH_TARGET_LATENCY grows the
+next one by BATCH_INCREASE transactions, a slow answer shrinks it by
+BATCH_DECREASE. Pool-full rejections and failed batches (e.g. a node refusing
+a batch that is too large) also lower the limit of the endpoint, shared by
+all its accounts, so the others back off too.
+
+The transactions of a batch are consumed up to the first pool-full rejection.
+It and the ones after it are sent again, a rejected nonce would leave a gap.
+"""
+import re
+import time
+from threading import Lock
+
+from config import TX_PER_BATCH, BATCH_MIN, BATCH_MAX, BATCH_TARGET_LATENCY, BATCH_INCREASE, BATCH_DECREASE
+
+POOL_FULL = re.compile(r"pool\W*(is\W*)?full", re.IGNORECASE)
+KNOWN_TX = re.compile(r"known transaction|already known", re.IGNORECASE)
+
+
+def error_message(error):
+    if isinstance(error, dict):
+        return str(error.get("message", error))
+    return str(error)
+
+
+def batch_outcome(response, count, first_id=0):
+    """
+    Outcome of the answer to a batch of `count` eth_sendRawTransaction calls,
+    whose ids follow from `first_id`.
+
+    Returns:
+        tuple: how many transactions, from the first one, are consumed,
+        (position in the batch, hash) of the accepted ones, the errors, whether the pool was
+        full and whether the whole batch failed.
+    """
+    if not isinstance(response, list):
+        return 0, [], [response.get("error", response) if isinstance(response, dict) else response], False, True
+
+    results = {}
+    for result in response:
+        if isinstance(result.get("id"), int) and 0 <= result["id"] - first_id < count:
+            results[result["id"] - first_id] = result
+
+    consumed = count
+    hashes, errors = [], []
+    for position in range(count):
+        result = results.get(position, {"error": "No answer for this transaction"})
+        if "result" in result:
+            # accepted after a rejection: its hash is kept, sending it again gives "known transaction"
+            hashes.append((position, result["result"]))
+        elif POOL_FULL.search(error_message(result.get("error"))):
+            consumed = min(consumed, position)
+        elif position < consumed and not KNOWN_TX.search(error_message(result.get("error"))):
+            errors.append(result.get("error"))
+    return consumed, hashes, errors, consumed < count, False
+
+
+class BatchLimit:
+    """
+    Largest batch of an endpoint, and the sizes of the batches sent to it
+    """
+
+    def __init__(self, limit=BATCH_MAX):
+        self.limit = limit
+        self.batches = 0
+        self.pool_full = 0
+        self.failed = 0
+        self.min_size = None
+        self.max_size = 0
+        self._start = None
+        self._seconds = {}  # second since the first batch: [sum of sizes, batches]
+        self._lock = Lock()
+
+    def record(self, size, pool_full, failed):
+        with self._lock:
+            self.batches += 1
+            self.pool_full += pool_full
+            self.failed += failed
+            self.min_size = size if self.min_size is None else min(self.min_size, size)
+            self.max_size = max(self.max_size, size)
+            if self._start is None:
+                self._start = time.monotonic()
+            second = self._seconds.setdefault(int(time.monotonic() - self._start), [0, 0])
+            second[0] += size
+            second[1] += 1
+
+    def lower(self, size):
+        with self._lock:
+            self.limit = max(BATCH_MIN, min(self.limit, size))
+
+    def raise_limit(self):
+        with self._lock:
+            self.limit = min(BATCH_MAX, self.limit + BATCH_INCREASE)
+
+    def stats(self):
+        """ Sizes of the batches, and their average per second since the first one """
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "pool_full": self.pool_full,
+                "failed": self.failed,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "limit": self.limit,
+                "sizes_per_second": [[second, round(total / batches, 1), batches]
+                                     for second, (total, batches) in sorted(self._seconds.items())]
+            }
+
+
+class AdaptiveBatch:
+    """
+    Batch size of an account on an endpoint.
+
+    >>> batch = AdaptiveBatch(endpoint.batch_limit)
+    >>> body = bodies.batch(position, position + batch.size)
+    >>> batch.observe(count, latency, pool_full, failed)
+    """
+
+    def __init__(self, limit, initial=TX_PER_BATCH):
+        self.limit = limit
+        self._size = max(BATCH_MIN, min(initial, BATCH_MAX))
+
+    @property
+    def size(self):
+        return min(self._size, self.limit.limit)
+
+    def observe(self, count, latency, pool_full=False, failed=False):
+        """ Sizes the next batch from the answer to a batch of `count` transactions """
+        self.limit.record(count, pool_full, failed)
+        if pool_full or failed or latency > BATCH_TARGET_LATENCY:
+            self._size = max(BATCH_MIN, int(min(self._size, count) * BATCH_DECREASE))
+            if pool_full or failed:
+                self.limit.lower(self._size)
+        elif count >= self.size:
+            self._size = min(BATCH_MAX, self._size + BATCH_INCREASE)
+            if self._size > self.limit.limit:
+                self.limit.raise_limit()
+
+
+def account_batch(account, endpoint):
+    """ The AdaptiveBatch of an account on an endpoint """
+    batches = account.setdefault("batches", {})
+    if endpoint.url not in batches:
+        batches[endpoint.url] = AdaptiveBatch(endpoint.batch_limit)
+    return batches[endpoint.url]
@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+@summary: Offline micro benchmarks of the transaction pipeline. No node needed.
+
+    hammer/benchmark.py template [count]
+    hammer/benchmark.py crypto [count]
+    hammer/benchmark.py derive [count]
+    hammer/benchmark.py memory [count]
+    hammer/benchmark.py bodies [count]
+    hammer/benchmark.py transport [count] [in flight]
+    hammer/benchmark.py nonce [count] [range size]
+    hammer/benchmark.py rawtx [count]
+"""
+import os
+import sys
+import json
+import time
+
+# extend path for imports:
+if __name__ == '__main__' and __package__ is None:
+    from os import sys, path
+    sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+from web3 import Web3
+
+from config import GAS, GAS_PRICE, CHAIN_ID, FILE_CONTRACT_ABI
+
+# Well known development mnemonic and key, never use them on a real network
+MNEMONIC = "test test test test test test test test test test test junk"
+PRIVATE_KEY = "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80"
+CONTRACT_ADDRESS = "0x1111111111111111111111111111111111111111"
+ERC20PLUS_ABI = "erc20plus-abi.json"
+
+
+def timed(label, count, fn, batch=False):
+    """
+    Runs fn(i) `count` times, or fn(count) once for a batch,
+    prints and returns the rate per second
+    """
+    start = time.perf_counter()
+    results = fn(count) if batch else [fn(i) for i in range(count)]
+    elapsed = time.perf_counter() - start
+    line = "%-28s %7d in %6.2f s = %9.1f /s (%7.1f us each)"
+    print(line % (label, count, elapsed, count / elapsed, elapsed / count * 1e6))
+    return count / elapsed, results
+
+
+def bench_template(count=2000):
+    """
+    web3 buildTransaction + signTransaction vs the precompiled TransactionTemplate
+    """
+    from tx_template import TransactionTemplate, signing_key
+
+    w3 = Web3()
+    abi = json.load(open(FILE_CONTRACT_ABI, 'r'))
+    contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=abi)
+
+    def web3_path(i):
+        tx = contract.functions.set(x=i).buildTransaction({
+            'gas': GAS,
+            'gasPrice': GAS_PRICE,
+            'nonce': i,
+            'chainId': CHAIN_ID
+        })
+        return w3.eth.account.signTransaction(tx, private_key=PRIVATE_KEY).rawTransaction
+
+    template = TransactionTemplate(abi, 'set', CONTRACT_ADDRESS)
+    key = signing_key(PRIVATE_KEY)
+
+    def template_path(i):
+        return template.sign(key, i, i)
+
+    def web3_encode(i):
+        return contract.functions.set(x=i).buildTransaction({
+            'gas': GAS,
+            'gasPrice': GAS_PRICE,
+            'nonce': i,
+            'chainId': CHAIN_ID
+        })
+
+    def template_encode(i):
+        return template.unsigned(i, i)
+
+    print("\n> Encoding only")
+    web3_rate, _ = timed("web3 buildTransaction", count, web3_encode)
+    template_rate, _ = timed("template unsigned", count, template_encode)
+    print("> encoding speedup: %.1fx" % (template_rate / web3_rate))
+
+    print("\n> Encoding and signing")
+    web3_rate, web3_txs = timed("web3 build + sign", count, web3_path)
+    template_rate, template_txs = timed("template sign", count, template_path)
+    print("> end to end speedup: %.1fx" % (template_rate / web3_rate))
+
+    if web3_txs != template_txs:
+        print("<FAIL> template raw transactions differ from web3 ones")
+        exit(1)
+    print("> raw transactions are identical")
+
+    # every function of erc20plus-abi.json with static arguments
+    abi = json.load(open(ERC20PLUS_ABI, 'r'))
+    erc20 = w3.eth.contract(address=CONTRACT_ADDRESS, abi=abi)
+    args = {'address': CONTRACT_ADDRESS, 'uint256': 7, 'bytes32': b'\x01' * 32, 'bytes4': b'\x02' * 4}
+    for function in abi:
+        if function['type'] != 'function':
+            continue
+        fn_args = [args[i['type']] for i in function['inputs']]
+        expected = erc20.encodeABI(fn_name=function['name'], args=fn_args)
+        encoded = TransactionTemplate(abi, function['name'], CONTRACT_ADDRESS).encode_call(*fn_args)
+        if Web3.toHex(encoded) != expected:
+            print("<FAIL> calldata of %s differs" % function['name'])
+            exit(1)
+    print("> erc20plus calldata is identical for every function")
+
+
+def bench_crypto(count=200):
+    """
+    Derivations/s and signatures/s of every EC backend of crypto.py.
+    Fails when backends disagree on an address or a signature.
+    """
+    from crypto import HDPrivateKey, HDKey, set_backend, available_backends, sha3
+    from eth_keys import keys
+
+    master_key = HDPrivateKey.master_key_from_mnemonic(MNEMONIC)
+    path = "m/44'/60'/0'/0"
+    messages = [sha3(i.to_bytes(32, 'big')) for i in range(count)]
+
+    results = {}
+    for name in available_backends():
+        set_backend(name)
+        print("\n> Backend %s" % name)
+        parent = HDKey.from_path(master_key, path)[-1]
+        key = HDPrivateKey.from_parent(parent, 0)._key
+        # builds the precomputed tables, if any
+        key.public_key
+
+        def derive(i):
+            child = HDPrivateKey.from_parent(parent, i)
+            return child.public_key.address(), child._key.key
+
+        _, derived = timed("derivations", count, derive)
+        _, derived_many = timed("derivations (derive_many)", count,
+                                lambda n: [(c.public_key.address(), c._key.key)
+                                           for c in HDPrivateKey.derive_many(parent, range(n))], batch=True)
+
+        def sign(i):
+            sig, rec_id = key.raw_sign(messages[i], do_hash=False)
+            return sig.x, sig.y, rec_id
+
+        _, signatures = timed("signatures", count, sign)
+        _, signatures_many = timed("signatures (sign_many)", count,
+                                   lambda n: [(sig.x, sig.y, rec_id)
+                                              for sig, rec_id in key.sign_many(messages[:n], do_hash=False)], batch=True)
+        if derived_many != derived or signatures_many != signatures:
+            print("<FAIL> %s batched results differ" % name)
+            exit(1)
+        results[name] = derived, signatures
+
+    # eth_keys is the reference implementation of Ethereum signatures
+    reference_key = keys.PrivateKey(HDKey.from_path(master_key, path + "/0")[-1]._key.key.to_bytes(32, 'big'))
+    reference = [(sig.r, sig.s, sig.v) for sig in map(reference_key.sign_msg_hash, messages)]
+
+    for name, (derived, signatures) in results.items():
+        if signatures != reference:
+            print("<FAIL> %s signatures differ from eth_keys" % name)
+            exit(1)
+        if derived != results[next(iter(results))][0]:
+            print("<FAIL> %s derived keys differ" % name)
+            exit(1)
+    print("\n> %s: identical keys, addresses and signatures" % ", ".join(results))
+
+
+def bench_derive(count=20000):
+    """
+    Bulk account derivation (HDPrivateKey.derive_packed) with 1, 2, 4 .. all CPU cores
+    """
+    from crypto import HDPrivateKey, HDKey
+
+    parent = HDKey.from_path(HDPrivateKey.master_key_from_mnemonic(MNEMONIC), "m/44'/60'/0'/0")[-1]
+    processes, results = 1, []
+    while True:
+        print("\n> %d processes" % processes)
+        rate, packed = timed("derivations", count,
+                             lambda n: HDPrivateKey.derive_packed(parent, 0, n, processes), batch=True)
+        results.append(packed)
+        if processes >= os.cpu_count():
+            break
+        processes = min(processes * 2, os.cpu_count())
+
+    if any(packed != results[0] for packed in results):
+        print("<FAIL> derived accounts differ")
+        exit(1)
+
+
+def bench_memory(count=100000):
+    """
+    Bytes per account of `count` derived HDPrivateKey objects, with their address
+    """
+    import tracemalloc
+    from crypto import HDPrivateKey, HDKey
+
+    parent = HDKey.from_path(HDPrivateKey.master_key_from_mnemonic(MNEMONIC), "m/44'/60'/0'/0")[-1]
+    parent.public_key
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    accounts = HDPrivateKey.derive_many(parent, range(count))
+    addresses = [account.public_key.address() for account in accounts]
+    elapsed = time.perf_counter() - start
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    line = "%d accounts in %.1f s | %d bytes per account (peak %d)"
+    print(line % (len(addresses), elapsed, (after - before) / count, (peak - before) / count))
+
+
+def bench_bodies(count=100000, per_batch=400):
+    """
+    Broadcast-side CPU per transaction of encoding the batch request bodies: building
+    the calls in the broadcast loop (as send_batch did) vs slicing the prebuilt RequestBodies
+    """
+    from rpc_bodies import RequestBodies
+
+    raw_txs = [os.urandom(110) for _ in range(count)]
+
+    def in_loop(count):
+        signed_txs = list(raw_txs)
+        while signed_txs:
+            batch_request = [{'jsonrpc': '2.0', 'method': 'eth_sendRawTransaction',
+                              'params': [Web3.toHex(raw_tx)], 'id': i}
+                             for i, raw_tx in enumerate(signed_txs[:per_batch])]
+            json.dumps(batch_request).encode()
+            del signed_txs[:per_batch]
+
+    start = time.process_time()
+    bodies = RequestBodies.from_raw_txs(raw_txs)
+    print("%-28s %7d in %6.2f s CPU, %d bytes" % ("prebuilt at signing", count, time.process_time() - start,
+                                                  bodies.nbytes()))
+
+    def prebuilt(count):
+        for position in range(0, count, per_batch):
+            bodies.batch(position, position + per_batch)
+
+    for label, fn in (("encoded in broadcast loop", in_loop), ("sliced from prebuilt", prebuilt)):
+        start = time.process_time()
+        fn(count)
+        cpu = time.process_time() - start
+        print("%-28s %7d in %6.2f s CPU (%7.2f us per tx)" % (label, count, cpu, cpu / count * 1e6))
+
+    calls = json.loads(bodies.batch(per_batch, 2 * per_batch))
+    if [call["params"][0] for call in calls] != [Web3.toHex(raw_tx) for raw_tx in raw_txs[per_batch:2 * per_batch]] \
+            or [call["id"] for call in calls] != list(range(per_batch, 2 * per_batch)):
+        print("<FAIL> prebuilt bodies differ")
+        exit(1)
+
+
+def stand_in_node(port):
+    """ Answers every eth_sendRawTransaction with a hash, over HTTP POST and WebSocket on the same port """
+    from aiohttp import web, WSMsgType
+
+    def answer(request):
+        return {"jsonrpc": "2.0", "id": request["id"], "result": "0x" + "00" * 32}
+
+    def answers(body):
+        request = json.loads(body)
+        return json.dumps([answer(call) for call in request] if isinstance(request, list) else answer(request))
+
+    async def handle(request):
+        if request.headers.get("Upgrade", "").lower() == "websocket":
+            ws = web.WebSocketResponse(max_msg_size=0)
+            await ws.prepare(request)
+            async for message in ws:
+                if message.type == WSMsgType.TEXT:
+                    await ws.send_str(answers(message.data))
+            return ws
+        return web.Response(text=answers(await request.text()), content_type="application/json")
+
+    app = web.Application()
+    app.router.add_route("*", "/", handle)
+    web.run_app(app, host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+def bench_transport(count=20000, in_flight=64):
+    """
+    Requests per second and client CPU per request of sending prebuilt eth_sendRawTransaction
+    bodies over keep-alive HTTP connections vs multiplexed WebSockets (WS_CONNECTIONS),
+    with `in_flight` requests in flight, to a stand-in node on localhost
+    """
+    import socket
+    import asyncio
+    import multiprocessing
+    import aiohttp
+    from rpc_bodies import RequestBodies
+    from ws_transport import WebSocketPool
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = multiprocessing.Process(target=stand_in_node, args=(port,), daemon=True)
+    server.start()
+    url = "http://127.0.0.1:%d/" % port
+    bodies = RequestBodies.from_raw_txs([os.urandom(110) for _ in range(count)])
+
+    async def http_request(session, position):
+        async with session.post(url, data=bodies.call(position),
+                                headers={'Content-type': 'application/json'}) as response:
+            return await response.json(content_type=None)
+
+    async def run(send, session):
+        async def worker(first):
+            for position in range(first, count, in_flight):
+                if "result" not in await send(session, position):
+                    raise ValueError("request %d failed" % position)
+        start, cpu = time.perf_counter(), time.process_time()
+        await asyncio.gather(*[worker(first) for first in range(in_flight)])
+        return time.perf_counter() - start, time.process_time() - cpu
+
+    async def compare():
+        for _ in range(50):
+            try:
+                async with aiohttp.ClientSession() as session:
+                    await http_request(session, 0)
+                break
+            except aiohttp.ClientConnectionError:
+                await asyncio.sleep(0.1)
+        websockets = WebSocketPool(url.replace("http", "ws", 1))
+        connector = aiohttp.TCPConnector(limit=in_flight, keepalive_timeout=60)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            results = [("HTTP keep-alive", await run(http_request, session))]
+            results.append(("WebSocket x%d" % websockets.size, await run(
+                lambda session, position: websockets.request(session, bodies.call(position), position), session)))
+            await websockets.close()
+        return results
+
+    try:
+        for label, (elapsed, cpu) in asyncio.run(compare()):
+            print("%-28s %7d in %6.2f s = %9.1f req/s (%7.1f us client CPU per request)" %
+                  (label, count, elapsed, count / elapsed, cpu / count * 1e6))
+    finally:
+        server.terminate()
+
+
+def nonce_signer(nonce, count, size, out=None):
+    """ Allocates `count` nonces, `size` at a time (one by one with increment() for size 1) """
+    nonces = []
+    while len(nonces) < count:
+        if size == 1:
+            nonces.append(nonce.increment())
+        else:
+            nonces.extend(nonce.reserve(min(size, count - len(nonces))))
+    if out is None:
+        return nonces
+    out.put(nonces)
+
+
+def bench_nonce(count=200000, size=200):
+    """
+    Nonces per second handed out to 1, 8 and 64 concurrent signers: AtomicNonce.increment()
+    per nonce vs reserve() of `size` nonce ranges, in threads, and SharedAtomicNonce in processes
+    (their start included). Every run checks the nonces are unique and contiguous.
+    """
+    import multiprocessing
+    from concurrent.futures import ThreadPoolExecutor
+    from atomic_nonce import AtomicNonce
+
+    def threads(nonce, signers, size):
+        with ThreadPoolExecutor(signers) as executor:
+            futures = [executor.submit(nonce_signer, nonce, count // signers, size) for _ in range(signers)]
+            return [n for future in futures for n in future.result()]
+
+    def processes(nonce, signers, size):
+        out = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=nonce_signer, args=(nonce, count // signers, size, out))
+                   for _ in range(signers)]
+        for worker in workers:
+            worker.start()
+        nonces = [n for _ in workers for n in out.get()]
+        for worker in workers:
+            worker.join()
+        return nonces
+
+    for signers in (1, 8, 64):
+        print("\n> %d signers" % signers)
+        for label, run, shared, per in (("threads, increment()", threads, False, 1),
+                                        ("threads, reserve(%d)" % size, threads, False, size),
+                                        ("processes, reserve(%d)" % size, processes, True, size)):
+            nonce = AtomicNonce(None, CONTRACT_ADDRESS, -1)
+            nonce = nonce.shared() if shared else nonce
+            _, nonces = timed(label, count // signers * signers, lambda n: run(nonce, signers, per), batch=True)
+            if sorted(nonces) != list(range(len(nonces))):
+                print("<FAIL> %s: nonces not unique and contiguous" % label)
+                exit(1)
+
+
+def bench_rawtx(count=1000000, per_job=200):
+    """
+    Bytes per transaction an account holds after signing, as the signer jobs return them
+    `per_job` at a time: the request bodies plus SignedTransaction tuples or a list of raw
+    bytes (as before), the request bodies alone (send), the request bodies plus a RawTxStore
+    (corpus build). Then the time to consume them in order: list.pop(0) vs a position in the bodies.
+    """
+    import tracemalloc
+    from hexbytes import HexBytes
+    from eth_account.datastructures import SignedTransaction
+    from raw_tx_store import RawTxStore, pack_raw_txs
+    from rpc_bodies import RequestBodies, encode_calls
+
+    raw_txs = [os.urandom(110) for _ in range(per_job)]
+    packed, calls = pack_raw_txs(raw_txs), encode_calls(raw_txs)
+
+    def bodies(count):
+        bodies = RequestBodies()
+        for _ in range(count // per_job):
+            bodies.extend(*calls)
+        return bodies
+
+    def signed_transactions(count):
+        return bodies(count), [SignedTransaction(HexBytes(raw_tx), HexBytes(raw_tx[:32]),
+                                                 int.from_bytes(raw_tx[:32], "big"),
+                                                 int.from_bytes(raw_tx[32:64], "big"), 2 * CHAIN_ID + 35)
+                               for _ in range(count // per_job) for raw_tx in raw_txs]
+
+    def raw_bytes(count):
+        return bodies(count), [bytes(raw_tx) for _ in range(count // per_job) for raw_tx in RawTxStore(packed)]
+
+    def store(count):
+        store = RawTxStore()
+        for _ in range(count // per_job):
+            store.extend_packed(packed)
+        return bodies(count), store
+
+    count = count // per_job * per_job
+    print("%d transactions of %d bytes\n" % (count, len(raw_txs[0])))
+    stored = {}
+    for label, build in (("bodies + SignedTransactions", signed_transactions), ("bodies + raw bytes list", raw_bytes),
+                         ("bodies (send)", bodies), ("bodies + RawTxStore (corpus)", store)):
+        start = time.perf_counter()
+        build(count)
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        stored[label] = build(count)
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("%-28s %7d in %6.2f s | %5.1f bytes per transaction" % (label, count, elapsed, size / count))
+
+    if list(stored["bodies + RawTxStore (corpus)"][1]) != stored["bodies + raw bytes list"][1]:
+        print("<FAIL> stored transactions differ")
+        exit(1)
+
+    print()
+    popped = min(count, 100000)
+    signed_txs = stored["bodies + raw bytes list"][1][:popped]
+    timed("list.pop(0), first %d" % popped, popped, lambda i: signed_txs.pop(0))
+    timed("RequestBodies.call(position)", count, stored["bodies (send)"].call)
+
+
+BENCHMARKS = {
+    "template": bench_template,
+    "crypto": bench_crypto,
+    "derive": bench_derive,
+    "memory": bench_memory,
+    "bodies": bench_bodies,
+    "transport": bench_transport,
+    "nonce": bench_nonce,
+    "rawtx": bench_rawtx,
+}
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print("Needs parameters:")
+        print("%s benchmark [count]" % sys.argv[0])
+        print("benchmarks: %s" % ", ".join(BENCHMARKS))
+        exit()
+    BENCHMARKS[sys.argv[1]](*[int(arg) for arg in sys.argv[2:]])
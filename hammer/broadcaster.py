@@ -0,0 +1,638 @@
+#!/usr/bin/env python3
+"""
+@summary: asyncio engine of send.broadcast_transactions, see BROADCAST_ENGINE
+
+All accounts are served by one event loop over a pool of keep-alive HTTP
+connections, instead of one OS thread per account. Each account sends its
+signed transactions in nonce order, with at most ASYNC_INFLIGHT_PER_ACCOUNT
+requests in flight. ASYNC_INFLIGHT_TOTAL bounds the requests in flight
+over all accounts, and the size of the connection pool. Each account is
+pinned to a node of RPC_NODE_SEND, see endpoints.py. With BATCH_TX, the
+batches of an account are sent one after the other, each sized from the
+answer to the previous one, see batcher.py. With TXPOOL_BACKPRESSURE, no
+request leaves while the transaction pool of its node is too deep, see txpool.py.
+With RPC_TRANSPORT = "websocket", requests go over a few long-lived WebSockets
+per node instead of the HTTP connections, see ws_transport.py.
+
+After sending, with NONCE_REPAIR, every account looks for nonce gaps and
+sends their transactions again, see nonce_gaps.py.
+
+Every hash a node returns is checked against the local one, keccak of the
+raw transaction (see rpc_bodies.py). With FIRE_AND_FORGET, accounts do not
+wait for answers at all: the hashes are the local ones, answers are only
+parsed in the background, for errors and mismatches.
+
+`broadcast_at_rate()` is the open-loop mode (`send.py N rate tps`): requests
+leave on a fixed schedule, whether or not the node has answered the previous ones.
+"""
+import sys
+import time
+import asyncio
+from itertools import zip_longest, count as counter
+
+import aiohttp
+
+from transport import record_latency
+from endpoints import EndpointPool, NoEndpointError
+from batcher import account_batch, batch_outcome, error_message, KNOWN_TX
+from nonce_gaps import GapRepair, unacknowledged, gap_positions, nonce_gaps
+from config import BATCH_TX, TX_PER_BATCH, ASYNC_INFLIGHT_PER_ACCOUNT, ASYNC_INFLIGHT_TOTAL, FIRE_AND_FORGET
+from config import BATCH_RETRY_DELAY, BATCH_RETRIES, TXPOOL_BACKPRESSURE
+from config import NONCE_REPAIR, NONCE_REPAIR_DELAY
+from config import FILE_SEND_SCHEDULE
+
+HEADERS = {'Content-type': 'application/json'}
+
+
+class DeadEndpointError(Exception):
+    """ A request was not sent, its endpoint is already known to be dead """
+    pass
+
+
+# an endpoint raising these is considered dead
+CONNECTION_ERRORS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError, DeadEndpointError)
+
+_endpoints = None
+
+
+def collect_hashes(response, hashes, errors):
+    """ Appends the transaction hashes of a JSON-RPC response, or its errors """
+    for result in response if isinstance(response, list) else [response]:
+        if "result" in result:
+            hashes.append(result["result"])
+        else:
+            errors.append(result.get("error"))
+
+
+def check_hash(endpoint, bodies, position, tx_hash):
+    """ Counts a hash returned by the node that is not the local one """
+    if tx_hash != bodies.tx_hash(position):
+        endpoint.hash_mismatches += 1
+
+
+def collect_results(response, position, hashes, errors, endpoint, bodies):
+    """
+    Transaction hash of a response to the request of the transaction at `position`,
+    on hashes[position]. A resent transaction already known keeps its hash.
+    """
+    for result in response if isinstance(response, list) else [response]:
+        if "result" in result:
+            hashes[position] = result["result"]
+            endpoint.txs += 1
+            check_hash(endpoint, bodies, position, result["result"])
+        elif position not in hashes:
+            errors.append(result.get("error"))
+            endpoint.errors += 1
+
+
+def endpoint_pool():
+    """ The EndpointPool of RPC_NODE_SEND, created on first use """
+    global _endpoints
+    if _endpoints is None:
+        _endpoints = EndpointPool()
+    return _endpoints
+
+
+def endpoint_stats():
+    """ Counters of every endpoint, empty when nothing was sent through them """
+    return endpoint_pool().stats() if _endpoints is not None else []
+
+
+def assign_endpoints(accounts):
+    """ Pins the accounts without an endpoint to one """
+    unassigned = {index: account for index, account in accounts.items() if "endpoint" not in account}
+    if unassigned:
+        endpoint_pool().assign(unassigned)
+
+
+async def send_request(session, endpoint, body, key):
+    """
+    Sends a request body to an endpoint, over HTTP or its WebSockets, and returns the answer.
+    `key` is the id of the request, the smallest one of a batch.
+    """
+    if endpoint.websockets is not None:
+        return await endpoint.websockets.request(session, body, key)
+    async with session.post(endpoint.url, data=body, headers=HEADERS) as response:
+        return await response.json(content_type=None)
+
+
+async def post(session, endpoint, body, key, total_limit, account_limit):
+    async with account_limit:
+        # the gate is checked right before sending: a paused account waits holding
+        # its own slot, not a global one that the accounts of other endpoints need
+        if endpoint.txpool is not None:
+            await endpoint.txpool.wait_async()
+        async with total_limit:
+            if not endpoint.alive:
+                raise DeadEndpointError(endpoint.url)
+            start = time.monotonic()
+            try:
+                result = await send_request(session, endpoint, body, key)
+            except CONNECTION_ERRORS:
+                # the requests of the account queued behind this one are not sent
+                endpoint.mark_dead()
+                raise
+            answered = time.monotonic()
+            endpoint.record(start, answered)
+            record_latency(answered - start)
+            return result
+
+
+def resync(account, nonce, bodies, offset):
+    """ Position in `bodies` of the transaction of `nonce`, bodies[0] is at position `offset` of the account """
+    return min(len(bodies), max(0, nonce - account["first_nonce"] - offset))
+
+
+async def account_worker(session, endpoints, account, total_limit, account_limit, bodies=None, offset=0):
+    """
+    Sends the signed transactions of an account to its endpoint. Requests are started
+    in nonce order, a request only waits for a slot of the account and a global slot.
+    When the endpoint stops answering, the account fails over and sends again
+    from the nonce the new endpoint expects.
+    `bodies` is account["bodies"], or a part of them from position `offset` on.
+    Returns the hashes and the errors of these transactions.
+    """
+    bodies = account["bodies"] if bodies is None else bodies
+    if FIRE_AND_FORGET:
+        hashes, errors = await fire_account(session, account, total_limit, bodies)
+    elif BATCH_TX:
+        hashes, errors = await account_batches(session, endpoints, account, total_limit, account_limit, bodies, offset)
+    else:
+        hashes, errors = await account_calls(session, endpoints, account, total_limit, account_limit, bodies, offset)
+    if NONCE_REPAIR:
+        await repair_gaps(session, endpoints, account, bodies, offset, hashes, total_limit, account_limit)
+    return [hashes[position] for position in sorted(hashes)], errors
+
+
+async def account_calls(session, endpoints, account, total_limit, account_limit, bodies, offset,
+                        workers=ASYNC_INFLIGHT_PER_ACCOUNT):
+    """
+    Sends the signed transactions of an account one per request, as account_worker(). `workers`
+    coroutines take the next position in turn: a request is only built once the previous one
+    of its coroutine is answered, not every request of the account up front.
+    Returns the hashes of these transactions by position, and the errors.
+    """
+    hashes, errors = {}, []
+    position = 0
+    while position < len(bodies):
+        endpoint = account["endpoint"]
+        positions = iter(range(position, len(bodies)))
+        failed = []
+
+        async def worker():
+            for p in positions:
+                if failed:
+                    return
+                try:
+                    response = await post(session, endpoint, bodies.call(p), bodies.first_id + p,
+                                          total_limit, account_limit)
+                except CONNECTION_ERRORS as e:
+                    # the positions left are not sent, the account fails over
+                    failed.append(e)
+                    endpoint.failures += not isinstance(e, DeadEndpointError)
+                    return
+                except Exception as e:
+                    errors.append(repr(e))
+                    endpoint.errors += 1
+                    continue
+                collect_results(response, p, hashes, errors, endpoint, bodies)
+
+        await asyncio.gather(*[worker() for _ in range(workers)])
+        if not failed:
+            break
+        nonce = await endpoints.failover(session, account, endpoint)
+        if nonce is not None:
+            position = resync(account, nonce, bodies, offset)
+    return hashes, errors
+
+
+async def account_batches(session, endpoints, account, total_limit, account_limit, bodies, offset):
+    """
+    Sends the signed transactions of an account in batches of adaptive size, one
+    batch at a time. The transactions a full pool rejected are sent again after
+    BATCH_RETRY_DELAY. Fails over like account_worker().
+    Returns the hashes of these transactions by position, and the errors.
+    """
+    hashes, errors = {}, []
+    position = rejected = 0
+    while position < len(bodies):
+        endpoint = account["endpoint"]
+        batch = account_batch(account, endpoint)
+        count = min(batch.size, len(bodies) - position)
+        start = time.monotonic()
+        try:
+            response = await post(session, endpoint, bodies.batch(position, position + count),
+                                  bodies.first_id + position, total_limit, account_limit)
+        except CONNECTION_ERRORS as e:
+            endpoint.failures += not isinstance(e, DeadEndpointError)
+            nonce = await endpoints.failover(session, account, endpoint)
+            if nonce is not None:
+                position = resync(account, nonce, bodies, offset)
+            continue
+        except Exception as e:
+            response = {"error": repr(e)}
+
+        consumed, batch_hashes, batch_errors, pool_full, failed = batch_outcome(response, count, bodies.first_id + position)
+        batch.observe(count, time.monotonic() - start, pool_full, failed)
+        for i, tx_hash in batch_hashes:
+            hashes[position + i] = tx_hash
+            check_hash(endpoint, bodies, position + i, tx_hash)
+        endpoint.txs += len(batch_hashes)
+        position += consumed
+
+        if not failed:
+            errors.extend(batch_errors)
+            endpoint.errors += len(batch_errors)
+        rejected = 0 if consumed else rejected + 1
+        if rejected > BATCH_RETRIES:
+            errors.append(batch_errors[0] if failed else "Gave up, the transaction pool stayed full")
+            endpoint.errors += 1
+            break
+        if pool_full or failed:
+            await asyncio.sleep(BATCH_RETRY_DELAY)
+    return hashes, errors
+
+
+async def fire(session, endpoint, bodies, position, count, rejected, errors):
+    """ Sends a request of fire_account(), then checks its answer """
+    body = bodies.batch(position, position + count) if BATCH_TX else bodies.call(position)
+    start = time.monotonic()
+    try:
+        response = await send_request(session, endpoint, body, bodies.first_id + position)
+    except Exception as e:
+        endpoint.failures += 1
+        errors.append(repr(e))
+        rejected.update(range(position, position + count))
+        return
+    answered = time.monotonic()
+    endpoint.record(start, answered)
+    record_latency(answered - start)
+
+    if BATCH_TX and not isinstance(response, list):
+        endpoint.errors += 1
+        errors.append(response.get("error", response))
+        rejected.update(range(position, position + count))
+        return
+    for result in response if isinstance(response, list) else [response]:
+        p = result["id"] - bodies.first_id if BATCH_TX and isinstance(result.get("id"), int) else position
+        if "result" in result:
+            endpoint.txs += 1
+            check_hash(endpoint, bodies, p, result["result"])
+        else:
+            endpoint.errors += 1
+            errors.append(result.get("error"))
+            rejected.add(p)
+
+
+async def fire_account(session, account, total_limit, bodies):
+    """
+    Fire and forget: sends the transactions of an account in nonce order without waiting
+    for the answers, only for one of the ASYNC_INFLIGHT_TOTAL slots. Batches are TX_PER_BATCH
+    transactions. No retry, no failover: a rejected transaction is only counted, and left
+    to the nonce gap repair.
+    Returns the local hashes of the transactions not rejected, by position, and the errors.
+    """
+    endpoint = account["endpoint"]
+    size = TX_PER_BATCH if BATCH_TX else 1
+    rejected, errors, requests = set(), [], set()
+    for position in range(0, len(bodies), size):
+        if endpoint.txpool is not None:
+            await endpoint.txpool.wait_async()
+        await total_limit.acquire()
+        request = asyncio.ensure_future(fire(session, endpoint, bodies, position, min(size, len(bodies) - position),
+                                             rejected, errors))
+        request.add_done_callback(lambda _: total_limit.release())
+        request.add_done_callback(requests.discard)
+        requests.add(request)
+    await asyncio.gather(*requests)
+    return {p: bodies.tx_hash(p) for p in range(len(bodies)) if p not in rejected}, errors
+
+
+async def find_gap(session, endpoints, account, bodies, offset, hashes):
+    """ Positions of a nonce gap of the account in `bodies`, see nonce_gaps.gap_positions() """
+    pending = None
+    if not unacknowledged(hashes, len(bodies)):
+        try:
+            pending = await endpoints.pending_nonce(session, account["endpoint"], account["address"])
+        except Exception:
+            pass
+    return gap_positions(hashes, len(bodies), account["first_nonce"] + offset, pending)
+
+
+async def repair_gaps(session, endpoints, account, bodies, offset, hashes, total_limit, account_limit):
+    """
+    Sends again, one by one in nonce order, the transactions of the nonce gaps of an account, see
+    nonce_gaps.py. `hashes` are the hashes of the acknowledged positions, it gets the repaired ones.
+    """
+    repair = GapRepair()
+    while repair.check(*await find_gap(session, endpoints, account, bodies, offset, hashes)):
+        for position in repair.positions:
+            endpoint = account["endpoint"]
+            try:
+                response = await post(session, endpoint, bodies.call(position), bodies.first_id + position,
+                                      total_limit, account_limit)
+            except CONNECTION_ERRORS:
+                try:
+                    await endpoints.failover(session, account, endpoint)
+                except NoEndpointError:
+                    repair.abort()
+                    return
+                # the next round finds the gap on the new endpoint
+                break
+            except Exception:
+                break
+            if "result" in response:
+                hashes[position] = response["result"]
+                check_hash(endpoint, bodies, position, response["result"])
+            elif KNOWN_TX.search(error_message(response.get("error"))):
+                hashes[position] = bodies.tx_hash(position)
+        await asyncio.sleep(NONCE_REPAIR_DELAY)
+
+
+def client_session(total):
+    """ aiohttp session with `total` keep-alive connections """
+    connector = aiohttp.TCPConnector(limit=total, keepalive_timeout=60)
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120))
+
+
+async def broadcast(accounts, endpoints, per_account, total):
+    total_limit = asyncio.Semaphore(total)
+    async with client_session(total) as session:
+        workers = [account_worker(session, endpoints, account, total_limit, asyncio.Semaphore(per_account))
+                   for account in accounts.values()]
+        try:
+            return await asyncio.gather(*workers)
+        finally:
+            await endpoints.close_websockets()
+
+
+def broadcast_async(accounts, per_account=ASYNC_INFLIGHT_PER_ACCOUNT, total=ASYNC_INFLIGHT_TOTAL):
+    """
+    Broadcasts the request bodies (account["bodies"]) of every account, to the endpoint it is pinned to.
+    Returns the transaction hashes, interleaved account by account
+    so that the first and the last ones are the first and the last sent.
+    """
+    assign_endpoints(accounts)
+    if TXPOOL_BACKPRESSURE:
+        endpoint_pool().watch_txpools([account["address"] for account in accounts.values()])
+    try:
+        results = asyncio.run(broadcast(accounts, endpoint_pool(), per_account, total))
+    finally:
+        endpoint_pool().stop_watching_txpools()
+
+    errors = [error for _, account_errors in results for error in account_errors]
+    if errors:
+        print("<FAIL> %d requests failed, first error: %s" % (len(errors), errors[0]))
+        sys.stdout.flush()
+
+    return [tx_hash for hashes in zip_longest(*[hashes for hashes, _ in results])
+            for tx_hash in hashes if tx_hash is not None]
+
+
+def intended_offsets(rate, segments=None):
+    """
+    Seconds after the start at which the transactions of the open-loop mode are due:
+    k / rate, or with `segments`, [(rate, seconds), ...], each rate for its seconds in turn,
+    then the last one until the transactions run out
+    """
+    start = 0.0
+    for rate, seconds in segments or []:
+        for k in range(round(rate * seconds)):
+            yield start + k / rate
+        start += seconds
+    yield from (start + k / rate for k in counter())
+
+
+def rate_schedule(accounts):
+    """
+    Order in which the open-loop mode sends: one transaction of every
+    account in turn, so the load is spread and each account keeps its nonce order.
+    Yields (account index, position of the transaction).
+    """
+    queues = [(index, len(account["bodies"])) for index, account in accounts.items()]
+    for position in range(max(count for _, count in queues)):
+        for index, count in queues:
+            if position < count:
+                yield index, position
+
+
+async def resend(session, endpoint, bodies, positions, records):
+    """
+    Sends the transactions at `positions` of the bodies again, one after the other. A request
+    that fails puts its error in the record of the transaction. Connection errors are raised.
+    """
+    for position in positions:
+        start = time.monotonic()
+        try:
+            result = await send_request(session, endpoint, bodies.call(position), bodies.first_id + position)
+        except CONNECTION_ERRORS:
+            raise
+        except Exception as e:
+            result = records[position][3] = {"error": repr(e)}
+        endpoint.record(start, time.monotonic())
+        if "result" in result:
+            endpoint.txs += 1
+        else:
+            endpoint.errors += 1
+
+
+async def recover(session, endpoints, account, failed, position, records):
+    """
+    Fails the account over from the `failed` endpoint, and sends again the transactions before
+    `position` that the dead endpoints accepted past the nonce the new endpoint expects. Fails
+    over again while the new endpoint does not answer either. Raises NoEndpointError.
+    """
+    dead = [failed]
+    while True:
+        nonce = await endpoints.failover(session, account, dead[-1])
+        if nonce is None:
+            return
+        lost = [p for p in range(max(0, nonce - account["first_nonce"]), position)
+                if records[p][4] in dead and "result" in (records[p][3] or {})]
+        try:
+            await resend(session, account["endpoint"], account["bodies"], lost, records)
+            return
+        except CONNECTION_ERRORS:
+            account["endpoint"].failures += 1
+            dead.append(account["endpoint"])
+
+
+async def timed_post(session, endpoints, account, position, records):
+    """
+    Sends one transaction, records[position] is [intended, sent, answered, response, endpoint].
+    When the endpoint stops answering, the account fails over and the transaction is sent again,
+    see recover().
+    """
+    loop = asyncio.get_event_loop()
+    record = records[position]
+    bodies = account["bodies"]
+    record[1] = loop.time()
+    while True:
+        endpoint = record[4] = account["endpoint"]
+        try:
+            record[3] = await send_request(session, endpoint, bodies.call(position), bodies.first_id + position)
+            endpoint.record(record[1], loop.time())
+            if "result" in record[3]:
+                endpoint.txs += 1
+                check_hash(endpoint, bodies, position, record[3]["result"])
+            else:
+                endpoint.errors += 1
+            break
+        except CONNECTION_ERRORS:
+            endpoint.failures += 1
+            try:
+                await recover(session, endpoints, account, endpoint, position, records)
+            except NoEndpointError as e:
+                record[3] = {"error": str(e)}
+                break
+        except Exception as e:
+            record[3] = {"error": repr(e)}
+            endpoint.errors += 1
+            break
+    record[2] = loop.time()
+    record_latency(record[2] - record[1])
+
+
+async def repair_rate_gaps(session, endpoints, accounts, records, total):
+    """
+    Nonce gap repair of every account after an open-loop run, see repair_gaps(). The
+    answer of a transaction sent again replaces the error in its record.
+    """
+    total_limit = asyncio.Semaphore(total)
+
+    async def repair(index, account):
+        bodies = account["bodies"]
+        hashes = {position: record[3]["result"] for position, record in enumerate(records[index])
+                  if "result" in (record[3] or {})}
+        await repair_gaps(session, endpoints, account, bodies, 0, hashes, total_limit,
+                          asyncio.Semaphore(ASYNC_INFLIGHT_PER_ACCOUNT))
+        for position, record in enumerate(records[index]):
+            if position in hashes and "result" not in (record[3] or {}):
+                record[3] = {"result": hashes[position]}
+
+    await asyncio.gather(*[repair(index, account) for index, account in accounts.items()])
+
+
+async def send_at_rate(accounts, endpoints, rate, total, segments=None):
+    """
+    Token bucket of `rate` tokens per second: transaction k is due at start + k / rate
+    (see intended_offsets() for `segments`), whatever the node answers. Each wake-up
+    sends every transaction that is due. With NONCE_REPAIR, the nonce gaps are repaired
+    once every transaction was sent.
+    Returns the start time and the records of every account.
+    """
+    loop = asyncio.get_event_loop()
+    records = {index: [] for index in accounts}
+    requests = []
+    async with client_session(total) as session:
+        start = loop.time()
+        for (index, position), offset in zip(rate_schedule(accounts), intended_offsets(rate, segments)):
+            intended = start + offset
+            # sleep(0) when late still lets the requests already due go out
+            await asyncio.sleep(max(0, intended - loop.time()))
+            records[index].append([intended, None, None, None, None])
+            requests.append(asyncio.ensure_future(
+                timed_post(session, endpoints, accounts[index], position, records[index])))
+        await asyncio.gather(*requests)
+        if NONCE_REPAIR:
+            await repair_rate_gaps(session, endpoints, accounts, records, total)
+        await endpoints.close_websockets()
+    return start, records
+
+
+def latency_stats(latencies):
+    if not latencies:
+        return {"avg": 0.0, "p50": 0.0, "p99": 0.0, "max": 0.0}
+    latencies = sorted(latencies)
+    return {
+        "avg": sum(latencies) / len(latencies),
+        "p50": latencies[int(len(latencies) * 0.50)],
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "max": latencies[-1]
+    }
+
+
+def run_at_rate(accounts, rate, total=ASYNC_INFLIGHT_TOTAL, segments=None):
+    """
+    Sends the request bodies (account["bodies"]) of every account at `rate` transactions per second,
+    or at the rates of `segments` (see intended_offsets()), each account to the endpoint it is pinned to.
+    Returns the start of the schedule, which the intended times count from, and one record
+    [intended, sent, answered, response] per transaction, in sending order. Times are epoch seconds.
+    """
+    assign_endpoints(accounts)
+    # the event loop clock is time.monotonic()
+    epoch_offset = time.time() - time.monotonic()
+    start, records = asyncio.run(send_at_rate(accounts, endpoint_pool(), rate, total, segments))
+    records = sorted((record[:4] for account_records in records.values() for record in account_records),
+                     key=lambda record: record[0])
+    for record in records:
+        record[0] += epoch_offset
+        record[1] += epoch_offset
+        record[2] += epoch_offset
+    return start + epoch_offset, records
+
+
+def rate_stats(rate, records):
+    """ Sending rate, schedule lag and RPC latency of the records of `run_at_rate()`, zero without records """
+    duration = max(record[1] for record in records) - records[0][0] if records else 0.0
+    return {
+        "offered_tps": rate,
+        "sent_tps": len(records) / max(duration, 1e-9),
+        "requests": len(records),
+        "duration": duration,
+        "schedule_lag": latency_stats([record[1] - record[0] for record in records]),
+        "latency_from_sent": latency_stats([record[2] - record[1] for record in records]),
+        "latency_from_intended": latency_stats([record[2] - record[0] for record in records])
+    }
+
+
+def print_rate_stats(stats):
+    line = "> Offered %.1f tx/s, sent %d requests in %.2f s = %.1f tx/s | schedule lag p99 %.1f ms, max %.1f ms"
+    print(line % (stats["offered_tps"], stats["requests"], stats["duration"], stats["sent_tps"],
+                  1000 * stats["schedule_lag"]["p99"], 1000 * stats["schedule_lag"]["max"]))
+    for label, key in (("from sent", "latency_from_sent"), ("from intended", "latency_from_intended")):
+        print("> RPC latency %-14s avg %.1f ms, p50 %.1f ms, p99 %.1f ms, max %.1f ms" %
+              (label, *[1000 * stats[key][p] for p in ("avg", "p50", "p99", "max")]))
+
+
+def record_hashes(records):
+    """ Transaction hashes of the records, and the errors of the failed requests """
+    hashes, errors = [], []
+    for record in records:
+        collect_hashes(record[3], hashes, errors)
+    return hashes, errors
+
+
+def write_schedule(records, file=FILE_SEND_SCHEDULE):
+    """ tx hash, intended, sent and answered epoch times of every request """
+    with open(file, "w") as f:
+        f.write("tx_hash,intended,sent,answered\n")
+        for intended, sent, answered, response in records:
+            f.write("%s,%.6f,%.6f,%.6f\n" % (response.get("result", ""), intended, sent, answered))
+
+
+def broadcast_at_rate(accounts, rate, total=ASYNC_INFLIGHT_TOTAL):
+    """
+    Open-loop broadcast of the request bodies (account["bodies"]) of every account at `rate`
+    transactions per second, one transaction per request.
+
+    The intended send time of every transaction is recorded. Latency from the
+    intended time includes the time a request waited behind a slow node (or a
+    busy client), which a closed loop hides: coordinated omission. There is no
+    backpressure, the schedule does not wait for the transaction pool. Nonce gaps are
+    repaired once the schedule is over.
+    Returns the transaction hashes, in sending order.
+    """
+    _, records = run_at_rate(accounts, rate, total)
+    print_rate_stats(rate_stats(rate, records))
+    endpoint_pool().print_stats()
+    nonce_gaps().print_stats()
+
+    write_schedule(records)
+    print("> Intended and actual send times written on %s" % FILE_SEND_SCHEDULE)
+
+    hashes, errors = record_hashes(records)
+    if errors:
+        print("<FAIL> %d requests failed, first error: %s" % (len(errors), errors[0]))
+    sys.stdout.flush()
+    return hashes
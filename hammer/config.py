@@ -6,15 +6,50 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
-# The node that send the transactions (send.py)
-RPC_NODE_SEND = os.getenv("RPC_NODE_SEND")
+# The nodes that send the transactions (send.py), comma separated. Accounts are spread over them
+RPC_NODES_SEND = [url.strip() for url in (os.getenv("RPC_NODE_SEND") or "").split(",") if url.strip()]
+# The first one also deploys, funds the accounts and checks the receipts
+RPC_NODE_SEND = RPC_NODES_SEND[0] if RPC_NODES_SEND else None
+NODE_ASSIGNMENT = "round-robin"  # How accounts are pinned to RPC_NODES_SEND: "round-robin" or "least-latency"
 # The node that watch the transactions (measure_tps.py)
 RPC_NODE_WATCH = os.getenv("RPC_NODE_WATCH")
 
+# How transactions are sent and blocks watched: "http", or "websocket" (see ws_transport.py)
+RPC_TRANSPORT = os.getenv("RPC_TRANSPORT") or "http"
+# WebSocket addresses of RPC_NODE_SEND, in the same order, and of RPC_NODE_WATCH.
+# When not set, they are the http ones with ws:// and port 8546 for 8545
+RPC_NODES_SEND_WS = [url.strip() for url in (os.getenv("RPC_NODE_SEND_WS") or "").split(",") if url.strip()]
+RPC_NODE_WATCH_WS = os.getenv("RPC_NODE_WATCH_WS")
+WS_CONNECTIONS = 4  # WebSockets per node, each with many requests in flight. Besu limits frames to 1 MB by default
+
 MNEMONIC = os.getenv("MNEMONIC")
+HD_PATH = "m/44'/60'/0'/0"  # Accounts are HD_PATH/index of the MNEMONIC
+
+# Derived accounts are cached on disk, see account_cache.py
+ACCOUNT_CACHE = True
+DIR_ACCOUNT_CACHE = "account-cache"
+# Encrypts the private keys in the cache
+ACCOUNT_CACHE_PASSWORD = os.getenv("ACCOUNT_CACHE_PASSWORD") or None
+DERIVE_PROCESSES = None  # Number of processes deriving accounts. None uses all CPU cores
 
 TIMEOUT_DEPLOY = 300
 
+# Shared keep-alive HTTP connections to the nodes, see transport.py
+HTTP_POOL_SIZE = 256  # Connections kept open per node. More concurrent requests wait for a free one
+HTTP_TIMEOUT = 120  # Seconds
+
+# Nonces and balances of the accounts are read in concurrent JSON-RPC batches, see account_state.py
+STATE_BATCH = 200  # Accounts per batch, 3 calls each
+STATE_THREADS = 8  # Batches in flight
+
+# Funding of the accounts (send.py), from account 0 through a tree of accounts, see funding.py
+FUNDING_AMOUNT = 5  # Ether sent to every account ...
+FUNDING_MIN_BALANCE = 1  # ... that has less than this ether
+FUNDING_FANOUT = 16  # Accounts funded by each account of the tree. Levels are log(accounts) / log(FUNDING_FANOUT)
+FUNDING_GAS = 21000  # Gas of a transfer
+FUNDING_BATCH = 500  # Calls per JSON-RPC batch: balances, transfers and receipts
+FUNDING_TIMEOUT = 300  # Seconds a level waits for its transfers to be included
+
 GAS = 100000  # Estimate gas to change the contract Storage
 GAS_DEPLOY = 200000  # Estimate gas to deploy the contract Storage
 GAS_PRICE = 20000000000
@@ -22,7 +57,41 @@ GAS_PRICE = 20000000000
 CHAIN_ID = 2018  # Network or chain id
 
 BATCH_TX = False  # Should transactions sent in batchs?
-TX_PER_BATCH = 400  # Number of transactions per batch. Should not pass the node TX pool
+TX_PER_BATCH = 400  # Initial number of transactions per batch, then adapted per account and node, see batcher.py
+BATCH_MIN = 10  # Smallest batch. BATCH_MIN = BATCH_MAX = TX_PER_BATCH sends fixed size batches
+BATCH_MAX = 2000  # Largest batch. Should not pass the node TX pool
+BATCH_TARGET_LATENCY = 1.0  # Seconds. A batch answered later shrinks the next one ...
+BATCH_DECREASE = 0.5  # ... by this factor, as does a pool-full rejection or a failed batch
+BATCH_INCREASE = 20  # A full batch answered in time grows the next one by these transactions
+BATCH_RETRY_DELAY = 0.5  # Seconds before sending again the transactions rejected by a full pool
+BATCH_RETRIES = 20  # An account gives up after this many batches in a row that sent nothing
+
+# How send.py broadcasts: "asyncio" (one event loop, see broadcaster.py) or "threads" (SEND_WORKERS threads)
+BROADCAST_ENGINE = os.getenv("BROADCAST_ENGINE") or "asyncio"
+SEND_WORKERS = None  # Threads taking turns over the accounts, "threads" engine. None uses 8 per CPU core
+ASYNC_INFLIGHT_PER_ACCOUNT = 1  # Requests in flight per account. 1 keeps the nonces arriving in order
+ASYNC_INFLIGHT_TOTAL = 200  # Requests in flight over all accounts, and HTTP keep-alive connections
+# Fire and forget (asyncio engine): accounts send without waiting for answers, hashes are computed locally
+FIRE_AND_FORGET = (os.getenv("FIRE_AND_FORGET") or "").lower() in ("1", "true", "yes")
+
+# Backpressure: closed-loop senders wait while the transaction pool of their node is too deep, see txpool.py
+TXPOOL_BACKPRESSURE = True
+TXPOOL_HIGH_WATER = 3000  # Transactions in the pool that pause sending. The Besu pool holds 4096 by default
+TXPOOL_LOW_WATER = 2000  # Transactions in the pool that resume sending
+TXPOOL_POLL_INTERVAL = 0.5  # Seconds
+
+# After sending (every chunk when streaming), accounts look for nonce gaps and fill them, see nonce_gaps.py
+NONCE_REPAIR = True
+NONCE_REPAIR_ROUNDS = 5  # Checks and resends per account before a gap is reported as not repaired
+NONCE_REPAIR_WINDOW = 100  # Transactions sent again per round, from the nonce the node expects
+NONCE_REPAIR_DELAY = 1.0  # Seconds between rounds
+
+# Streaming mode (send.py N stream): signing and broadcasting at the same time, see pipeline.py
+STREAM_QUEUE_DEPTH = 2000  # Signed transactions waiting to be sent, per account. Bounds the memory
+STREAM_CHUNK = 200  # Transactions signed per job, the queues hold STREAM_QUEUE_DEPTH / STREAM_CHUNK chunks
+
+CRYPTO_BACKEND = os.getenv("CRYPTO_BACKEND") or None  # EC math of crypto.py: coincurve or two1. None picks the fastest installed
+SIGN_PROCESSES = None  # Number of processes signing transactions. None uses all CPU cores
 
 # contract files:
 FILE_CONTRACT_SOURCE = "contract.sol"
@@ -30,6 +99,23 @@ FILE_CONTRACT_ABI = "contract-abi.json"
 FILE_CONTRACT_ADDRESS = "contract-address.json"
 FILE_CONTRACT_BIN = "contract-bin.json"
 
+# pre-signed transactions, see corpus.py
+FILE_CORPUS = "corpus.bin"
+
+# intended and actual send times of the open-loop mode (send.py N rate tps)
+FILE_SEND_SCHEDULE = "send-schedule.csv"
+
+# saturation search (saturate.py)
+FILE_SATURATION_REPORT = "saturation-report.json"
+SATURATION_STEP_SECONDS = 30  # Duration of a step of the step profile and of the binary search
+SATURATION_RAMP_SECONDS = 120  # Duration of the ramp profile
+SATURATION_RAMP_INTERVAL = 5  # The ramp raises the rate every few seconds
+SATURATION_KNEE_RATIO = 0.9  # A rate is sustained when at least this share of it is included ...
+SATURATION_BACKLOG_GROWTH = 0.1  # ... and the backlog grows by less than this share of the sent transactions
+SATURATION_SEARCH_STEPS = 5  # Binary search steps after the knee
+SATURATION_DRAIN_TIMEOUT = 60  # Seconds waiting for the backlog to be included, between steps
+SATURATION_LATENCY_SAMPLE = 20  # Transactions per step whose inclusion latency is measured
+
 # last experiment data
 FILE_LAST_EXPERIMENT = "last-experiment.json"
 
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+@summary: Pre-signed transaction corpus on disk, replayed through a memory map.
+
+    hammer/corpus.py build transactions_count [accounts] [file]
+    hammer/corpus.py replay [file]
+
+File layout (big endian):
+    header    magic (8 bytes), chain id (uint32), number of accounts (uint32)
+    index     per account: address (20 bytes), first nonce (uint64),
+              number of transactions (uint32), offset (uint64), length (uint64),
+              id of the first call (uint64), offset of the bodies (uint64), length (uint64)
+    records   per account, nonce ordered: length (uint32) + raw transaction
+    bodies    per account, as RequestBodies.packed(): offsets of the calls (uint64),
+              transaction hashes (32 bytes each), eth_sendRawTransaction calls
+
+Replay slices the request bodies and hashes from the map: nothing is encoded
+or hashed again.
+
+The funding transfers (funding.py) are sent from the load accounts, and use
+their nonces. Build funds the accounts before recording their first nonces,
+and replay funds them again first: on a reset network, the same transfers take
+the same nonces; accounts still funded are skipped.
+"""
+import sys
+import mmap
+import time
+import struct
+
+# extend path for imports:
+if __name__ == '__main__' and __package__ is None:
+    from os import sys, path
+    sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import send
+from config import RPC_NODE_SEND, CHAIN_ID, FILE_CORPUS, SIGN_PROCESSES
+from deploy import init_contract
+from utils import init_web3, init_accounts
+from account_state import load_account_states
+from check_control import has_successful_transactions
+from transport import print_stats
+from signer import sign_transactions, print_worker_stats
+from rpc_bodies import RequestBodies
+
+MAGIC = b"HAMRCRP2"
+HEADER = struct.Struct(">8sII")
+INDEX_ENTRY = struct.Struct(">20sQIQQQQQ")
+
+
+class CorpusError(Exception):
+    pass
+
+
+def write_corpus(accounts, file=FILE_CORPUS, chain_id=CHAIN_ID):
+    """
+    Writes the raw transactions on account["signed_txs"] of every account (a RawTxStore,
+    see sign_transactions(keep_raw=True)), and their request bodies, account["bodies"]. The first nonce of an account is account["first_nonce"].
+    """
+    records = {index: account["signed_txs"].packed() for index, account in accounts.items()}
+    bodies = {index: account["bodies"].packed() for index, account in accounts.items()}
+
+    offset = HEADER.size + INDEX_ENTRY.size * len(accounts)
+    index_entries = []
+    for index, account in accounts.items():
+        address = bytes.fromhex(account["address"][2:])
+        bodies_offset = offset + len(records[index])
+        index_entries.append(INDEX_ENTRY.pack(address, account["first_nonce"], len(account["bodies"]),
+                                              offset, len(records[index]), account["bodies"].first_id,
+                                              bodies_offset, len(bodies[index])))
+        offset = bodies_offset + len(bodies[index])
+
+    with open(file, "wb") as f:
+        f.write(HEADER.pack(MAGIC, chain_id, len(accounts)))
+        f.write(b"".join(index_entries))
+        for index in accounts:
+            f.write(records[index])
+            f.write(bodies[index])
+    return offset
+
+
+def read_corpus(file=FILE_CORPUS):
+    """
+    Memory-maps the corpus. Returns the chain id and, per account index,
+    its address, first nonce and request bodies (read in place from the map, not encoded again).
+    """
+    with open(file, "rb") as f:
+        corpus = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, chain_id, num_accounts = HEADER.unpack_from(corpus, 0)
+    if magic != MAGIC:
+        raise CorpusError("%s is not a transaction corpus of this version" % file)
+
+    accounts = {}
+    view = memoryview(corpus)
+    for i in range(num_accounts):
+        address, first_nonce, count, _, _, first_id, offset, length = INDEX_ENTRY.unpack_from(
+            corpus, HEADER.size + i * INDEX_ENTRY.size)
+        try:
+            bodies = RequestBodies.from_packed(view[offset:offset + length], count, first_id)
+        except ValueError as e:
+            raise CorpusError("Account %d: %s" % (i, e))
+        accounts[i] = {
+            "address": "0x" + address.hex(),
+            "first_nonce": first_nonce,
+            "bodies": bodies
+        }
+    return chain_id, accounts
+
+
+def check_nonces(w3, accounts):
+    """
+    The corpus can only be replayed if every account is still at its recorded first nonce,
+    the pending nonce, as init_accounts() reads it for build. Returns the accounts whose nonce differs.
+    """
+    mismatches = []
+    addresses = [w3.toChecksumAddress(account["address"]) for account in accounts.values()]
+    states = load_account_states(addresses)
+    for (index, account), address, state in zip(accounts.items(), addresses, states):
+        nonce = state.pending_nonce
+        if nonce != account["first_nonce"]:
+            mismatches.append((index, address, account["first_nonce"], nonce))
+    return mismatches
+
+
+def fund(w3, accounts):
+    """ Funds the accounts of a corpus, which are the first accounts derived from MNEMONIC """
+    derived = init_accounts(w3, len(accounts))
+    for index, account in accounts.items():
+        if derived[index]["address"].lower() != account["address"].lower():
+            raise CorpusError("Account %d %s of the corpus is not derived from MNEMONIC" % (index, account["address"]))
+    send.init_account_balances(w3, derived)
+
+
+def build(w3, transactions_count, num_accounts, file=FILE_CORPUS):
+    accounts = init_accounts(w3, num_accounts)
+    # funding sends from the accounts: their first nonces are the ones after it
+    send.init_account_balances(w3, accounts)
+    for account in accounts.values():
+        account["first_nonce"] = account["nonce"].value + 1
+
+    line = "\n> %d accounts signing %d transactions each\n"
+    print(line % (len(accounts), transactions_count))
+    start = time.monotonic()
+    workers = sign_transactions(transactions_count, accounts, init_contract(w3), SIGN_PROCESSES, keep_raw=True)
+    print_worker_stats(workers)
+    size = write_corpus(accounts, file)
+    print("> Corpus of %d bytes written on %s in %.1f seconds" % (size, file, time.monotonic() - start))
+
+
+def replay(w3, file=FILE_CORPUS):
+    start = time.monotonic()
+    chain_id, accounts = read_corpus(file)
+    print("> Corpus %s loaded in %.3f seconds" % (file, time.monotonic() - start))
+    if chain_id != CHAIN_ID:
+        raise CorpusError("Corpus is signed for chain id %d, not %d" % (chain_id, CHAIN_ID))
+
+    fund(w3, accounts)
+    mismatches = check_nonces(w3, accounts)
+    if mismatches:
+        for index, address, recorded, nonce in mismatches:
+            print("<FAIL> Account %d %s starts at nonce %d, node says %d" % (index, address, recorded, nonce))
+        raise CorpusError("Network state does not match the corpus, reset it or build a new corpus")
+
+    transactions_count = max(len(account["bodies"]) for account in accounts.values())
+    send.init_experiment_data()
+    return send.broadcast_transactions(transactions_count, accounts)
+
+
+def check_argv():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("build", "replay") or (sys.argv[1] == "build" and len(sys.argv) < 3):
+        print("Needs parameters:")
+        print("%s build transactions_count [accounts] [file]" % sys.argv[0])
+        print("%s replay [file]" % sys.argv[0])
+        print("Both fund the accounts from account 0 first, see funding.py")
+        exit()
+
+
+if __name__ == '__main__':
+    check_argv()
+
+    w3 = init_web3(RPCaddress=RPC_NODE_SEND)
+    send.w3 = w3
+
+    if sys.argv[1] == "build":
+        num_accounts = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+        build(w3, int(sys.argv[2]), num_accounts, *sys.argv[4:5])
+    else:
+        txs = replay(w3, *sys.argv[2:3])
+        print("%d transaction hashes recorded" % len(txs))
+        sys.stdout.flush()
+
+        success = has_successful_transactions(w3, txs)
+        send.finish(txs, success)
+        print_stats()
+        sys.stdout.flush()
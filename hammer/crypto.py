@@ -8,10 +8,12 @@ wallets.
 https://github.com/michailbrynard/ethereum-bip44-python
 """
 import math
+import os
 # import base58
 import base64
 import hashlib
 import hmac
+from multiprocessing import Pool
 from mnemonic.mnemonic import Mnemonic
 import random
 from two1.bitcoin.crypto import base58
@@ -22,8 +24,13 @@ from two1.crypto.ecdsa_base import Point
 from two1.crypto.ecdsa import ECPointAffine
 from two1.crypto.ecdsa import secp256k1
 
+import ecmath
+
 bitcoin_curve = secp256k1()
 
+# Smallest range of child keys derived by a worker process
+DERIVE_CHUNK = 256
+
 from eth_utils import encode_hex
 
 from Crypto.Hash import keccak
@@ -46,6 +53,154 @@ def get_bytes(s):
     return b
 
 
+class Backend(object):
+    """ Base class of the EC backends.
+
+    A backend computes public key points and low-s, deterministic (RFC6979)
+    signatures. All backends must return identical results.
+    """
+    name = None
+
+    def public_key(self, k):
+        """ Returns the (x, y) public key point of private key k. """
+        raise NotImplementedError
+
+    def sign(self, message, k, do_hash=True):
+        """ Signs message with private key k. If do_hash, the message
+        is hashed with SHA-256 first.
+
+        Returns:
+            tuple(Point, int): the signature (r = pt.x, s = pt.y), with
+            a low s, and its recovery id.
+        """
+        raise NotImplementedError
+
+    def public_keys(self, ks):
+        """ The (x, y) public key points of many private keys. """
+        return [self.public_key(k) for k in ks]
+
+    def sign_many(self, messages, k, do_hash=True):
+        """ Signs many messages with private key k. """
+        return [self.sign(message, k, do_hash) for message in messages]
+
+
+class Two1Backend(Backend):
+    """ EC math of two1 (pure Python).
+    """
+    name = "two1"
+
+    def public_key(self, k):
+        p = bitcoin_curve.public_key(k)
+        return p.x, p.y
+
+    def sign(self, message, k, do_hash=True):
+        sig_pt, rec_id = bitcoin_curve.sign(message, k, do_hash)
+
+        # Take care of large s:
+        # Bitcoin deals with large s, by subtracting
+        # s from the curve order. See:
+        # https://bitcointalk.org/index.php?topic=285142.30;wap2
+        if sig_pt.y >= (bitcoin_curve.n // 2):
+            sig_pt = Point(sig_pt.x, bitcoin_curve.n - sig_pt.y)
+            rec_id ^= 0x1
+
+        return sig_pt, rec_id
+
+
+class PythonBackend(Backend):
+    """ Pure Python EC math of ecmath.py: a precomputed table of the base
+    point and batched modular inversions. The fallback when no native
+    library is installed.
+    """
+    name = "python"
+
+    def public_key(self, k):
+        return ecmath.base_mul(k)
+
+    def public_keys(self, ks):
+        return ecmath.base_mul_many(ks)
+
+    def sign(self, message, k, do_hash=True):
+        return self.sign_many([message], k, do_hash)[0]
+
+    def sign_many(self, messages, k, do_hash=True):
+        digests = [hashlib.sha256(m).digest() if do_hash else m for m in messages]
+        return [(Point(r, s), rec_id) for r, s, rec_id in ecmath.sign_many(digests, [k] * len(digests))]
+
+
+class CoincurveBackend(Backend):
+    """ EC math of libsecp256k1, through the coincurve bindings.
+    """
+    name = "coincurve"
+
+    def __init__(self):
+        import coincurve
+        self._coincurve = coincurve
+
+    def public_key(self, k):
+        b = self._coincurve.PublicKey.from_secret(k.to_bytes(32, 'big')).format(compressed=False)
+        return int.from_bytes(b[1:33], 'big'), int.from_bytes(b[33:65], 'big')
+
+    def sign(self, message, k, do_hash=True):
+        # Same digest as two1: a single SHA-256 of the message
+        msg = hashlib.sha256(message).digest() if do_hash else message
+        sig = self._coincurve.PrivateKey(k.to_bytes(32, 'big')).sign_recoverable(msg, hasher=None)
+        # libsecp256k1 already returns a low s
+        return Point(int.from_bytes(sig[:32], 'big'), int.from_bytes(sig[32:64], 'big')), sig[64]
+
+
+# Native backends first, then the pure Python ones
+BACKENDS = {
+    "coincurve": CoincurveBackend,
+    "python": PythonBackend,
+    "two1": Two1Backend,
+}
+
+_backend = None
+
+
+def set_backend(name=None):
+    """ Selects the backend doing the EC math of this module.
+
+    Args:
+        name (str): One of `BACKENDS`. None picks the first one that
+           can be loaded.
+
+    Returns:
+        The backend object.
+    """
+    global _backend
+    if name is not None:
+        _backend = BACKENDS[name]()
+        return _backend
+
+    for klass in BACKENDS.values():
+        try:
+            _backend = klass()
+            return _backend
+        except ImportError:
+            continue
+
+
+def get_backend():
+    """ The backend doing the EC math of this module. """
+    if _backend is None:
+        set_backend()
+    return _backend
+
+
+def available_backends():
+    """ Names of the backends that can be loaded here. """
+    names = []
+    for name, klass in BACKENDS.items():
+        try:
+            klass()
+            names.append(name)
+        except ImportError:
+            pass
+    return names
+
+
 class PrivateKeyBase(object):
     """ Base class for both PrivateKey and HDPrivateKey.
 
@@ -57,6 +212,7 @@ class PrivateKeyBase(object):
     Returns:
         PrivateKey: The object representing the private key.
     """
+    __slots__ = ()
 
     @staticmethod
     def from_b58check(private_key):
@@ -191,6 +347,7 @@ class PublicKeyBase(object):
         PublicKey: The object representing the public key.
 
     """
+    __slots__ = ()
 
     @staticmethod
     def from_bytes(key_bytes):
@@ -372,6 +529,8 @@ class PrivateKey(PrivateKeyBase):
         """
         return PrivateKey(random.SystemRandom().randrange(1, bitcoin_curve.n))
 
+    __slots__ = ('key', '_public_key')
+
     def __init__(self, k):
         self.key = k
         self._public_key = None
@@ -386,8 +545,8 @@ class PrivateKey(PrivateKeyBase):
                 private key.
         """
         if self._public_key is None:
-            self._public_key = PublicKey.from_point(
-                bitcoin_curve.public_key(self.key))
+            x, y = get_backend().public_key(self.key)
+            self._public_key = PublicKey(x, y)
         return self._public_key
 
     def raw_sign(self, message, do_hash=True):
@@ -416,17 +575,22 @@ class PrivateKey(PrivateKeyBase):
         else:
             raise TypeError("message must be either str or bytes!")
 
-        sig_pt, rec_id = bitcoin_curve.sign(msg, self.key, do_hash)
+        return get_backend().sign(msg, self.key, do_hash)
 
-        # Take care of large s:
-        # Bitcoin deals with large s, by subtracting
-        # s from the curve order. See:
-        # https://bitcointalk.org/index.php?topic=285142.30;wap2
-        if sig_pt.y >= (bitcoin_curve.n // 2):
-            sig_pt = Point(sig_pt.x, bitcoin_curve.n - sig_pt.y)
-            rec_id ^= 0x1
+    def sign_many(self, messages, do_hash=True):
+        """ Signs many messages using this private key. The pure Python
+        backend shares the modular inversions of all signatures.
 
-        return (sig_pt, rec_id)
+        Args:
+            messages (list(bytes)): The messages to be signed.
+            do_hash (bool): True if the messages should be hashed prior
+                to signing, False if not.
+
+        Returns:
+            list: a (raw point, recovery id) tuple per message, as
+            returned by `raw_sign()`.
+        """
+        return get_backend().sign_many(messages, self.key, do_hash)
 
     def sign(self, message, do_hash=True):
         """ Signs message using this private key.
@@ -525,6 +689,11 @@ class PublicKey(PublicKeyBase):
     TESTNET_VERSION = 0x6F
     MAINNET_VERSION = 0x00
 
+    # Only the coordinates are kept per key, the curve point and the
+    # hashes are computed on first use: bulk derivations create one
+    # PublicKey per account and mostly need the keccak only.
+    __slots__ = ('x', 'y', '_point', '_ripe', '_ripe_compressed', '_keccak')
+
     @staticmethod
     def from_point(p):
         """ Generates a public key object from any object
@@ -699,22 +868,47 @@ class PublicKey(PublicKeyBase):
         return derived_public_key.verify(msg_hash, sig)
 
     def __init__(self, x, y):
-        p = ECPointAffine(bitcoin_curve, x, y)
-        if not bitcoin_curve.is_on_curve(p):
+        if not ecmath.is_on_curve(x, y):
             raise ValueError("The provided (x, y) are not on the secp256k1 curve.")
 
-        self.point = p
+        self.x = x
+        self.y = y
+        self._point = None
+        self._ripe = None
+        self._ripe_compressed = None
+        self._keccak = None
 
-        # RIPEMD-160 of SHA-256
-        r = hashlib.new('ripemd160')
-        r.update(hashlib.sha256(bytes(self)).digest())
-        self.ripe = r.digest()
+    @property
+    def point(self):
+        """ The public key as an ECPointAffine, built on first use. """
+        if self._point is None:
+            self._point = ECPointAffine(bitcoin_curve, self.x, self.y)
+        return self._point
+
+    @property
+    def ripe(self):
+        """ RIPEMD-160 of SHA-256 of the uncompressed public key. """
+        if self._ripe is None:
+            r = hashlib.new('ripemd160')
+            r.update(hashlib.sha256(bytes(self)).digest())
+            self._ripe = r.digest()
+        return self._ripe
 
-        r = hashlib.new('ripemd160')
-        r.update(hashlib.sha256(self.compressed_bytes).digest())
-        self.ripe_compressed = r.digest()
+    @property
+    def ripe_compressed(self):
+        """ RIPEMD-160 of SHA-256 of the compressed public key. """
+        if self._ripe_compressed is None:
+            r = hashlib.new('ripemd160')
+            r.update(hashlib.sha256(self.compressed_bytes).digest())
+            self._ripe_compressed = r.digest()
+        return self._ripe_compressed
 
-        self.keccak = sha3(bytes(self)[1:])
+    @property
+    def keccak(self):
+        """ Keccak-256 of the public key, its last 20 bytes are the address. """
+        if self._keccak is None:
+            self._keccak = sha3(bytes(self)[1:])
+        return self._keccak
 
     def hash160(self, compressed=True):
         """ Return the RIPEMD-160 hash of the SHA-256 hash of the
@@ -769,10 +963,10 @@ class PublicKey(PublicKeyBase):
 
     def __int__(self):
         mask = 2 ** 256 - 1
-        return ((self.point.x & mask) << bitcoin_curve.nlen) | (self.point.y & mask)
+        return ((self.x & mask) << bitcoin_curve.nlen) | (self.y & mask)
 
     def __bytes__(self):
-        return bytes(self.point)
+        return b'\x04' + self.x.to_bytes(32, 'big') + self.y.to_bytes(32, 'big')
 
     @property
     def compressed_bytes(self):
@@ -782,7 +976,7 @@ class PublicKey(PublicKeyBase):
         Returns:
             b (bytes): A 33-byte long byte string.
         """
-        return self.point.compressed_bytes
+        return bytes([(self.y & 1) + 0x02]) + self.x.to_bytes(32, 'big')
 
 
 class Signature(object):
@@ -922,6 +1116,8 @@ class Signature(object):
         """
         return Signature.from_bytes(bytes.fromhex(h))
 
+    __slots__ = ('r', 's', 'recovery_id')
+
     def __init__(self, r, s, recovery_id=None):
         self.r = r
         self.s = s
@@ -1012,6 +1208,8 @@ class HDKey(object):
     Returns:
         HDKey: An HDKey object.
     """
+    __slots__ = ()
+
     @staticmethod
     def from_b58check(key):
         """ Decodes a Base58Check encoded key.
@@ -1071,8 +1269,8 @@ class HDKey(object):
                 raise ValueError("First byte of public key must be 0x02 or 0x03!")
 
             public_key = PublicKey.from_bytes(key_bytes)
-            rv = HDPublicKey(x=public_key.point.x,
-                             y=public_key.point.y,
+            rv = HDPublicKey(x=public_key.x,
+                             y=public_key.y,
                              chain_code=chain_code,
                              index=index,
                              depth=depth,
@@ -1374,6 +1572,63 @@ class HDPrivateKey(HDKey, PrivateKeyBase):
                             depth=child_depth,
                             parent_fingerprint=parent_key.fingerprint)
 
+    @staticmethod
+    def derive_many(parent_key, indices):
+        """ Derives many child private keys from a parent private key.
+
+        The parent public key is computed once and the public keys of
+        all children in one batch, sharing a single modular inversion
+        with the pure Python backend.
+
+        Args:
+            parent_key (HDPrivateKey): The parent key.
+            indices (iterable(int)): The child numbers.
+
+        Returns:
+            list(HDPrivateKey): The children, None for an invalid index.
+        """
+        children = [HDPrivateKey.from_parent(parent_key, i) for i in indices]
+        valid = [child for child in children if child is not None]
+        points = get_backend().public_keys([child._key.key for child in valid])
+        for child, (x, y) in zip(valid, points):
+            child._key._public_key = PublicKey(x, y)
+        return children
+
+    @staticmethod
+    def derive_packed(parent_key, start, count, processes=None):
+        """ Derives the children start .. start + count - 1 of a parent
+        private key on a pool of worker processes.
+
+        The parent public key is computed once, here, and handed to the
+        workers with the parent key. Each worker runs `derive_many()` on
+        a range of indices.
+
+        Args:
+            parent_key (HDPrivateKey): The parent key.
+            start (int): The first child number.
+            count (int): How many children.
+            processes (int): Number of worker processes. None uses all
+               CPU cores, 1 derives in this process.
+
+        Returns:
+            tuple(bytes, bytes): The packed 20-byte addresses and the
+            packed 32-byte private keys of the children.
+        """
+        processes = processes or os.cpu_count()
+        parent_public = parent_key.public_key._key
+        job = (bytes(parent_key), parent_public.x, parent_public.y, get_backend().name)
+        if processes == 1 or count < DERIVE_CHUNK:
+            return _derive_range(job + (start, start + count))[1:]
+
+        chunk = max(DERIVE_CHUNK, -(-count // (processes * 4)))
+        jobs = [job + (i, min(i + chunk, start + count)) for i in range(start, start + count, chunk)]
+        with Pool(processes) as pool:
+            results = sorted(pool.imap_unordered(_derive_range, jobs))
+        return (b"".join(addresses for _, addresses, _ in results),
+                b"".join(keys for _, _, keys in results))
+
+    __slots__ = ('_key', 'chain_code', 'depth', 'index', 'parent_fingerprint', '_public_key')
+
     def __init__(self, key, chain_code, index, depth,
                  parent_fingerprint=b'\x00\x00\x00\x00'):
         if index < 0 or index > 0xffffffff:
@@ -1394,12 +1649,11 @@ class HDPrivateKey(HDKey, PrivateKeyBase):
                 private key.
         """
         if self._public_key is None:
-            self._public_key = HDPublicKey(x=self._key.public_key.point.x,
-                                           y=self._key.public_key.point.y,
-                                           chain_code=self.chain_code,
-                                           index=self.index,
-                                           depth=self.depth,
-                                           parent_fingerprint=self.parent_fingerprint)
+            # shares the PublicKey (and its hashes) of the non-extended key
+            public_key = HDPublicKey.__new__(HDPublicKey)
+            HDKey.__init__(public_key, self._key.public_key, self.chain_code,
+                           self.index, self.depth, self.parent_fingerprint)
+            self._public_key = public_key
 
         return self._public_key
 
@@ -1446,6 +1700,13 @@ class HDPrivateKey(HDKey, PrivateKeyBase):
         """
         return self._key.sign(message, do_hash)
 
+    def sign_many(self, messages, do_hash=True):
+        """ Signs many messages using the underlying non-extended private key.
+
+        See `PrivateKey.sign_many()`.
+        """
+        return self._key.sign_many(messages, do_hash)
+
     def sign_bitcoin(self, message, compressed=False):
         """ Signs a message using the underlying non-extended private
         key such that it is compatible with bitcoind, bx, and other
@@ -1490,7 +1751,7 @@ class HDPrivateKey(HDKey, PrivateKeyBase):
         return self.public_key.hash160()
 
     def __int__(self):
-        return int(self.key)
+        return int(self._key)
 
 
 class HDPublicKey(HDKey, PublicKeyBase):
@@ -1520,6 +1781,8 @@ class HDPublicKey(HDKey, PublicKeyBase):
     MAINNET_VERSION = 0x0488B21E
     TESTNET_VERSION = 0x043587CF
 
+    __slots__ = ('_key', 'chain_code', 'depth', 'index', 'parent_fingerprint')
+
     @staticmethod
     def from_parent(parent_key, i):
         """
@@ -1628,4 +1891,33 @@ class HDPublicKey(HDKey, PublicKeyBase):
         Returns:
             b (bytes): A 33-byte long byte string.
         """
-        return self._key.compressed_bytes
\ No newline at end of file
+        return self._key.compressed_bytes
+
+
+def _derive_range(job):
+    """ Worker of `HDPrivateKey.derive_packed()`: derives the children
+    start .. stop - 1 of a serialized parent key whose public key point
+    (x, y) is already known.
+
+    Returns:
+        tuple(int, bytes, bytes): start, the packed addresses and the
+        packed private keys.
+    """
+    parent_bytes, x, y, backend, start, stop = job
+    if get_backend().name != backend:
+        set_backend(backend)
+
+    parent_key = HDKey.from_bytes(parent_bytes)
+    parent_key._public_key = HDPublicKey(x=x, y=y,
+                                         chain_code=parent_key.chain_code,
+                                         index=parent_key.index,
+                                         depth=parent_key.depth,
+                                         parent_fingerprint=parent_key.parent_fingerprint)
+
+    addresses, keys = [], []
+    for i, child in enumerate(HDPrivateKey.derive_many(parent_key, range(start, stop)), start):
+        if child is None:
+            raise ValueError("Child %d is an invalid key, this index can't be used" % i)
+        addresses.append(child._key.public_key.keccak[12:])
+        keys.append(bytes(child._key))
+    return start, b"".join(addresses), b"".join(keys)
@@ -12,6 +12,7 @@ if __name__ == '__main__' and __package__ is None:
     sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 
 from utils import init_web3, init_accounts, load_contract
+from transport import print_stats
 from config import RPC_NODE_SEND, TIMEOUT_DEPLOY, FILE_CONTRACT_ABI, FILE_CONTRACT_BIN, FILE_CONTRACT_ADDRESS, GAS_DEPLOY, GAS_PRICE, CHAIN_ID
 
 
@@ -77,3 +78,4 @@ if __name__ == '__main__':
     # Init the first account to deploy contract
     account = init_accounts(w3, 1).get(0)
     deploy(account)
+    print_stats()
@@ -0,0 +1,239 @@
+"""
+@summary: Pure Python secp256k1 arithmetic for the "python" backend of crypto.py
+
+Scalar multiplications of the base point G use a fixed-base table of
+8-bit windows: table[i][j - 1] = j * 256**i * G, in affine coordinates.
+A multiplication is then at most 32 mixed additions and no doubling.
+The table is built on first use and cached on disk.
+
+Points are summed in Jacobian coordinates. Going back to affine costs a
+modular inversion, so many points (or many signature nonces) are inverted
+together with Montgomery's batch inversion.
+"""
+import os
+import hmac
+import hashlib
+
+P = 0xfffffffffffffffffffffffffffffffffffffffffffffffffffffffefffffc2f
+N = 0xfffffffffffffffffffffffffffffffebaaedce6af48a03bbfd25e8cd0364141
+Gx = 0x79be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798
+Gy = 0x483ada7726a3c4655da4fbfc0e1108a8fd17b448a68554199c47d08ffb10d4b8
+
+WINDOW_BITS = 8
+WINDOWS = 256 // WINDOW_BITS
+WINDOW_SIZE = (1 << WINDOW_BITS) - 1
+
+TABLE_MAGIC = b"HMRSECPG8"
+TABLE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "hammer", "secp256k1-g8.bin")
+
+_table = None
+
+
+def inverse(a, m):
+    """ Modular inverse, m is prime """
+    return pow(a, m - 2, m)
+
+
+def batch_inverse(values, m):
+    """ Inverses of all values modulo m, with a single modular inversion """
+    prefix = []
+    acc = 1
+    for v in values:
+        prefix.append(acc)
+        acc = acc * v % m
+
+    inv = inverse(acc, m)
+    result = [0] * len(values)
+    for i in range(len(values) - 1, -1, -1):
+        result[i] = prefix[i] * inv % m
+        inv = inv * values[i] % m
+    return result
+
+
+def jacobian_double(X1, Y1, Z1):
+    if Y1 == 0 or Z1 == 0:
+        return 0, 1, 0
+    A = X1 * X1 % P
+    B = Y1 * Y1 % P
+    C = B * B % P
+    D = 2 * ((X1 + B) * (X1 + B) - A - C) % P
+    E = 3 * A % P
+    X3 = (E * E - 2 * D) % P
+    Y3 = (E * (D - X3) - 8 * C) % P
+    Z3 = 2 * Y1 * Z1 % P
+    return X3, Y3, Z3
+
+
+def jacobian_add_affine(X1, Y1, Z1, x2, y2):
+    """ Jacobian point plus affine point """
+    if Z1 == 0:
+        return x2, y2, 1
+    Z1Z1 = Z1 * Z1 % P
+    U2 = x2 * Z1Z1 % P
+    S2 = y2 * Z1 * Z1Z1 % P
+    H = (U2 - X1) % P
+    r = 2 * (S2 - Y1) % P
+    if H == 0:
+        if r == 0:
+            return jacobian_double(X1, Y1, Z1)
+        return 0, 1, 0
+    HH = H * H % P
+    I = 4 * HH % P
+    J = H * I % P
+    V = X1 * I % P
+    X3 = (r * r - J - 2 * V) % P
+    Y3 = (r * (V - X3) - 2 * Y1 * J) % P
+    Z3 = ((Z1 + H) * (Z1 + H) - Z1Z1 - HH) % P
+    return X3, Y3, Z3
+
+
+def to_affine_many(points):
+    """ Affine (x, y) of Jacobian points, None for the point at infinity """
+    finite = [p for p in points if p[2] != 0]
+    inverses = iter(batch_inverse([p[2] for p in finite], P))
+    result = []
+    for X, Y, Z in points:
+        if Z == 0:
+            result.append(None)
+            continue
+        z_inv = next(inverses)
+        z_inv2 = z_inv * z_inv % P
+        result.append((X * z_inv2 % P, Y * z_inv2 * z_inv % P))
+    return result
+
+
+def build_table():
+    """ table[i][j - 1] = j * 256**i * G """
+    table = []
+    base = (Gx, Gy)
+    for _ in range(WINDOWS):
+        multiples = [(base[0], base[1], 1)]
+        for _ in range(WINDOW_SIZE):
+            multiples.append(jacobian_add_affine(*multiples[-1], *base))
+        affine = to_affine_many(multiples)
+        table.append(affine[:WINDOW_SIZE])
+        base = affine[WINDOW_SIZE]
+    return table
+
+
+def save_table(table, file=TABLE_FILE):
+    payload = b"".join(x.to_bytes(32, 'big') + y.to_bytes(32, 'big') for window in table for x, y in window)
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    tmp_file = "%s.%d" % (file, os.getpid())
+    with open(tmp_file, "wb") as f:
+        f.write(TABLE_MAGIC + hashlib.sha256(payload).digest() + payload)
+    os.replace(tmp_file, file)
+
+
+def load_table(file=TABLE_FILE):
+    """ The cached table, or None when missing or corrupt """
+    try:
+        with open(file, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    header = len(TABLE_MAGIC) + 32
+    payload = data[header:]
+    if (not data.startswith(TABLE_MAGIC) or len(payload) != WINDOWS * WINDOW_SIZE * 64 or
+            hashlib.sha256(payload).digest() != data[len(TABLE_MAGIC):header]):
+        return None
+
+    table = []
+    for i in range(WINDOWS):
+        window = []
+        for j in range(WINDOW_SIZE):
+            offset = (i * WINDOW_SIZE + j) * 64
+            window.append((int.from_bytes(payload[offset:offset + 32], 'big'),
+                           int.from_bytes(payload[offset + 32:offset + 64], 'big')))
+        table.append(window)
+    if table[0][0] != (Gx, Gy):
+        return None
+    return table
+
+
+def base_table():
+    """ The fixed-base table, loaded from disk or built (and saved) on first use """
+    global _table
+    if _table is None:
+        table = load_table()
+        if table is None:
+            table = build_table()
+            try:
+                save_table(table)
+            except OSError:
+                pass
+        _table = table
+    return _table
+
+
+def base_mul_jacobian(k):
+    """ k * G, in Jacobian coordinates """
+    table = base_table()
+    X, Y, Z = 0, 1, 0
+    k %= N
+    for window in table:
+        b = k & WINDOW_SIZE
+        if b:
+            X, Y, Z = jacobian_add_affine(X, Y, Z, *window[b - 1])
+        k >>= WINDOW_BITS
+        if not k:
+            break
+    return X, Y, Z
+
+
+def base_mul(k):
+    """ k * G, affine (x, y) """
+    return to_affine_many([base_mul_jacobian(k)])[0]
+
+
+def base_mul_many(ks):
+    """ k * G for every k, sharing a single modular inversion """
+    return to_affine_many([base_mul_jacobian(k) for k in ks])
+
+
+def is_on_curve(x, y):
+    return (y * y - x * x * x - 7) % P == 0
+
+
+def nonce_rfc6979(k, digest):
+    """ Deterministic nonce (RFC6979, HMAC-SHA256), as computed by two1 """
+    x_msg = k.to_bytes(32, 'big') + digest
+    V = b'\x01' * 32
+    K = b'\x00' * 32
+    K = hmac.new(K, V + b'\x00' + x_msg, hashlib.sha256).digest()
+    V = hmac.new(K, V, hashlib.sha256).digest()
+    K = hmac.new(K, V + b'\x01' + x_msg, hashlib.sha256).digest()
+    V = hmac.new(K, V, hashlib.sha256).digest()
+    while True:
+        V = hmac.new(K, V, hashlib.sha256).digest()
+        nonce = int.from_bytes(V, 'big')
+        if 1 <= nonce < N - 1:
+            return nonce
+        K = hmac.new(K, V + b'\x00', hashlib.sha256).digest()
+        V = hmac.new(K, V, hashlib.sha256).digest()
+
+
+def sign_many(digests, keys):
+    """
+    ECDSA signatures of 32-byte digests, digests[i] signed with the private key keys[i].
+    Returns (r, s, recovery_id) tuples, with a low s.
+    """
+    nonces = [nonce_rfc6979(k, digest) for k, digest in zip(keys, digests)]
+    points = base_mul_many(nonces)
+    nonce_inverses = batch_inverse(nonces, N)
+
+    signatures = []
+    for digest, k, (x, y), nonce_inv in zip(digests, keys, points, nonce_inverses):
+        recovery_id = (2 if x > N else 0) | (y & 0x1)
+        r = x % N
+        s = (int.from_bytes(digest, 'big') + r * k) * nonce_inv % N
+        if s >= N // 2:
+            s = N - s
+            recovery_id ^= 0x1
+        signatures.append((r, s, recovery_id))
+    return signatures
+
+
+def sign(digest, k):
+    return sign_many([digest], [k])[0]
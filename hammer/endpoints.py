@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+@summary: spreads the accounts over the nodes of RPC_NODE_SEND
+
+Every account is pinned to one endpoint, so its transactions reach a node
+in nonce order. Accounts are assigned round-robin, or by least latency:
+each account goes to the endpoint with the lowest latency * (accounts + 1).
+
+When an endpoint stops answering, its accounts fail over, one by one, to
+the alive endpoint with the fewest accounts. The nonce is re-synced there:
+the transactions from its pending transaction count on are sent again, as
+the dead node may have accepted some without propagating them.
+
+With RPC_TRANSPORT = "websocket", transactions go over the WebSockets of
+the endpoint (see ws_transport.py). Control calls (failover, txpool) stay on HTTP.
+"""
+import time
+import asyncio
+
+from config import RPC_NODES_SEND, RPC_NODES_SEND_WS, NODE_ASSIGNMENT, RPC_TRANSPORT
+from transport import post
+from batcher import BatchLimit
+from txpool import PoolMonitor
+from ws_transport import WebSocketPool, websocket_url
+
+HEADERS = {'Content-type': 'application/json'}
+
+
+class NoEndpointError(Exception):
+    pass
+
+
+class Endpoint:
+    """ A node of RPC_NODE_SEND and its counters """
+
+    def __init__(self, url, ws_url=None, transport=RPC_TRANSPORT):
+        self.url = url
+        self.ws_url = ws_url or websocket_url(url)
+        # WebSocketPool sending the transactions, None sends them over HTTP
+        self.websockets = WebSocketPool(self.ws_url) if transport == "websocket" else None
+        self.alive = True
+        self.latency = None  # seconds, from probe()
+        self.accounts = 0
+        self.requests = 0
+        self.txs = 0
+        self.errors = 0
+        self.failures = 0
+        self.hash_mismatches = 0  # hashes returned that are not keccak(raw transaction)
+        self.seconds = 0.0
+        self.first_request = None
+        self.last_answer = None
+        self.batch_limit = BatchLimit()
+        self.txpool = None  # PoolMonitor, while sending with backpressure
+
+    def record(self, sent, answered):
+        """ Counts a request sent and answered at these time.monotonic() """
+        self.requests += 1
+        self.seconds += answered - sent
+        self.first_request = sent if self.first_request is None else min(self.first_request, sent)
+        self.last_answer = answered if self.last_answer is None else max(self.last_answer, answered)
+
+    def mark_dead(self):
+        if self.alive:
+            self.alive = False
+            print("<FAIL> Endpoint %s stopped answering, failing over its accounts" % self.url)
+
+    def stats(self):
+        duration = (self.last_answer - self.first_request) if self.requests else 0
+        return {
+            "url": self.url,
+            "alive": self.alive,
+            "accounts": self.accounts,
+            "requests": self.requests,
+            "txs": self.txs,
+            "errors": self.errors,
+            "failures": self.failures,
+            "hash_mismatches": self.hash_mismatches,
+            "tps": round(self.txs / duration, 1) if duration else 0,
+            "avg_latency_ms": round(1000 * self.seconds / self.requests, 1) if self.requests else None,
+            "batches": self.batch_limit.stats(),
+            "txpool": self.txpool.stats() if self.txpool is not None else None,
+            "websocket": self.websockets.stats() if self.websockets is not None else None
+        }
+
+
+class EndpointPool:
+    """
+    >>> endpoints = EndpointPool(["http://node1:8545", "http://node2:8545"])
+    >>> endpoints.assign(accounts)
+    >>> accounts[0]["endpoint"].url
+    'http://node1:8545'
+    """
+
+    def __init__(self, urls=RPC_NODES_SEND, assignment=NODE_ASSIGNMENT, ws_urls=RPC_NODES_SEND_WS,
+                 transport=RPC_TRANSPORT):
+        if not urls:
+            raise NoEndpointError("RPC_NODE_SEND is not set")
+        if assignment not in ("round-robin", "least-latency"):
+            raise ValueError("Node assignment '%s' not recognized" % assignment)
+        if transport not in ("http", "websocket"):
+            raise ValueError("RPC transport '%s' not recognized" % transport)
+        ws_urls = list(ws_urls) + [None] * (len(urls) - len(ws_urls))
+        self.endpoints = [Endpoint(url, ws_url, transport) for url, ws_url in zip(urls, ws_urls)]
+        self.assignment = assignment
+        self._failover_locks = {}
+
+    def alive(self):
+        return [endpoint for endpoint in self.endpoints if endpoint.alive]
+
+    def probe(self, rounds=3):
+        """ Latency of every endpoint (best of a few web3_clientVersion calls), unreachable ones are dead """
+        payload = {"jsonrpc": "2.0", "method": "web3_clientVersion", "id": 1}
+        for endpoint in self.endpoints:
+            latencies = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                try:
+                    post(endpoint.url, json=payload, timeout=10).json()
+                except Exception:
+                    endpoint.alive = False
+                    break
+                latencies.append(time.perf_counter() - start)
+            endpoint.latency = min(latencies) if endpoint.alive else None
+
+    def assign(self, accounts):
+        """ Pins every account to an endpoint, on account["endpoint"] """
+        if self.assignment == "least-latency":
+            self.probe()
+        alive = self.alive()
+        if not alive:
+            raise NoEndpointError("No endpoint of RPC_NODE_SEND answers")
+
+        for i, account in enumerate(accounts.values()):
+            if self.assignment == "least-latency":
+                endpoint = min(alive, key=lambda e: e.latency * (e.accounts + 1))
+            else:
+                endpoint = alive[i % len(alive)]
+            account["endpoint"] = endpoint
+            endpoint.accounts += 1
+
+    async def pending_nonce(self, session, endpoint, address):
+        payload = {"jsonrpc": "2.0", "method": "eth_getTransactionCount", "params": [address, "pending"], "id": 1}
+        async with session.post(endpoint.url, json=payload, headers=HEADERS) as response:
+            return int((await response.json(content_type=None))["result"], 16)
+
+    async def failover(self, session, account, failed):
+        """
+        Moves an account off the `failed` endpoint. Returns the next nonce the new
+        endpoint expects from the account, or None when another request of the
+        account already failed over.
+        """
+        lock = self._failover_locks.setdefault(account["address"], asyncio.Lock())
+        async with lock:
+            if account["endpoint"] is not failed:
+                return None
+            failed.mark_dead()
+
+            while True:
+                alive = self.alive()
+                if not alive:
+                    raise NoEndpointError("No endpoint of RPC_NODE_SEND answers")
+                endpoint = min(alive, key=lambda e: e.accounts)
+                try:
+                    nonce = await self.pending_nonce(session, endpoint, account["address"])
+                except Exception:
+                    endpoint.mark_dead()
+                    continue
+                failed.accounts -= 1
+                endpoint.accounts += 1
+                account["endpoint"] = endpoint
+                return nonce
+
+    def watch_txpools(self, addresses, endpoints=None):
+        """ Starts a PoolMonitor on the alive endpoints, or on `endpoints` """
+        for endpoint in endpoints or self.alive():
+            endpoint.txpool = PoolMonitor(endpoint.url, addresses).start()
+
+    async def close_websockets(self):
+        await asyncio.gather(*[endpoint.websockets.close() for endpoint in self.endpoints
+                               if endpoint.websockets is not None])
+
+    def stop_watching_txpools(self):
+        for endpoint in self.endpoints:
+            if endpoint.txpool is not None:
+                endpoint.txpool.stop()
+
+    def stats(self):
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+    def print_stats(self):
+        line = "> Endpoint %s: %d accounts, %d txs = %.1f tx/s, %d errors, %d failures, avg latency %s ms%s"
+        for stats in self.stats():
+            print(line % (stats["url"], stats["accounts"], stats["txs"], stats["tps"], stats["errors"],
+                          stats["failures"], stats["avg_latency_ms"], "" if stats["alive"] else " (dead)"))
+            if stats["hash_mismatches"]:
+                print("<FAIL> %d hashes returned by %s differ from the local ones" %
+                      (stats["hash_mismatches"], stats["url"]))
+            batches = stats["batches"]
+            if batches["batches"]:
+                print("  %d batches of %d to %d txs, %d rejected by a full pool, %d failed, limit now %d" %
+                      (batches["batches"], batches["min_size"], batches["max_size"], batches["pool_full"],
+                       batches["failed"], batches["limit"]))
+            websocket = stats["websocket"]
+            if websocket and websocket["requests"]:
+                print("  %d requests over %d WebSockets to %s, at most %d in flight on one" %
+                      (websocket["requests"], websocket["sockets"], websocket["url"],
+                       websocket["max_in_flight_per_socket"]))
+        for endpoint in self.endpoints:
+            if endpoint.txpool is not None:
+                endpoint.txpool.print_stats()
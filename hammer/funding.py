@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+@summary: funds the accounts through a tree of intermediaries (fan-out)
+
+Funding every account from account 0 sends all the transfers from one nonce
+sequence, and a block only includes so many of them: with thousands of
+accounts, funding takes dozens of blocks. Here account 0 funds FUNDING_FANOUT
+accounts with enough for their subtree, each of them funds FUNDING_FANOUT
+more, and so on: log(N) / log(FUNDING_FANOUT) levels, one block round each.
+
+The balances of all the accounts are read first, in concurrent JSON-RPC batches
+(see account_state.py), and the ones already funded are skipped. Every level waits for the inclusion of its
+transfers before the next one is sent, so funding is over before the load starts.
+"""
+import time
+
+from config import RPC_NODE_SEND, GAS_PRICE, CHAIN_ID
+from config import FUNDING_AMOUNT, FUNDING_MIN_BALANCE, FUNDING_FANOUT, FUNDING_GAS, FUNDING_BATCH, FUNDING_TIMEOUT
+from transport import rpc_batch
+from account_state import load_account_states
+
+
+class FundingError(Exception):
+    pass
+
+
+class FundingTree:
+    """
+    The accounts to fund, in the order of a FUNDING_FANOUT-ary tree: the root (account 0)
+    funds needy[0:fanout], needy[i] funds needy[fanout * (i + 1):fanout * (i + 2)].
+
+    >>> tree = FundingTree(5, fanout=2)
+    >>> tree.levels()
+    [[0, 1], [2, 3, 4]]
+    >>> tree.parent(4)
+    1
+    """
+
+    def __init__(self, count, fanout=FUNDING_FANOUT, amount=FUNDING_AMOUNT, fee=FUNDING_GAS * GAS_PRICE):
+        self.count = count
+        self.fanout = fanout
+        self.amount = amount
+        self.fee = fee
+
+    def parent(self, i):
+        """ Position of the funder of needy[i], None for the root """
+        return i // self.fanout - 1 if i >= self.fanout else None
+
+    def children(self, i):
+        return range(self.fanout * (i + 1), min(self.count, self.fanout * (i + 2)))
+
+    def levels(self):
+        """ Positions of each level, from the children of the root on """
+        levels, start, size = [], 0, self.fanout
+        while start < self.count:
+            levels.append(list(range(start, min(self.count, start + size))))
+            start, size = start + size, size * self.fanout
+        return levels
+
+    def value(self, i):
+        """ Wei sent to needy[i]: its own amount, and what it sends on with the fees """
+        return self.amount + sum(self.value(child) + self.fee for child in self.children(i))
+
+    def total(self):
+        """ Wei account 0 needs """
+        return sum(self.value(i) + self.fee for i in range(min(self.count, self.fanout)))
+
+
+def sign_transfer(w3, sender, receiver, value):
+    tx = {
+        'to': receiver["address"],
+        'value': value,
+        'gas': FUNDING_GAS,
+        'gasPrice': GAS_PRICE,
+        'nonce': sender["nonce"].increment(),
+        'chainId': CHAIN_ID
+    }
+    return w3.eth.account.signTransaction(tx, sender["private_key"])
+
+
+def wait_for_receipts(tx_hashes, url=RPC_NODE_SEND, timeout=FUNDING_TIMEOUT, interval=0.5):
+    """ Waits for the receipts of transactions, polled in JSON-RPC batches """
+    pending = list(tx_hashes)
+    deadline = time.monotonic() + timeout
+    while pending:
+        results = rpc_batch([("eth_getTransactionReceipt", (tx_hash,)) for tx_hash in pending], url, FUNDING_BATCH)
+        failed = [tx_hash for tx_hash, result in zip(pending, results)
+                  if result.get("result") and int(result["result"].get("status", "0x1"), 16) != 1]
+        if failed:
+            raise FundingError("Funding transaction %s failed" % failed[0])
+        pending = [tx_hash for tx_hash, result in zip(pending, results) if not result.get("result")]
+        if pending:
+            if time.monotonic() > deadline:
+                raise FundingError("%d funding transactions not included after %d s" % (len(pending), timeout))
+            time.sleep(interval)
+
+
+def fund_accounts(w3, accounts, url=RPC_NODE_SEND):
+    """
+    Funds, through a FundingTree, the accounts with less than FUNDING_MIN_BALANCE,
+    from account 0. Returns the number of accounts funded, once all transfers are included.
+    """
+    root = accounts[0]
+    others = [account for index, account in accounts.items() if index != 0]
+    states = load_account_states([root["address"]] + [account["address"] for account in others], url)
+    needy = [account for account, state in zip(others, states[1:])
+             if state.balance < w3.toWei(FUNDING_MIN_BALANCE, 'ether')]
+    print("> %d accounts already funded, %d to fund" % (len(others) - len(needy), len(needy)))
+    if not needy:
+        return 0
+
+    tree = FundingTree(len(needy), amount=w3.toWei(FUNDING_AMOUNT, 'ether'))
+    available = states[0].balance
+    if available < tree.total():
+        raise FundingError("Account 0 has %s ether, funding needs %s" %
+                           (w3.fromWei(available, 'ether'), w3.fromWei(tree.total(), 'ether')))
+
+    for depth, level in enumerate(tree.levels()):
+        start = time.monotonic()
+        signed = [sign_transfer(w3, root if tree.parent(i) is None else needy[tree.parent(i)], needy[i],
+                                tree.value(i)) for i in level]
+        results = rpc_batch([("eth_sendRawTransaction", (w3.toHex(tx.rawTransaction),)) for tx in signed], url,
+                            FUNDING_BATCH)
+        errors = [result["error"] for result in results if "result" not in result]
+        if errors:
+            raise FundingError("%d funding transactions rejected, first error: %s" % (len(errors), errors[0]))
+        wait_for_receipts([w3.toHex(tx.hash) for tx in signed], url)
+        print("> Funding level %d: %d accounts funded in %.1f s" % (depth + 1, len(level), time.monotonic() - start))
+    return len(needy)
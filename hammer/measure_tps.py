@@ -12,9 +12,12 @@ if __name__ == '__main__' and __package__ is None:
     from os import sys, path
     sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 
-from config import RPC_NODE_WATCH, FILE_LAST_EXPERIMENT, FILE_CONTRACT_ADDRESS, FILE_CONTRACT_ABI, FILE_CONTRACT_BIN
+from config import RPC_NODE_WATCH, RPC_NODE_WATCH_WS, RPC_TRANSPORT, FILE_LAST_EXPERIMENT, FILE_CONTRACT_ADDRESS, FILE_CONTRACT_ABI, FILE_CONTRACT_BIN
 from deploy import load_contract
 from utils import init_web3, file_date
+from transport import print_stats
+from txpool import PoolMonitor
+from ws_transport import HeadWatcher, websocket_url
 
 
 class CodingError(Exception):
@@ -40,10 +43,10 @@ def watch_contract():
     return
 
 
-def analyze_new_blocks(block_num, new_block_num, tx_count, start_time, peak_tps_avg):
+def analyze_new_blocks(block_num, new_block_num, tx_count, start_time, peak_tps_avg, pool_depth=None):
     """
     iterate through all new blocks, add up number of transactions
-    print status line
+    print status line, with the depth of the transaction pool
     """
     tx_count_new = 0
     # TODO check range again - shift by one?
@@ -75,10 +78,11 @@ def analyze_new_blocks(block_num, new_block_num, tx_count, start_time, peak_tps_
 
     line = "block %d | new #TX %3d / %4.0f ms = " \
            "%5.1f TPS_current | total: #TX %4d / %4.1f s = %5.1f TPS_average " \
-           "(peak %s %5.1f TPS_average)"
+           "(peak %s %5.1f TPS_average) | txpool %s"
     print(line % (new_block_num, tx_count_new, block_time_sec * 1000,
-                  tps_current, tx_count, elapsed, tps_avg, verb, peak_tps_avg))
-    return tx_count, peak_tps_avg, tps_avg
+                  tps_current, tx_count, elapsed, tps_avg, verb, peak_tps_avg,
+                  "-" if pool_depth is None else "%5d" % pool_depth))
+    return tx_count, peak_tps_avg, tps_avg, tps_current
 
 
 def get_nearest_entry(tps_avg, block_last):
@@ -132,16 +136,21 @@ def measure(block_num, pause_between_queries=0.3, relaxation_rounds=1):
 
     peak_tps_avg, count = 0, 0
     tps_avg = {}  # memorize all of them, so we can return value at 'block_last'
+    series = []  # block, epochtime, TPS_current, TPS_average, transaction pool depth
     while True:
-        new_block_num = w3.eth.blockNumber
+        new_block_num = last_block()
         if block_num != new_block_num:  # when a new block appears:
-            tx_count, peak_tps_avg, tps_avg[new_block_num] = analyze_new_blocks(
+            pool_depth = poll_txpool()
+            tx_count, peak_tps_avg, tps_avg[new_block_num], tps_current = analyze_new_blocks(
                 block_num,
                 new_block_num,
                 tx_count,
                 start_time,
-                peak_tps_avg
+                peak_tps_avg,
+                pool_depth
             )
+            series.append([new_block_num, round(time.time(), 3), round(tps_current, 1),
+                           round(tps_avg[new_block_num], 1), pool_depth])
             block_num = new_block_num
 
             # for the first 3 rounds, always reset the peak_tps_avg again!
@@ -159,12 +168,32 @@ def measure(block_num, pause_between_queries=0.3, relaxation_rounds=1):
             break
 
         # do not query too often; as little side effect on node as possible
-        time.sleep(pause_between_queries)
+        wait_block(pause_between_queries)
 
     print("Experiment ended! Current blocknumber = %d" % (w3.eth.blockNumber))
-    write_measures(peak_tps_avg, final_tps_avg, start_epochtime)
+    write_measures(peak_tps_avg, final_tps_avg, start_epochtime, series)
+
+def last_block():
+    """ Number of the last block, from the newHeads subscription when there is one """
+    if HEADS is not None and HEADS.alive() and HEADS.number is not None:
+        return HEADS.number
+    return w3.eth.blockNumber
+
+def wait_block(timeout):
+    """ Waits for a new block (with the newHeads subscription) or `timeout` seconds """
+    if HEADS is not None and HEADS.alive():
+        HEADS.wait(timeout)
+    else:
+        time.sleep(timeout)
+
+def poll_txpool():
+    """ Depth of the transaction pool of RPC_NODE_WATCH, None when the node does not tell """
+    try:
+        return TXPOOL.poll()
+    except Exception:
+        return None
 
-def write_measures(peak_tps_avg, final_tps_avg, start_epochtime, file=FILE_LAST_EXPERIMENT):
+def write_measures(peak_tps_avg, final_tps_avg, start_epochtime, series=None, file=FILE_LAST_EXPERIMENT):
     with open(file, "r") as f:
         data = json.load(f)
 
@@ -172,6 +201,7 @@ def write_measures(peak_tps_avg, final_tps_avg, start_epochtime, file=FILE_LAST_
     data["tps"]["peak_tps_avg"] = round(peak_tps_avg, 1)
     data["tps"]["final_tps_avg"] = round(final_tps_avg, 1)
     data["tps"]["start_epochtime"] = start_epochtime
+    data["tps"]["series"] = series or []
 
     with open(file, "w") as f:
         json.dump(data, f)
@@ -180,8 +210,12 @@ def write_measures(peak_tps_avg, final_tps_avg, start_epochtime, file=FILE_LAST_
 
 
 if __name__ == '__main__':
-    global w3
+    global w3, TXPOOL, HEADS
     w3 = init_web3(RPCaddress=RPC_NODE_WATCH)
+    TXPOOL = PoolMonitor(RPC_NODE_WATCH)
+    # with the websocket transport, blocks are pushed by the node instead of polled
+    HEADS = HeadWatcher(RPC_NODE_WATCH_WS or websocket_url(RPC_NODE_WATCH)).start() \
+        if RPC_TRANSPORT == "websocket" else None
 
     wait_file()
     watch_contract()
@@ -190,3 +224,4 @@ if __name__ == '__main__':
     print("\n Start Block Number:", start_block_number)
 
     measure(start_block_number)
+    print_stats()
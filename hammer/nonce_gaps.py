@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+@summary: nonce gaps of the accounts, detected and repaired while broadcasting
+
+Nonces are handed out before sending (AtomicNonce). A transaction that a node
+did not accept (timeout, rejection) or dropped later leaves a gap: every later
+transaction of its account stays queued, never pending, and the account stops
+being included without any error.
+
+Once an account sent its transactions (every chunk, when streaming), it checks
+(gap_positions, for both broadcast engines):
+- the answers: the transactions that were not acknowledged are a gap,
+- the node: eth_getTransactionCount(address, "pending") below the nonce after
+  the last acknowledged transaction is a gap from that nonce on.
+The transactions of the gap are sent again, in nonce order, and the check
+repeats, at most NONCE_REPAIR_ROUNDS times. A node answers "known transaction"
+for the ones it still has. Transactions are sent again as they were signed:
+signing the same nonce and argument again gives the same bytes.
+"""
+from threading import Lock
+
+from config import NONCE_REPAIR_ROUNDS, NONCE_REPAIR_WINDOW
+
+_gaps = None
+
+
+class NonceGaps:
+    """ Gap counters over all the accounts, written in the experiment results """
+
+    def __init__(self):
+        self.detected = 0
+        self.from_errors = 0  # found in the answers
+        self.from_pending = 0  # found from the pending nonce of the node
+        self.repaired = 0
+        self.unrepaired = 0
+        self.resent = 0  # transactions sent again
+        self._lock = Lock()
+
+    def count(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def stats(self):
+        return {
+            "detected": self.detected,
+            "from_errors": self.from_errors,
+            "from_pending": self.from_pending,
+            "repaired": self.repaired,
+            "unrepaired": self.unrepaired,
+            "resent": self.resent
+        }
+
+    def print_stats(self):
+        if self.detected:
+            line = "> Nonce gaps: %d detected (%d from errors, %d from pending nonces), %d repaired, " \
+                   "%d not repaired, %d transactions sent again"
+            print(line % (self.detected, self.from_errors, self.from_pending, self.repaired, self.unrepaired,
+                          self.resent))
+
+
+def nonce_gaps():
+    """ The NonceGaps of this run, created on first use """
+    global _gaps
+    if _gaps is None:
+        _gaps = NonceGaps()
+    return _gaps
+
+
+def gap_stats():
+    return nonce_gaps().stats()
+
+
+class GapRepair:
+    """
+    Rounds of the repair of an account, counted on nonce_gaps()
+
+    >>> repair = GapRepair()
+    >>> while repair.check(*find_gap()):
+    ...     resend(repair.positions)
+    """
+
+    def __init__(self, rounds=NONCE_REPAIR_ROUNDS):
+        self.rounds = rounds
+        self.found = False
+        self.positions = []  # of the gap to fill in this round
+
+    def check(self, positions, source):
+        """ Counts the gap a check found at `positions`. Returns whether to send them again """
+        gaps = nonce_gaps()
+        if positions == []:
+            gaps.count(repaired=self.found)
+            return False
+        if not self.found:
+            self.found = True
+            gaps.count(detected=1, **{source: 1})
+        if positions is None or self.rounds == 0:
+            gaps.count(unrepaired=1)
+            return False
+        self.rounds -= 1
+        self.positions = positions
+        gaps.count(resent=len(positions))
+        return True
+
+    def abort(self):
+        """ The account cannot send anymore """
+        nonce_gaps().count(unrepaired=self.found)
+
+
+def unacknowledged(acknowledged, count):
+    """ The first NONCE_REPAIR_WINDOW positions, out of `count`, that are not in `acknowledged` """
+    return [position for position in range(count) if position not in acknowledged][:NONCE_REPAIR_WINDOW]
+
+
+def pending_gap(pending, first_nonce, acknowledged):
+    """
+    Positions to send again when the node expects the nonce `pending` next, from the bodies
+    whose position 0 has the nonce `first_nonce`. At most NONCE_REPAIR_WINDOW, up to the last
+    acknowledged position. Empty when there is no gap, None when the gap is before the bodies.
+    """
+    position = pending - first_nonce
+    if position > max(acknowledged, default=-1):
+        return []
+    if position < 0:
+        return None
+    return list(range(position, min(max(acknowledged) + 1, position + NONCE_REPAIR_WINDOW)))
+
+
+def gap_positions(acknowledged, count, first_nonce, pending):
+    """
+    Positions of a nonce gap in `count` transactions from the nonce `first_nonce`, and
+    where it was found: the unacknowledged ones, or the ones from `pending` on, the nonce
+    the node expects next (None when unknown: no gap, the next check tells).
+    """
+    positions = unacknowledged(acknowledged, count)
+    if positions:
+        return positions, "from_errors"
+    if pending is None:
+        return [], "from_pending"
+    return pending_gap(pending, first_nonce, acknowledged), "from_pending"
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+@summary: streaming sign-and-send pipeline (send.py N stream [accounts])
+
+Instead of signing every transaction before broadcasting, the signers feed
+one bounded queue per account, that the asyncio broadcaster drains at the
+same time. Memory holds at most STREAM_QUEUE_DEPTH signed transactions per
+account (plus the chunk being signed and the one being sent), whatever
+the transactions count, and the node gets load from the first chunk on.
+
+Each account signs chunks of STREAM_CHUNK transactions, in nonce order, on
+a pool of worker processes. A signer stalls when the queue of its account
+is full (the broadcaster is the bottleneck), a sender stalls when it is
+empty (signing is). Both stall times are reported.
+"""
+import os
+import time
+import asyncio
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+
+from config import STREAM_QUEUE_DEPTH, STREAM_CHUNK, ASYNC_INFLIGHT_PER_ACCOUNT, ASYNC_INFLIGHT_TOTAL
+from config import TXPOOL_BACKPRESSURE
+from signer import init_worker, sign_job
+from rpc_bodies import RequestBodies, ID_STRIDE
+from broadcaster import account_worker, assign_endpoints, endpoint_pool, client_session
+
+
+class HashList(Sequence):
+    """
+    Transaction hashes in one buffer, 32 bytes each instead of a str object.
+    Items are the hex strings the node returns.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def append(self, tx_hash):
+        self._buffer += bytes.fromhex(tx_hash[2:])
+
+    def extend(self, tx_hashes):
+        for tx_hash in tx_hashes:
+            self.append(tx_hash)
+
+    def __len__(self):
+        return len(self._buffer) // 32
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("hash index out of range")
+        return "0x" + self._buffer[32 * i:32 * (i + 1)].hex()
+
+
+class Stalls:
+    """ Seconds the signers and the senders waited on the queues """
+
+    def __init__(self):
+        self.signers = 0.0
+        self.senders = 0.0
+        self.max_queued = 0
+
+    def print_stats(self, elapsed):
+        line = "> Pipeline: signers stalled on full queues %.1f s, senders on empty queues %.1f s " \
+               "(summed over accounts, %.1f s elapsed), at most %d chunks queued"
+        print(line % (self.signers, self.senders, elapsed, self.max_queued))
+
+
+async def sign_account(executor, jobs_limit, account, index, count, queue, stalls, workers, chunk=STREAM_CHUNK):
+    """ Signs the transactions of an account chunk by chunk, in nonce order, onto its queue """
+    loop = asyncio.get_event_loop()
+    for first_arg in range(0, count, chunk):
+        nonces = account["nonce"].reserve(min(chunk, count - first_arg))
+        if first_arg == 0:
+            account["first_nonce"] = nonces.start
+        async with jobs_limit:
+            job = (index, account["private_key"], nonces.start, first_arg, len(nonces), False)
+            try:
+                pid, _, _, _, calls, signed, elapsed = await loop.run_in_executor(executor, sign_job, job)
+            except BaseException:
+                # not signed: a later reserve() hands these nonces out again
+                account["nonce"].release(nonces)
+                raise
+        stats = workers.setdefault(pid, {"signatures": 0, "seconds": 0.0})
+        stats["signatures"] += signed
+        stats["seconds"] += elapsed
+
+        bodies = RequestBodies(ID_STRIDE * index + first_arg)
+        bodies.extend(*calls)
+        start = loop.time()
+        await queue.put((first_arg, bodies))
+        stalls.signers += loop.time() - start
+        stalls.max_queued = max(stalls.max_queued, queue.qsize())
+    await queue.put(None)
+
+
+async def send_account(session, endpoints, account, queue, hashes, errors, stalls, total_limit, account_limit):
+    """ Broadcasts the chunks of an account as they come out of its queue """
+    loop = asyncio.get_event_loop()
+    while True:
+        start = loop.time()
+        item = await queue.get()
+        stalls.senders += loop.time() - start
+        if item is None:
+            return
+        offset, bodies = item
+        chunk_hashes, chunk_errors = await account_worker(session, endpoints, account, total_limit, account_limit,
+                                                          bodies, offset)
+        hashes.extend(chunk_hashes)
+        errors.extend(chunk_errors)
+
+
+async def stream(accounts, contract, count, processes, depth, per_account, total):
+    queues = {index: asyncio.Queue(maxsize=max(1, depth // STREAM_CHUNK)) for index in accounts}
+    hashes, errors, stalls, workers = HashList(), [], Stalls(), {}
+    total_limit = asyncio.Semaphore(total)
+    # a few jobs per process, so that no process waits for the next one
+    jobs_limit = asyncio.Semaphore(2 * processes)
+
+    with ProcessPoolExecutor(processes, initializer=init_worker, initargs=(contract.address, contract.abi)) as executor:
+        async with client_session(total) as session:
+            signers = [sign_account(executor, jobs_limit, account, index, count, queues[index], stalls, workers)
+                       for index, account in accounts.items()]
+            senders = [send_account(session, endpoint_pool(), account, queues[index], hashes, errors, stalls,
+                                    total_limit, asyncio.Semaphore(per_account))
+                       for index, account in accounts.items()]
+            try:
+                await asyncio.gather(*signers, *senders)
+            finally:
+                await endpoint_pool().close_websockets()
+    return hashes, errors, stalls, workers
+
+
+def stream_transactions(accounts, contract, count, processes=None, depth=STREAM_QUEUE_DEPTH,
+                        per_account=ASYNC_INFLIGHT_PER_ACCOUNT, total=ASYNC_INFLIGHT_TOTAL):
+    """
+    Signs and broadcasts `count` storage.set(x) transactions per account, at the same time.
+    Returns the transaction hashes (a HashList), the stall times and the stats of each signing process.
+    """
+    processes = processes or os.cpu_count()
+    assign_endpoints(accounts)
+    if TXPOOL_BACKPRESSURE:
+        endpoint_pool().watch_txpools([account["address"] for account in accounts.values()])
+
+    start = time.monotonic()
+    try:
+        hashes, errors, stalls, workers = asyncio.run(
+            stream(accounts, contract, count, processes, depth, per_account, total))
+    finally:
+        endpoint_pool().stop_watching_txpools()
+    stalls.print_stats(time.monotonic() - start)
+
+    if errors:
+        print("<FAIL> %d requests failed, first error: %s" % (len(errors), errors[0]))
+    return hashes, stalls, workers
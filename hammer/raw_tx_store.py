@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+@summary: raw signed transactions of an account, back to back in one buffer
+
+A list of raw transactions costs a bytes object per transaction, 33 bytes of
+header on top of its ~110 bytes, plus the list slot. Here the transactions are
+length-prefixed records in one bytearray, the format the signer jobs return
+and the corpus stores (pack_raw_txs), with an array of the record offsets:
+about 12 bytes per transaction on top of the raw bytes. A store can also index
+a read-only buffer in place, such as a slice of the memory-mapped corpus.
+"""
+import struct
+from array import array
+
+# Every raw transaction in a packed buffer is prefixed by its length
+LENGTH_PREFIX = struct.Struct(">I")
+
+
+def pack_raw_txs(raw_txs):
+    """
+    Packs raw transactions in one buffer of length-prefixed records
+    """
+    chunks = []
+    for raw_tx in raw_txs:
+        chunks.append(LENGTH_PREFIX.pack(len(raw_tx)))
+        chunks.append(bytes(raw_tx))
+    return b"".join(chunks)
+
+
+class RawTxStore:
+    """
+    >>> store = RawTxStore()
+    >>> store.extend_packed(pack_raw_txs(raw_txs))
+    >>> store[0]  # raw bytes of the first transaction
+    >>> RawTxStore(memoryview(corpus)[offset:offset + length])  # indexed in place, not copied
+    """
+
+    def __init__(self, packed=None):
+        self._buffer = bytearray() if packed is None else packed
+        self._offsets = array("Q", [0])  # of the records, then the end of the last one
+        if packed is not None:
+            self._index(0)
+
+    def _index(self, offset):
+        """ Offsets of the records from `offset` to the end of the buffer """
+        end = len(self._buffer)
+        while offset < end:
+            (length,) = LENGTH_PREFIX.unpack_from(self._buffer, offset)
+            offset += LENGTH_PREFIX.size + length
+            self._offsets.append(offset)
+        if offset != end:
+            raise ValueError("Truncated raw transaction record at byte %d" % self._offsets[-1])
+
+    def extend_packed(self, packed):
+        """ Appends the records of pack_raw_txs(), e.g. of a signer job """
+        start = len(self._buffer)
+        self._buffer += packed
+        self._index(start)
+
+    def append(self, raw_tx):
+        self.extend_packed(LENGTH_PREFIX.pack(len(raw_tx)) + bytes(raw_tx))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, position):
+        if not -len(self) <= position < len(self):
+            raise IndexError("raw transaction %d out of %d" % (position, len(self)))
+        position %= len(self)
+        return bytes(self._buffer[self._offsets[position] + LENGTH_PREFIX.size:self._offsets[position + 1]])
+
+    def __iter__(self):
+        return (self[position] for position in range(len(self)))
+
+    def packed(self):
+        """ All the records, as pack_raw_txs() returns them """
+        return self._buffer
+
+    def nbytes(self):
+        return len(self._buffer) + self._offsets.itemsize * len(self._offsets)
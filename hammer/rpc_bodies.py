@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+@summary: JSON-RPC request bodies of the signed transactions, built before broadcasting
+
+The eth_sendRawTransaction call of every transaction of an account is JSON
+encoded once, while signing (on the worker processes), and kept back to back
+in one buffer, each call followed by a comma. The id of a call is
+ID_STRIDE * account index + position of its transaction in the account:
+any run of calls is a valid batch as it is, and ids are unique over the
+accounts, so answers can be matched on a shared WebSocket. Broadcasting
+only slices the buffer, no hex encoding, no dict, no json.dumps.
+
+The hash of every transaction, keccak(raw transaction), is computed at the
+same time: hashes are known without waiting for the node, and the ones it
+returns can be checked.
+
+packed() gives the offsets, hashes and calls in one buffer, as the corpus stores
+them, and from_packed() reads them back without encoding anything again.
+"""
+import sys
+from array import array
+
+from eth_utils import keccak
+
+ID_STRIDE = 10 ** 9  # ids of account i start at i * ID_STRIDE
+CALL = b'{"jsonrpc":"2.0","method":"eth_sendRawTransaction","params":["0x%s"],"id":%d},'
+
+
+def encode_calls(raw_txs, first_id=0):
+    """ The calls of raw transactions back to back, the length of each one, and their hashes back to back """
+    calls = [CALL % (bytes(raw_tx).hex().encode(), first_id + i) for i, raw_tx in enumerate(raw_txs)]
+    return b"".join(calls), [len(call) for call in calls], b"".join(keccak(raw_tx) for raw_tx in raw_txs)
+
+
+class RequestBodies:
+    """
+    >>> bodies = RequestBodies.from_raw_txs(signed_txs, ID_STRIDE * index)
+    >>> bodies.call(0)        # request body of the first transaction alone
+    >>> bodies.batch(0, 400)  # batch request body of the first 400 transactions
+    >>> bodies.tx_hash(0)     # hash of the first transaction
+    """
+
+    def __init__(self, first_id=0):
+        self.first_id = first_id  # id of the call at position 0
+        self._buffer = bytearray()
+        self._offsets = array("Q", [0])
+        self._hashes = bytearray()
+
+    @classmethod
+    def from_raw_txs(cls, raw_txs, first_id=0):
+        bodies = cls(first_id)
+        bodies.extend(*encode_calls(raw_txs, first_id))
+        return bodies
+
+    @classmethod
+    def from_packed(cls, packed, count, first_id=0):
+        """
+        The RequestBodies of `count` transactions from a buffer of packed(), e.g. a slice of a
+        memory map: the hashes and the calls are read in place, not copied. They cannot be extended.
+        """
+        bodies = cls(first_id)
+        size = bodies._offsets.itemsize * (count + 1)
+        bodies._offsets = array("Q", bytes(packed[:size]))
+        if sys.byteorder == "little":
+            bodies._offsets.byteswap()
+        bodies._hashes = packed[size:size + 32 * count]
+        bodies._buffer = packed[size + 32 * count:]
+        if len(bodies._offsets) != count + 1 or len(bodies._buffer) != bodies._offsets[-1]:
+            raise ValueError("Packed request bodies of %d transactions are truncated" % count)
+        return bodies
+
+    def packed(self):
+        """ Offsets of the calls (big endian uint64), hashes, then calls """
+        offsets = array("Q", self._offsets)
+        if sys.byteorder == "little":
+            offsets.byteswap()
+        return offsets.tobytes() + bytes(self._hashes) + bytes(self._buffer)
+
+    def extend(self, calls, lengths, hashes):
+        """ Appends calls of `encode_calls()`, their ids must follow the ones already here """
+        offset = self._offsets[-1]
+        for length in lengths:
+            offset += length
+            self._offsets.append(offset)
+        self._buffer += calls
+        self._hashes += hashes
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def call(self, position):
+        """ Request body of the transaction at `position` """
+        return bytes(self._buffer[self._offsets[position]:self._offsets[position + 1] - 1])
+
+    def batch(self, start, stop):
+        """ Batch request body of the transactions from `start` to `stop` (excluded) """
+        stop = min(stop, len(self))
+        return b"[%s]" % memoryview(self._buffer)[self._offsets[start]:self._offsets[stop] - 1]
+
+    def tx_hash(self, position):
+        """ Hash of the transaction at `position`, as the node returns it """
+        return "0x" + self._hashes[32 * position:32 * (position + 1)].hex()
+
+    def nbytes(self):
+        return len(self._buffer) + self._offsets.itemsize * len(self._offsets) + len(self._hashes)
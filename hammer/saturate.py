@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+@summary: searches the maximum sustainable TPS of the network
+
+    hammer/saturate.py step start_tps step_tps max_tps [accounts]
+    hammer/saturate.py ramp start_tps end_tps [accounts]
+
+Each step offers a constant rate, open loop (see broadcaster.run_at_rate),
+and counts the transactions of the blocks mined meanwhile, like measure_tps.
+A step is sustainable when the inclusion rate keeps up with the offered rate
+and the backlog (sent but not yet included) does not grow.
+
+The "step" profile raises the rate by step_tps, letting the backlog drain
+between steps. The "ramp" profile raises it linearly every
+SATURATION_RAMP_INTERVAL seconds, without draining: one open-loop run, signed
+up front, whose intervals are reported from the blocks a thread counts
+meanwhile. Only the transactions of the run are counted in blocks, by their
+local hashes. Nonce gaps are repaired after every run. Past the knee, the
+first unsustainable rate, the sustainable rate is binary searched
+between the last good rate and the knee.
+
+The report (offered vs achieved TPS and latency of every step) is printed
+and written on FILE_SATURATION_REPORT.
+"""
+import sys
+import json
+import time
+from threading import Thread, Event
+
+# extend path for imports:
+if __name__ == '__main__' and __package__ is None:
+    from os import sys, path
+    sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+from config import RPC_NODE_SEND, RPC_NODES_SEND, SIGN_PROCESSES, FILE_SATURATION_REPORT
+from config import SATURATION_STEP_SECONDS, SATURATION_RAMP_SECONDS, SATURATION_RAMP_INTERVAL
+from config import SATURATION_KNEE_RATIO, SATURATION_BACKLOG_GROWTH, SATURATION_SEARCH_STEPS
+from config import SATURATION_DRAIN_TIMEOUT, SATURATION_LATENCY_SAMPLE
+from deploy import init_contract
+from utils import init_web3, init_accounts
+from send import init_account_balances
+from signer import sign_transactions
+from check_control import get_receipts_queue
+from broadcaster import run_at_rate, rate_stats, record_hashes, latency_stats, endpoint_stats
+from nonce_gaps import gap_stats
+from transport import print_stats
+
+
+class SaturationSearch:
+    """
+    Runs load steps against the network and keeps the totals between them:
+    transactions sent, transactions included, and the last block counted.
+    """
+
+    def __init__(self, w3, accounts, contract):
+        self.w3 = w3
+        self.accounts = accounts
+        self.contract = contract
+        self.sent = 0
+        self.included = 0
+        self.block = w3.eth.blockNumber
+        self.steps = []
+        self.hashes = set()  # of the transactions signed, the only ones counted in blocks
+        self.timeline = []  # (epoch time, transactions included) at every block counted
+
+    @property
+    def backlog(self):
+        return self.sent - self.included
+
+    def sign(self, per_account):
+        """ Signs `per_account` transactions for every account, their hashes join self.hashes """
+        sign_transactions(per_account, self.accounts, self.contract, SIGN_PROCESSES)
+        for account in self.accounts.values():
+            bodies = account["bodies"]
+            self.hashes.update(bodies.tx_hash(position) for position in range(len(bodies)))
+
+    def count_blocks(self, until):
+        """ Adds the transactions of the run in the blocks after the last counted one, up to `until` """
+        for number in range(self.block + 1, until + 1):
+            transactions = self.w3.eth.getBlock(number).transactions
+            self.included += sum(1 for tx_hash in transactions if self.w3.toHex(tx_hash) in self.hashes)
+        if until > self.block:
+            self.block = until
+            self.timeline.append((time.time(), self.included))
+
+    def watch_blocks(self, stop, pause_between_queries=0.1):
+        """ Counts the blocks as they come, until `stop` is set """
+        while not stop.wait(pause_between_queries):
+            self.count_blocks(self.w3.eth.blockNumber)
+
+    def included_at(self, when, before):
+        """ Transactions included in the blocks counted up to epoch time `when`, `before` at the start """
+        return max([included for seen, included in self.timeline if seen <= when], default=before)
+
+    def wait_next_block(self, pause_between_queries=0.1):
+        block = self.block
+        while block == self.block:
+            time.sleep(pause_between_queries)
+            block = self.w3.eth.blockNumber
+        self.count_blocks(block)
+
+    def drain(self, timeout=SATURATION_DRAIN_TIMEOUT):
+        """ Waits until the backlog is included, or timeout. Returns the backlog left """
+        start = time.monotonic()
+        while self.backlog > 0 and time.monotonic() - start < timeout:
+            self.wait_next_block()
+        return self.backlog
+
+    def inclusion_latency(self, records, sample=SATURATION_LATENCY_SAMPLE, timeout=SATURATION_STEP_SECONDS):
+        """
+        Block timestamp minus intended send time, for a sample of transactions.
+        Block timestamps have a resolution of one second.
+        """
+        answered = [record for record in records if "result" in record[3]]
+        sampled = answered[::max(1, len(answered) // sample)][:sample]
+        intended = {record[3]["result"]: record[0] for record in sampled}
+        receipts = get_receipts_queue(self.w3, list(intended), timeout)
+        timestamps = {}
+        latencies = []
+        for tx_hash, receipt in receipts.items():
+            if receipt.blockNumber not in timestamps:
+                timestamps[receipt.blockNumber] = self.w3.eth.getBlock(receipt.blockNumber).timestamp
+            latencies.append(timestamps[receipt.blockNumber] - intended[tx_hash])
+        return (latency_stats(latencies) if latencies else None), len(sampled) - len(latencies)
+
+    def run_step(self, rate, seconds, phase):
+        """
+        Offers `rate` transactions per second for about `seconds` seconds.
+        Returns the step report, whose "sustainable" tells if the network kept up.
+        """
+        self.sign(max(1, round(rate * seconds / len(self.accounts))))
+
+        self.count_blocks(self.w3.eth.blockNumber)
+        backlog_before, included_before = self.backlog, self.included
+        start = time.time()
+        _, records = run_at_rate(self.accounts, rate)
+        duration = time.time() - start
+        # transactions sent during the last block period land in the next block
+        self.count_blocks(self.w3.eth.blockNumber)
+        self.wait_next_block()
+
+        hashes, _ = record_hashes(records)
+        self.sent += len(hashes)
+        return self.report(phase, rate, records, self.included - included_before, duration, self.backlog,
+                           self.backlog - backlog_before)
+
+    def report(self, phase, rate, records, included, duration, backlog, growth):
+        """ Report of the `records` of a step, printed and added to self.steps """
+        hashes, errors = record_hashes(records)
+        step = rate_stats(rate, records)
+        step.update({
+            "phase": phase,
+            "errors": len(errors),
+            "included": included,
+            "included_tps": included / duration,
+            "backlog": backlog,
+            "backlog_growth": growth
+        })
+        step["sustainable"] = (step["included_tps"] >= SATURATION_KNEE_RATIO * rate and
+                               growth <= SATURATION_BACKLOG_GROWTH * max(1, len(hashes)))
+        step["inclusion_latency"], step["not_included"] = self.inclusion_latency(records)
+        self.steps.append(step)
+        print_step(step)
+        return step
+
+    def search(self, good, bad, seconds=SATURATION_STEP_SECONDS, probes=SATURATION_SEARCH_STEPS):
+        """ Binary search of the sustainable rate between a good and a bad rate """
+        for _ in range(probes):
+            self.drain()
+            rate = (good + bad) / 2
+            if self.run_step(rate, seconds, "search")["sustainable"]:
+                good = rate
+            else:
+                bad = rate
+        return good
+
+    def step_profile(self, start_tps, step_tps, max_tps, seconds=SATURATION_STEP_SECONDS):
+        """ Returns the last sustainable rate and the knee, None if there was none """
+        good, rate = 0, start_tps
+        while rate <= max_tps:
+            self.drain()
+            if not self.run_step(rate, seconds, "step")["sustainable"]:
+                return good, rate
+            good, rate = rate, rate + step_tps
+        return good, None
+
+    def ramp_profile(self, start_tps, end_tps, seconds=SATURATION_RAMP_SECONDS, interval=SATURATION_RAMP_INTERVAL):
+        """
+        One open-loop run whose rate rises every `interval` seconds, each interval reported as a step.
+        Returns the last sustainable rate and the knee, None if there was none
+        """
+        intervals = max(1, int(seconds / interval))
+        rates = [start_tps + (end_tps - start_tps) * i / max(1, intervals - 1) for i in range(intervals)]
+        budget = sum(round(rate * interval) for rate in rates)
+        self.sign(max(1, -(-budget // len(self.accounts))))
+
+        self.count_blocks(self.w3.eth.blockNumber)
+        backlog_before, included_before = self.backlog, self.included
+        stop = Event()
+        watcher = Thread(target=self.watch_blocks, args=(stop,))
+        watcher.start()
+        try:
+            start, records = run_at_rate(self.accounts, rates[0], segments=[(rate, interval) for rate in rates])
+        finally:
+            stop.set()
+            watcher.join()
+        self.count_blocks(self.w3.eth.blockNumber)
+        self.wait_next_block()
+        hashes, _ = record_hashes(records)
+        self.sent += len(hashes)
+
+        def backlog(when):
+            sent = sum(1 for record in records if record[0] < when and "result" in record[3])
+            return backlog_before + sent - (self.included_at(when, included_before) - included_before)
+
+        # the windows count from the start of the schedule: an interval may have no records
+        good = 0
+        for i, rate in enumerate(rates):
+            begin, end = start + i * interval, start + (i + 1) * interval
+            step_records = [record for record in records if begin <= record[0] < end]
+            included = self.included_at(end, included_before) - self.included_at(begin, included_before)
+            if not self.report("ramp", rate, step_records, included, interval, backlog(end),
+                               backlog(end) - backlog(begin))["sustainable"]:
+                return good, rate
+            good = rate
+        return good, None
+
+
+def print_step(step):
+    latency = step["inclusion_latency"]
+    line = "> %-6s offered %8.1f tx/s | sent %8.1f tx/s | included %8.1f tx/s | backlog %7d (%+d) | " \
+           "rpc p99 %7.1f ms | inclusion p50 %s | %s"
+    print(line % (step["phase"], step["offered_tps"], step["sent_tps"], step["included_tps"],
+                  step["backlog"], step["backlog_growth"], 1000 * step["latency_from_intended"]["p99"],
+                  "%.1f s" % latency["p50"] if latency else "-",
+                  "ok" if step["sustainable"] else "SATURATED"))
+    sys.stdout.flush()
+
+
+def write_report(steps, sustainable_tps, knee_tps, file=FILE_SATURATION_REPORT):
+    report = {
+        "nodes": RPC_NODES_SEND,
+        "endpoints": endpoint_stats(),
+        "nonce_gaps": gap_stats(),
+        "sustainable_tps": sustainable_tps,
+        "knee_tps": knee_tps,
+        "steps": steps
+    }
+    with open(file, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def print_report(steps, sustainable_tps, knee_tps):
+    print("\n%-7s %10s %10s %10s %9s %12s %10s" % ("phase", "offered", "sent", "included", "backlog",
+                                                   "rpc p99 ms", "result"))
+    for step in steps:
+        print("%-7s %10.1f %10.1f %10.1f %9d %12.1f %10s" % (
+            step["phase"], step["offered_tps"], step["sent_tps"], step["included_tps"], step["backlog"],
+            1000 * step["latency_from_intended"]["p99"], "ok" if step["sustainable"] else "SATURATED"))
+    if knee_tps is None:
+        print("\nNo knee found, the network sustained every offered rate up to %.1f tx/s" % sustainable_tps)
+    else:
+        print("\nKnee at %.1f tx/s, sustainable rate %.1f tx/s" % (knee_tps, sustainable_tps))
+
+
+def check_argv():
+    if (len(sys.argv) < 2 or sys.argv[1] not in ("step", "ramp") or
+            (sys.argv[1] == "step" and not 5 <= len(sys.argv) <= 6) or
+            (sys.argv[1] == "ramp" and not 4 <= len(sys.argv) <= 5)):
+        print("Needs parameters:")
+        print("%s step start_tps step_tps max_tps [accounts]" % sys.argv[0])
+        print("%s ramp start_tps end_tps [accounts]" % sys.argv[0])
+        exit()
+
+
+if __name__ == '__main__':
+    check_argv()
+    profile = sys.argv[1]
+    num_rates = 3 if profile == "step" else 2
+    rates = [float(arg) for arg in sys.argv[2:2 + num_rates]]
+    num_accounts = int(sys.argv[2 + num_rates]) if len(sys.argv) > 2 + num_rates else 20
+
+    w3 = init_web3(RPCaddress=RPC_NODE_SEND)
+    accounts = init_accounts(w3, num_accounts)
+    init_account_balances(w3, accounts)
+
+    runner = SaturationSearch(w3, accounts, init_contract(w3))
+    if profile == "step":
+        good, knee = runner.step_profile(*rates)
+    else:
+        good, knee = runner.ramp_profile(*rates)
+    if knee is not None:
+        good = runner.search(good, knee)
+
+    print_report(runner.steps, good, knee)
+    write_report(runner.steps, good, knee)
+    print("Report written on %s" % FILE_SATURATION_REPORT)
+    print_stats()
@@ -2,23 +2,33 @@
 """
 @summary: submit many contract storage.set(uint x) transactions
 """
+import os
 import sys
 import time
 import json
-from threading import Thread, get_ident
+from threading import Thread, Lock
 from queue import Queue
 
-import requests
+from requests import RequestException
 
 # extend path for imports:
 if __name__ == '__main__' and __package__ is None:
     from os import sys, path
     sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 
-from config import RPC_NODE_SEND, GAS, GAS_PRICE, CHAIN_ID, FILE_LAST_EXPERIMENT, EMPTY_BLOCKS_AT_END, BATCH_TX, TX_PER_BATCH
+from config import RPC_NODE_SEND, FILE_LAST_EXPERIMENT, EMPTY_BLOCKS_AT_END, BATCH_TX, SIGN_PROCESSES
+from config import BROADCAST_ENGINE, RPC_TRANSPORT, SEND_WORKERS, BATCH_RETRY_DELAY, BATCH_RETRIES, TXPOOL_BACKPRESSURE
+from config import NONCE_REPAIR, NONCE_REPAIR_DELAY
 from deploy import init_contract
-from utils import init_web3, init_accounts, transfer_funds
+from utils import init_web3, init_accounts
+from funding import fund_accounts, FundingError
 from check_control import get_receipts_queue, has_successful_transactions
+from signer import sign_transactions, print_worker_stats
+from broadcaster import broadcast_async, broadcast_at_rate, endpoint_pool, endpoint_stats, check_hash, assign_endpoints
+from batcher import account_batch, batch_outcome, error_message, KNOWN_TX
+from nonce_gaps import GapRepair, unacknowledged, gap_positions, nonce_gaps, gap_stats
+import pipeline
+from transport import post, print_stats, RPCError
 
 def send():
     """
@@ -41,6 +51,22 @@ def send():
         accounts = create_signed_transactions(transactions_count, accounts)
         init_experiment_data()
         txs = broadcast_transactions(transactions_count, accounts)
+    elif sys.argv[2] == "stream":
+        num_accounts = int(sys.argv[3]) if len(sys.argv) == 4 else 20
+        accounts = init_accounts(w3, num_accounts)
+        init_account_balances(w3, accounts)
+        init_experiment_data()
+        txs = stream_transactions(transactions_count, accounts)
+    elif sys.argv[2] == "rate" and len(sys.argv) >= 4:
+        rate = float(sys.argv[3])
+        num_accounts = int(sys.argv[4]) if len(sys.argv) == 5 else 20
+        accounts = init_accounts(w3, num_accounts)
+        init_account_balances(w3, accounts)
+        accounts = create_signed_transactions(transactions_count, accounts)
+        init_experiment_data()
+        line = "> %d accounts broadcasting %d transactions each, open loop at %.1f tx/s\n"
+        print(line % (len(accounts), transactions_count, rate))
+        txs = broadcast_at_rate(accounts, rate)
     else:
         print("Nope. Choice '%s'" % sys.argv[2], "not recognized.")
         exit()
@@ -50,137 +76,324 @@ def send():
 
 def create_signed_transactions(num_tx_per_account, accounts):
     """
-    Create and sign transaction that call Storage.set(x) and add it to a Queue on account["signatures"]
+    Create and sign transactions that call Storage.set(x), on a pool of worker processes.
+    Their request bodies are stored on account["bodies"]
     """
     line = "\n> %d accounts creating and signing %d transactions each\n"
     print(line % (len(accounts), num_tx_per_account))
 
-    threads = []
-
-    def sign_worker(account, index):
-        signed_txs = []
-        for i in range(num_tx_per_account):
-            storage_set(i, account, signed_txs)
-        account["signed_txs"] = signed_txs
-        accounts[index] = account
-
-    for index, account in accounts.items():
-        thread = Thread(target=sign_worker, args=(account, index))
-        threads.append(thread)
-
-    for thread in threads:
-        thread.start()
-        sys.stdout.flush()
-
-    for thread in threads:
-        thread.join()
+    start = time.monotonic()
+    workers = sign_transactions(num_tx_per_account, accounts, STORAGE_CONTRACT, SIGN_PROCESSES)
+    print_worker_stats(workers)
+    print("> Signing took %.1f seconds" % (time.monotonic() - start))
+    sys.stdout.flush()
 
     return accounts
 
-def broadcast_transactions(num_tx_per_account, accounts):
+def broadcast_transactions(num_tx_per_account, accounts, engine=BROADCAST_ENGINE):
     """
-    Consumes signed transactions from a Queue, to broadcast each one per account.
-    Each account has a thread.
+    Broadcasts the signed transactions of every account,
+    with the asyncio engine (broadcaster.py) or a pool of threads (AccountScheduler)
     """
-    line = "> %d accounts broadcasting %d transactions each\n"
-    print(line % (len(accounts), num_tx_per_account))
-
-    txs = []  # container to keep all transaction hashes
-    threads = []
-    def account_worker(account, txs):
-        signed_txs = account["signed_txs"]
-        while True:
-            if not signed_txs:
-                line = "> No more signed transactions for account with address: %s"
-                print(line % (account["address"]))
-                break
-            if BATCH_TX:
-                batch_request = build_batch_call(signed_txs[:TX_PER_BATCH])
-                send_batch(batch_request, txs)
-                # Remove signed transactions sent
-                del signed_txs[:TX_PER_BATCH]
-            else:
-                tx_signed = signed_txs.pop(0)
-                send_transaction(tx_signed, txs)
+    line = "> %d accounts broadcasting %d transactions each (%s)\n"
+    print(line % (len(accounts), num_tx_per_account, engine))
+
+    start, start_cpu = time.monotonic(), time.process_time()
+    if engine == "asyncio":
+        txs = broadcast_async(accounts)
+    elif engine == "threads":
+        txs = broadcast_threads(accounts)
+    else:
+        print("Nope. Broadcast engine '%s'" % engine, "not recognized.")
+        exit()
+    cpu = time.process_time() - start_cpu
+    print("\n> All accounts broadcasted their transactions in %.1f seconds" % (time.monotonic() - start))
+    print("> Broadcast CPU time %.2f s = %.1f us per transaction" % (cpu, 1e6 * cpu / max(1, len(txs))))
+    endpoint_pool().print_stats()
+    nonce_gaps().print_stats()
+    print()
 
-    for account in accounts.values():
-        thread = Thread(target=account_worker, args=(account, txs))
-        threads.append(thread)
+    return txs
 
-    for t in threads:
-        t.start()
-        sys.stdout.flush()
-    print("\n> %d account worker threads started" % len(accounts))
+def stream_transactions(num_tx_per_account, accounts):
+    """
+    Signs and broadcasts the transactions at the same time, through bounded
+    queues per account (pipeline.py), so memory does not grow with their number
+    """
+    line = "\n> %d accounts signing and broadcasting %d transactions each, streaming\n"
+    print(line % (len(accounts), num_tx_per_account))
 
-    for thread in threads:
-        thread.join()
-    print("\n> All accounts broadcasted their transactions\n")
+    start, start_cpu = time.monotonic(), time.process_time()
+    txs, stalls, workers = pipeline.stream_transactions(accounts, STORAGE_CONTRACT, num_tx_per_account,
+                                                        SIGN_PROCESSES)
+    cpu = time.process_time() - start_cpu
+    print_worker_stats(workers)
+    print("\n> All accounts signed and broadcasted their transactions in %.1f seconds" % (time.monotonic() - start))
+    print("> Main process CPU time %.2f s = %.1f us per transaction" % (cpu, 1e6 * cpu / max(1, len(txs))))
+    endpoint_pool().print_stats()
+    nonce_gaps().print_stats()
+    print()
 
     return txs
 
-def storage_set(arg, account, signed_txs=None):
+class AccountScheduler:
     """
-    call the storage.set(uint x) method using the web3 method
+    A fixed number of worker threads taking turns over the accounts, instead of a thread
+    per account. A worker takes the account at the head of the queue, runs one step of it
+    (a transaction, a batch) and puts it back at the tail. An account is with one worker
+    at a time, so its transactions go in nonce order, and every account gets a step per round.
+
+    >>> scheduler = AccountScheduler(workers=32)
+    >>> scheduler.run(accounts.values(), step)  # until step(account) returns False, or raises
+    >>> scheduler.print_stats()
     """
-    storage_set = STORAGE_CONTRACT.functions.set(x=arg).buildTransaction({
-        'gas': GAS,
-        'gasPrice': GAS_PRICE,
-        'nonce': account["nonce"].increment(),
-        'chainId': CHAIN_ID
-    })
-    tx_signed = w3.eth.account.signTransaction(
-        storage_set,
-        private_key=account["private_key"]
-    )
 
-    if signed_txs is not None:
-        signed_txs.append(tx_signed)
-    return tx_signed
+    def __init__(self, workers=SEND_WORKERS):
+        self.workers = workers or 8 * os.cpu_count()
+        self.stats = []  # per worker
+        self.elapsed = 0.0
+
+    def run(self, accounts, step):
+        """
+        Runs step(account) on every account until it returns False. An account whose
+        step raises is done, counted as failed.
+        """
+        accounts = list(accounts)
+        queue = Queue()
+        for account in accounts:
+            queue.put(account)
+        workers = min(self.workers, len(accounts))
+        self.stats = [{"steps": 0, "busy": 0.0, "accounts": 0, "failed": 0} for _ in range(workers)]
+        remaining, lock = [len(accounts)], Lock()
+
+        def worker(stats):
+            stopped = False
+            try:
+                while True:
+                    account = queue.get()
+                    if account is None:
+                        stopped = True
+                        return
+                    start = time.monotonic()
+                    try:
+                        more = step(account)
+                    except Exception as e:
+                        print("<FAIL> %s stops sending: %r" % (account.get("address"), e))
+                        stats["failed"] += 1
+                        more = False
+                    stats["busy"] += time.monotonic() - start
+                    stats["steps"] += 1
+                    if more:
+                        queue.put(account)
+                        continue
+                    stats["accounts"] += 1
+                    with lock:
+                        remaining[0] -= 1
+                        if remaining[0] == 0:
+                            return
+            finally:
+                # all the accounts are done, or this worker died: stop the other workers
+                # rather than leave them waiting for accounts that will never come back
+                if not stopped:
+                    for _ in range(workers):
+                        queue.put(None)
+
+        threads = [Thread(target=worker, args=(stats,)) for stats in self.stats]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        print("\n> %d worker threads started for %d accounts" % (workers, len(accounts)))
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.monotonic() - start
+
+    def utilization(self):
+        """ Share of the run each worker spent in steps """
+        return [stats["busy"] / self.elapsed if self.elapsed else 0.0 for stats in self.stats]
+
+    def failed(self):
+        """ Number of accounts whose step raised """
+        return sum(stats["failed"] for stats in self.stats)
+
+    def print_stats(self):
+        if not self.stats:
+            return
+        busy = self.utilization()
+        line = "> %d workers, %d steps: utilization avg %.0f%%, min %.0f%%, max %.0f%%, %.1f steps per worker"
+        print(line % (len(busy), sum(stats["steps"] for stats in self.stats), 100 * sum(busy) / len(busy),
+                      100 * min(busy), 100 * max(busy), sum(stats["steps"] for stats in self.stats) / len(busy)))
+        if self.failed():
+            print("<FAIL> %d accounts stopped on an error" % self.failed())
+
+def broadcast_threads(accounts, workers=SEND_WORKERS):
+    """
+    Broadcasts the signed transactions of the accounts from an AccountScheduler:
+    `workers` threads take turns sending the next transaction, or batch, of each account.
+    The accounts are pinned to the nodes as with the asyncio engine, over HTTP and without failover.
+    """
+    txs = []  # container to keep all transaction hashes
+    if RPC_TRANSPORT == "websocket":
+        print("> The threads engine sends over HTTP, RPC_TRANSPORT=websocket is ignored")
+    assign_endpoints(accounts)
+    if TXPOOL_BACKPRESSURE:
+        endpoint_pool().watch_txpools([account["address"] for account in accounts.values()],
+                                      {account["endpoint"] for account in accounts.values()})
+    for account in accounts.values():
+        account["sent"] = 0  # position of the next transaction to send
+        account["acknowledged"] = set()  # positions of the transactions the node accepted
+
+    def account_step(account):
+        """ Sends the next transaction, or batch, of the account. Returns whether it has more """
+        bodies, endpoint = account["bodies"], account["endpoint"]
+        if account["sent"] >= len(bodies):
+            if NONCE_REPAIR:
+                repair_gaps(account, endpoint, txs)
+            line = "> No more signed transactions for account with address: %s"
+            print(line % (account["address"]))
+            return False
+        if endpoint.txpool is not None:
+            endpoint.txpool.wait()
+        if BATCH_TX:
+            return send_adaptive_batch(account, endpoint, txs)
+        start = time.monotonic()
+        tx_hash = send_body(bodies.call(account["sent"]), txs, endpoint.url)
+        if tx_hash is None:
+            endpoint.errors += 1
+        else:
+            endpoint.txs += 1
+            account["acknowledged"].add(account["sent"])
+            check_hash(endpoint, bodies, account["sent"], tx_hash)
+        endpoint.record(start, time.monotonic())
+        account["sent"] += 1
+        return True
+
+    scheduler = AccountScheduler(workers)
+    scheduler.run(accounts.values(), account_step)
+    scheduler.print_stats()
+    endpoint_pool().stop_watching_txpools()
 
-def send_transaction(tx_signed, hashes=None):
-    tx_hash = w3.toHex(w3.eth.sendRawTransaction(tx_signed.rawTransaction))
+    return txs
 
+def send_body(body, hashes=None, url=RPC_NODE_SEND):
+    """
+    Sends the prebuilt request body of a transaction (see rpc_bodies.py).
+    Returns its hash, None when it was rejected or not sent.
+    """
+    try:
+        response = post(url, data=body).json()
+    except (RequestException, ValueError) as e:
+        print("<FAIL> Transaction not sent: %r" % e)
+        return None
+    if "result" not in response:
+        print("<FAIL> Transaction rejected: %s" % response.get("error"))
+        return None
     if hashes is not None:
-        hashes.append(tx_hash)
-    return tx_hash
-
-def send_batch(batch_request, hashes=None):
-    res = requests.post(
-        RPC_NODE_SEND,
-        json=batch_request,
-        headers={'Content-type': 'application/json'}
-    )
+        hashes.append(response["result"])
+    return response["result"]
+
+def send_batch(body, count, first_id=0, hashes=None, errors=None, url=RPC_NODE_SEND):
+    """
+    Sends a prebuilt batch of `count` eth_sendRawTransaction calls. Returns the outcome of
+    batcher.batch_outcome(), hashes and errors get the accepted and failed ones
+    """
+    try:
+        response = post(url, data=body).json()
+    except (RequestException, ValueError) as e:
+        response = {"error": repr(e)}
+    outcome = batch_outcome(response, count, first_id)
     if hashes is not None:
-        for tx in res.json():
-            hashes.append(tx["result"])
-    return hashes
-
-def build_batch_call(signed_txs):
-    batch_request = []
-    for i, signed_tx in enumerate(signed_txs):
-        call = {
-            'jsonrpc': '2.0',
-            'method': 'eth_sendRawTransaction',
-            'params': [w3.toHex(signed_tx.rawTransaction)],
-            'id': i
-        }
-        batch_request.append(call)
-    return batch_request
+        hashes.extend(tx_hash for _, tx_hash in outcome[1])
+    if errors is not None and not outcome[4]:
+        errors.extend(outcome[2])
+    return outcome
+
+def send_adaptive_batch(account, endpoint, hashes):
+    """
+    Sends the next batch of signed transactions of an account, sized by its AdaptiveBatch
+    on the endpoint, from account["sent"] on. It moves past the transactions sent, the ones
+    a full pool rejected are sent again. Returns False when the account gives up.
+    """
+    bodies = account["bodies"]
+    position = account["sent"]
+    batch = account_batch(account, endpoint)
+    count = min(batch.size, len(bodies) - position)
+    errors = []
+
+    start = time.monotonic()
+    consumed, sent, batch_errors, pool_full, failed = send_batch(bodies.batch(position, position + count), count,
+                                                                 bodies.first_id + position, hashes, errors,
+                                                                 endpoint.url)
+    answered = time.monotonic()
+    batch.observe(count, answered - start, pool_full, failed)
+    endpoint.record(start, answered)
+    endpoint.txs += len(sent)
+    for i, tx_hash in sent:
+        account["acknowledged"].add(position + i)
+        check_hash(endpoint, bodies, position + i, tx_hash)
+    endpoint.errors += len(errors)
+    if errors:
+        print("<FAIL> %d transactions of %s failed, first error: %s" % (len(errors), account["address"], errors[0]))
+    account["sent"] += consumed
+
+    account["rejected"] = 0 if consumed else account.get("rejected", 0) + 1
+    if account["rejected"] > BATCH_RETRIES:
+        reason = batch_errors[0] if failed else "the transaction pool stayed full"
+        print("<FAIL> %s gives up, %s" % (account["address"], reason))
+        return False
+    if pool_full or failed:
+        time.sleep(BATCH_RETRY_DELAY)
+    return True
+
+def pending_nonce(address, url=RPC_NODE_SEND):
+    payload = {"jsonrpc": "2.0", "method": "eth_getTransactionCount", "params": [address, "pending"], "id": 1}
+    return int(post(url, json=payload).json()["result"], 16)
+
+def find_gap(account, url):
+    """ Positions of a nonce gap of the account and where it was found, see nonce_gaps.gap_positions() """
+    pending = None
+    if not unacknowledged(account["acknowledged"], len(account["bodies"])):
+        try:
+            pending = pending_nonce(account["address"], url)
+        except (RequestException, ValueError, KeyError):
+            pass
+    return gap_positions(account["acknowledged"], len(account["bodies"]), account["first_nonce"], pending)
+
+def repair_gaps(account, endpoint, txs):
+    """
+    Sends again, one by one in nonce order, the transactions of the nonce gaps
+    of an account (see nonce_gaps.py). The repaired ones join txs.
+    """
+    bodies, acknowledged = account["bodies"], account["acknowledged"]
+    repair = GapRepair()
+    while repair.check(*find_gap(account, endpoint.url)):
+        for position in repair.positions:
+            try:
+                response = post(endpoint.url, data=bodies.call(position)).json()
+            except (RequestException, ValueError):
+                break
+            if "result" in response:
+                if position not in acknowledged:
+                    acknowledged.add(position)
+                    txs.append(response["result"])
+                check_hash(endpoint, bodies, position, response["result"])
+            elif KNOWN_TX.search(error_message(response.get("error"))):
+                acknowledged.add(position)
+        time.sleep(NONCE_REPAIR_DELAY)
 
 def init_account_balances(w3, accounts):
+    """
+    Funds the accounts from account 0 through a tree of accounts (funding.py),
+    and waits for the transfers to be included
+    """
     print("\n> Transfering funds to %d accounts" % len(accounts))
-    sender = accounts.get(0)
-    threads = []
-
-    for account in accounts.values():
-        thread = Thread(target=transfer_funds, args=(w3, sender, account, 5))
-        threads.append(thread)
-
-    for thread in threads:
-        thread.start()
-
-    for thread in threads:
-        thread.join()
+    start = time.monotonic()
+    try:
+        funded = fund_accounts(w3, accounts)
+    except (FundingError, RPCError) as e:
+        print("<FAIL> %s" % e)
+        exit()
+    if funded:
+        print("> Funding took %.1f seconds" % (time.monotonic() - start))
 
 def get_sample(txs, tx_ranges=50, timeout=60):
     """
@@ -212,7 +425,9 @@ def store_experiment_data(success, num_txs, block_from, block_to, empty_blocks,
         "node": {
             "rpc_address": RPC_NODE_SEND,
             "web3.clientVersion": w3.clientVersion
-        }
+        },
+        "endpoints": endpoint_stats(),
+        "nonce_gaps": gap_stats()
     }
 
     with open(file, "w") as f:
@@ -266,11 +481,15 @@ def check_argv():
     """
     before anything, check if number of parameters is fine, or print syntax instructions
     """
-    if not 2 <= len(sys.argv) <= 4:
+    if not 2 <= len(sys.argv) <= 5:
         print("Needs parameters:")
         print("%s transactions_count algorithm [workers]" % sys.argv[0])
         print("at least transactions_count, e.g.")
         print("%s 1000" % sys.argv[0])
+        print("open loop, at a constant rate of transactions per second:")
+        print("%s transactions_count rate tps [accounts]" % sys.argv[0])
+        print("signing while broadcasting, with bounded memory:")
+        print("%s transactions_count stream [accounts]" % sys.argv[0])
         exit()
 
 if __name__ == '__main__':
@@ -287,4 +506,5 @@ if __name__ == '__main__':
     sys.stdout.flush()
 
     finish(txs, success)
+    print_stats()
     sys.stdout.flush()
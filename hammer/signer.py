@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+@summary: Sign contract storage.set(uint x) transactions on a pool of worker processes.
+
+Signing is pure-Python CPU work, so threads serialize on the GIL. Here the
+accounts' nonce ranges are split in jobs and signed by worker processes.
+Each job returns the JSON-RPC calls of its transactions, so the broadcast
+does not encode them (see rpc_bodies.py). Only when they are written on a
+corpus, it also returns the raw transactions packed in one length-prefixed
+buffer, not as pickled SignedTransaction objects, appended as is to a
+RawTxStore (raw_tx_store.py).
+"""
+import os
+import time
+from multiprocessing import Pool
+
+from config import GAS, GAS_PRICE, CHAIN_ID
+from tx_template import TransactionTemplate, signing_key
+from rpc_bodies import RequestBodies, encode_calls, ID_STRIDE
+from raw_tx_store import RawTxStore, pack_raw_txs
+
+# storage.set(x) template of a worker process, set by `init_worker`
+_template = None
+
+
+def init_worker(contract_address, abi):
+    """
+    Precompiles the storage.set(x) transaction template inside each worker process.
+    No provider is needed, transactions are built and signed offline.
+    """
+    global _template
+    _template = TransactionTemplate(abi, 'set', contract_address, GAS, GAS_PRICE, CHAIN_ID)
+
+
+def sign_job(job):
+    """
+    Signs `count` storage.set(x) transactions, from `first_nonce` and `first_arg` on.
+    Returns the worker pid, the account index, the first nonce, the packed raw
+    transactions (None unless `keep_raw`), their calls, lengths and hashes
+    (see rpc_bodies.encode_calls), how many were signed and the seconds it took.
+    """
+    index, private_key, first_nonce, first_arg, count, keep_raw = job
+    start = time.perf_counter()
+    key = signing_key(private_key)
+    args_list = [(first_arg + i,) for i in range(count)]
+    raw_txs = _template.sign_many(key, first_nonce, args_list)
+    # the transaction of argument first_arg + i is at that position of the account
+    calls = encode_calls(raw_txs, ID_STRIDE * index + first_arg)
+    elapsed = time.perf_counter() - start
+    packed = pack_raw_txs(raw_txs) if keep_raw else None
+    return os.getpid(), index, first_nonce, packed, calls, count, elapsed
+
+
+def split_jobs(num_tx_per_account, accounts, processes, keep_raw=False):
+    """
+    Reserves the nonces of each account and splits them in jobs,
+    so that every worker process gets a few jobs even with few accounts.
+    """
+    jobs_per_account = max(1, (processes * 4) // max(1, len(accounts)))
+    chunk_size = max(1, -(-num_tx_per_account // jobs_per_account))
+
+    jobs = []
+    for index, account in accounts.items():
+        first_nonce = account["nonce"].reserve(num_tx_per_account).start
+        for first_arg in range(0, num_tx_per_account, chunk_size):
+            count = min(chunk_size, num_tx_per_account - first_arg)
+            jobs.append((index, account["private_key"],
+                         first_nonce + first_arg, first_arg, count, keep_raw))
+    return jobs
+
+
+def sign_transactions(num_tx_per_account, accounts, contract, processes=None, keep_raw=False):
+    """
+    Signs `num_tx_per_account` storage.set(x) transactions for each account on
+    a process pool. Their request bodies are stored, nonce ordered, on account["bodies"],
+    the nonce of the first one on account["first_nonce"]. With `keep_raw` (to write a corpus),
+    the raw transactions too, in a RawTxStore on account["signed_txs"].
+    Returns the signing stats of each worker process.
+    """
+    processes = processes or os.cpu_count()
+    jobs = split_jobs(num_tx_per_account, accounts, processes, keep_raw)
+
+    signed = {index: [] for index in accounts}
+    workers = {}
+    with Pool(processes, initializer=init_worker, initargs=(contract.address, contract.abi)) as pool:
+        for pid, index, first_nonce, packed, calls, count, elapsed in pool.imap_unordered(sign_job, jobs):
+            signed[index].append((first_nonce, packed, calls))
+            stats = workers.setdefault(pid, {"signatures": 0, "seconds": 0.0})
+            stats["signatures"] += count
+            stats["seconds"] += elapsed
+
+    for index, account in accounts.items():
+        signed_txs = RawTxStore() if keep_raw else None
+        bodies = RequestBodies(ID_STRIDE * index)
+        jobs = sorted(signed[index], key=lambda job: job[0])
+        for _, packed, calls in jobs:
+            if keep_raw:
+                signed_txs.extend_packed(packed)
+            bodies.extend(*calls)
+        if keep_raw:
+            account["signed_txs"] = signed_txs
+        account["bodies"] = bodies
+        account["first_nonce"] = jobs[0][0] if jobs else account["nonce"].value + 1
+
+    return workers
+
+
+def print_worker_stats(workers):
+    line = "worker %6d | %7d signatures in %6.1f s = %7.1f signatures/s"
+    total_signatures = 0
+    for pid, stats in sorted(workers.items()):
+        rate = stats["signatures"] / stats["seconds"] if stats["seconds"] else 0
+        print(line % (pid, stats["signatures"], stats["seconds"], rate))
+        total_signatures += stats["signatures"]
+    print("> %d workers signed %d transactions" % (len(workers), total_signatures))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+@summary: one keep-alive HTTP connection pool for every RPC caller
+
+`requests.post` opens a new TCP connection per call, and web3 keeps one
+`requests.Session` per thread. Under load both leave thousands of sockets
+in TIME_WAIT and run out of ephemeral ports. Here a single Session, with
+an HTTPAdapter of HTTP_POOL_SIZE connections per node, is shared by all
+threads: curl_post, send_batch, rpc_batch and the web3 provider of init_web3.
+
+Every response is timed by a hook, `print_stats()` reports the latencies
+and how many requests reused a connection.
+"""
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import HTTPProvider
+
+from config import HTTP_POOL_SIZE, HTTP_TIMEOUT
+
+HEADERS = {'Content-type': 'application/json'}
+
+_session = None
+_session_lock = Lock()
+_latencies = []
+
+
+def record_latency(seconds):
+    """ Adds the latency of a request made outside of the shared session """
+    _latencies.append(seconds)
+
+
+def _record_response(response, *args, **kwargs):
+    record_latency(response.elapsed.total_seconds())
+
+
+def session():
+    """ The shared Session, created on first use """
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            # pool_block: threads wait for a free connection instead of opening throwaway ones
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, pool_block=True)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            s.headers.update(HEADERS)
+            s.hooks["response"].append(_record_response)
+            _session = s
+    return _session
+
+
+def post(url, json=None, data=None, timeout=HTTP_TIMEOUT, **kwargs):
+    return session().post(url, json=json, data=data, timeout=timeout, **kwargs)
+
+
+class RPCError(Exception):
+    pass
+
+
+def rpc_batch(calls, url, chunk=None):
+    """
+    Answers, in order, to (method, params) calls sent in JSON-RPC batches of `chunk` calls (all in one by default).
+    Raises RPCError when a whole batch fails.
+    """
+    chunk = chunk or max(1, len(calls))
+    results = []
+    for start in range(0, len(calls), chunk):
+        batch = [{"jsonrpc": "2.0", "method": method, "params": list(params), "id": start + i}
+                 for i, (method, params) in enumerate(calls[start:start + chunk])]
+        response = post(url, json=batch).json()
+        if not isinstance(response, list):
+            raise RPCError(response.get("error", response) if isinstance(response, dict) else response)
+        answers = {answer.get("id"): answer for answer in response}
+        results.extend(answers.get(start + i, {"error": "No answer"}) for i in range(len(batch)))
+    return results
+
+
+class PooledHTTPProvider(HTTPProvider):
+    """
+    web3 HTTPProvider sending through the shared session, from any thread
+    """
+
+    def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        response = post(self.endpoint_uri, data=request_data, **self.get_request_kwargs())
+        response.raise_for_status()
+        return self.decode_rpc_response(response.content)
+
+
+def connection_stats():
+    """ (connections opened, requests sent) over all the pools of the shared session """
+    if _session is None:
+        return 0, 0
+    connections = sent = 0
+    for adapter in set(_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            connections += pool.num_connections
+            sent += pool.num_requests
+    return connections, sent
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def print_stats():
+    connections, sent = connection_stats()
+    latencies = sorted(_latencies)
+    if not sent and not latencies:
+        return
+    if sent:
+        line = "> HTTP session: %d requests over %d connections, %.1f%% reused a connection"
+        print(line % (sent, connections, 100.0 * (sent - connections) / sent))
+    if latencies:
+        line = "> HTTP latency of %d requests: avg %.1f ms, p50 %.1f ms, p99 %.1f ms, max %.1f ms"
+        print(line % (len(latencies), 1000 * sum(latencies) / len(latencies),
+                      1000 * percentile(latencies, 50), 1000 * percentile(latencies, 99), 1000 * latencies[-1]))
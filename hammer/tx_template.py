@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+@summary: Precompiled transaction template for a contract function.
+
+The function selector, the fixed transaction fields (gas, gasPrice, to, value)
+and the EIP-155 chain id are RLP-encoded once. Per transaction only the nonce
+and the 32-byte ABI words of the arguments are encoded, so the web3
+`buildTransaction` path (ABI lookup, argument validation, middlewares) is skipped.
+"""
+from eth_utils import keccak, to_bytes, to_canonical_address
+
+from config import GAS, GAS_PRICE, CHAIN_ID, CRYPTO_BACKEND
+from crypto import PrivateKey, set_backend
+
+set_backend(CRYPTO_BACKEND)
+
+
+def rlp_int(value):
+    """ RLP encoding of a positive integer """
+    if value == 0:
+        return b'\x80'
+    if value < 0x80:
+        return bytes([value])
+    b = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return bytes([0x80 + len(b)]) + b
+
+
+def rlp_bytes_header(length):
+    """ RLP header of a byte string of `length` bytes (not a single byte < 0x80) """
+    if length < 56:
+        return bytes([0x80 + length])
+    b = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes([0xb7 + len(b)]) + b
+
+
+def rlp_bytes(value):
+    """ RLP encoding of a byte string """
+    if len(value) == 1 and value[0] < 0x80:
+        return value
+    return rlp_bytes_header(len(value)) + value
+
+
+def rlp_list_header(length):
+    """ RLP header of a list whose encoded items take `length` bytes """
+    if length < 56:
+        return bytes([0xc0 + length])
+    b = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes([0xf7 + len(b)]) + b
+
+
+def encode_word(abi_type, value):
+    """
+    ABI-encodes a static argument in its 32-byte word
+    """
+    if abi_type.startswith('uint'):
+        return value.to_bytes(32, 'big')
+    if abi_type.startswith('int'):
+        return value.to_bytes(32, 'big', signed=True)
+    if abi_type == 'address':
+        return to_canonical_address(value).rjust(32, b'\x00')
+    if abi_type == 'bool':
+        return (1 if value else 0).to_bytes(32, 'big')
+    if abi_type.startswith('bytes') and abi_type != 'bytes':
+        return to_bytes(hexstr=value).ljust(32, b'\x00') if isinstance(value, str) else value.ljust(32, b'\x00')
+    raise ValueError("Only static arguments can be templated, not '%s'" % abi_type)
+
+
+def find_function(abi, fn_name):
+    for entry in abi:
+        if entry.get('type') == 'function' and entry.get('name') == fn_name:
+            return entry
+    raise ValueError("Function '%s' not found in ABI" % fn_name)
+
+
+def signing_key(private_key):
+    """
+    The key object used by `TransactionTemplate.sign`, from a hex or bytes private key.
+    Signing goes through the EC backend of crypto.py.
+    """
+    if isinstance(private_key, str):
+        private_key = to_bytes(hexstr=private_key)
+    return PrivateKey.from_bytes(private_key)
+
+
+class TransactionTemplate:
+    """
+    Transaction calling `fn_name` of the contract at address `to`.
+
+    >>> template = TransactionTemplate(abi, 'set', contract_address)
+    >>> key = signing_key(account["private_key"])
+    >>> raw_tx = template.sign(key, nonce, 42)
+    """
+
+    def __init__(self, abi, fn_name, to, gas=GAS, gas_price=GAS_PRICE, chain_id=CHAIN_ID, value=0):
+        function = find_function(abi, fn_name)
+        self.types = [i['type'] for i in function['inputs']]
+        for abi_type in self.types:
+            if abi_type in ('string', 'bytes') or abi_type.endswith(']'):
+                raise ValueError("Only static arguments can be templated, not '%s'" % abi_type)
+
+        signature = '%s(%s)' % (fn_name, ','.join(self.types))
+        self.selector = keccak(text=signature)[:4]
+        self.chain_id = chain_id
+
+        data_length = len(self.selector) + 32 * len(self.types)
+        # nonce | gasPrice, gas, to, value, data header | data | v, r, s
+        self._fields = (rlp_int(gas_price) + rlp_int(gas) +
+                        rlp_bytes(to_canonical_address(to)) + rlp_int(value) +
+                        rlp_bytes_header(data_length) + self.selector)
+        self._eip155_tail = rlp_int(chain_id) + b'\x80\x80'
+
+    def encode_call(self, *args):
+        """ ABI-encoded calldata of the function """
+        return self.selector + self._encode_words(args)
+
+    def _encode_words(self, args):
+        if len(args) != len(self.types):
+            raise TypeError("Expected %d arguments, got %d" % (len(self.types), len(args)))
+        return b''.join(encode_word(t, a) for t, a in zip(self.types, args))
+
+    def unsigned(self, nonce, *args):
+        """ RLP payload whose keccak is signed (EIP-155) """
+        body = rlp_int(nonce) + self._fields + self._encode_words(args) + self._eip155_tail
+        return rlp_list_header(len(body)) + body
+
+    def sign(self, key, nonce, *args):
+        """ Signed raw transaction, for a key built with `signing_key` """
+        return self.sign_many(key, nonce, [args])[0]
+
+    def sign_many(self, key, first_nonce, args_list):
+        """
+        Signed raw transactions with consecutive nonces from `first_nonce` on,
+        one per tuple of arguments in `args_list`. Signed in one batch.
+        """
+        prefixes, digests = [], []
+        for nonce, args in enumerate(args_list, first_nonce):
+            prefix = rlp_int(nonce) + self._fields + self._encode_words(args)
+            body = prefix + self._eip155_tail
+            prefixes.append(prefix)
+            digests.append(keccak(rlp_list_header(len(body)) + body))
+
+        raw_txs = []
+        for prefix, (signature, recovery_id) in zip(prefixes, key.sign_many(digests, do_hash=False)):
+            v = recovery_id + 35 + 2 * self.chain_id
+            body = prefix + rlp_int(v) + rlp_int(signature.x) + rlp_int(signature.y)
+            raw_txs.append(rlp_list_header(len(body)) + body)
+        return raw_txs
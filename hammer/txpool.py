@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+@summary: transaction pool depth of a node, and backpressure on the senders
+
+Flooding faster than blocks drain fills the pool of Besu, which then evicts
+or rejects transactions: nonce gaps and lost transactions. A PoolMonitor
+polls the pool depth every TXPOOL_POLL_INTERVAL seconds with
+`txpool_besuStatistics`. On a node without it, the depth is the sum over
+the accounts of their pending minus their latest nonce.
+
+Senders wait while the gate is closed: it closes when the depth reaches
+TXPOOL_HIGH_WATER and opens again when it falls to TXPOOL_LOW_WATER.
+"""
+import time
+import asyncio
+from threading import Thread, Event
+
+from requests import RequestException
+
+from config import TXPOOL_HIGH_WATER, TXPOOL_LOW_WATER, TXPOOL_POLL_INTERVAL
+from transport import post
+
+
+class UnsupportedMethodError(Exception):
+    pass
+
+
+def rpc_call(method, params=(), request_id=1):
+    return {"jsonrpc": "2.0", "method": method, "params": list(params), "id": request_id}
+
+
+class PoolMonitor:
+    """
+    >>> monitor = PoolMonitor(RPC_NODE_SEND, addresses)
+    >>> monitor.start()
+    >>> monitor.wait()  # before sending, returns at once while the pool is below the high-water mark
+    >>> monitor.stop()
+    """
+
+    def __init__(self, url, addresses=(), high_water=TXPOOL_HIGH_WATER, low_water=TXPOOL_LOW_WATER,
+                 interval=TXPOOL_POLL_INTERVAL):
+        self.url = url
+        self.addresses = list(addresses)
+        self.high_water = high_water
+        self.low_water = low_water
+        self.interval = interval
+        self.method = None  # "txpool_besuStatistics" or "pending nonces", found on the first poll
+        self.depth = None
+        self.series = []  # [epoch time, depth]
+        self.pauses = 0
+        self.paused_seconds = 0.0
+        self.open = Event()
+        self.open.set()
+        self._paused_at = None
+        self._stop = Event()
+        self._thread = None
+
+    def besu_depth(self):
+        response = post(self.url, json=rpc_call("txpool_besuStatistics"), timeout=10).json()
+        if "result" not in response:
+            raise UnsupportedMethodError(response.get("error"))
+        return response["result"]["localCount"] + response["result"]["remoteCount"]
+
+    def nonce_depth(self):
+        """ Transactions of the accounts in the pool: pending minus latest nonce, in one batch request """
+        calls = [rpc_call("eth_getTransactionCount", (address, block), i)
+                 for i, (address, block) in enumerate((address, block) for address in self.addresses
+                                                      for block in ("pending", "latest"))]
+        nonces = {result["id"]: int(result["result"], 16) for result in post(self.url, json=calls, timeout=10).json()}
+        return sum(max(0, nonces[i] - nonces[i + 1]) for i in range(0, len(calls), 2))
+
+    def poll(self):
+        """ The depth of the pool now, None when it cannot be known """
+        if self.method in (None, "txpool_besuStatistics"):
+            try:
+                depth = self.besu_depth()
+                self.method = "txpool_besuStatistics"
+            except UnsupportedMethodError:
+                if not self.addresses:
+                    return None
+                self.method = "pending nonces"
+        if self.method == "pending nonces":
+            depth = self.nonce_depth()
+        self.update(depth)
+        return depth
+
+    def update(self, depth):
+        now = time.time()
+        self.depth = depth
+        self.series.append([round(now, 3), depth])
+        if self.open.is_set() and depth >= self.high_water:
+            self.open.clear()
+            self.pauses += 1
+            self._paused_at = now
+        elif not self.open.is_set() and depth <= self.low_water:
+            self.resume()
+
+    def resume(self):
+        if not self.open.is_set():
+            self.paused_seconds += time.time() - self._paused_at
+            self.open.set()
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except (RequestException, ValueError, KeyError):
+                # not knowing the depth must not block the senders
+                self.resume()
+
+    def start(self):
+        self._thread = Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.resume()
+
+    def wait(self):
+        self.open.wait()
+
+    async def wait_async(self):
+        while not self.open.is_set():
+            await asyncio.sleep(self.interval / 10)
+
+    def stats(self):
+        depths = [depth for _, depth in self.series]
+        return {
+            "method": self.method,
+            "high_water": self.high_water,
+            "low_water": self.low_water,
+            "max_depth": max(depths) if depths else None,
+            "pauses": self.pauses,
+            "paused_seconds": round(self.paused_seconds, 2),
+            "series": self.series
+        }
+
+    def print_stats(self):
+        depths = [depth for _, depth in self.series]
+        if depths:
+            line = "> Transaction pool of %s (%s): max depth %d, sending paused %d times for %.1f s"
+            print(line % (self.url, self.method, max(depths), self.pauses, self.paused_seconds))
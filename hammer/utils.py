@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 from atomic_nonce import AtomicNonce
-from config import MNEMONIC, GAS, GAS_PRICE, CHAIN_ID
-from crypto import HDPrivateKey, HDKey
+from config import MNEMONIC, HD_PATH, CRYPTO_BACKEND
+from config import ACCOUNT_CACHE, DIR_ACCOUNT_CACHE, ACCOUNT_CACHE_PASSWORD, DERIVE_PROCESSES, HTTP_TIMEOUT
+from crypto import HDPrivateKey, HDKey, set_backend
+from account_cache import AccountCache
+from transport import PooledHTTPProvider, post
+from account_state import load_account_states
 import os
 import sys
 import json
 
-from web3 import Web3, HTTPProvider
-import requests
+from web3 import Web3, WebsocketProvider
 
 # extend path for imports:
 if __name__ == '__main__' and __package__ is None:
@@ -15,6 +18,9 @@ if __name__ == '__main__' and __package__ is None:
     sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 
 
+set_backend(CRYPTO_BACKEND)
+
+
 class Error(Exception):
     pass
 
@@ -30,7 +36,10 @@ def print_versions():
 
 
 def init_web3(RPCaddress=None):
-    w3 = Web3(HTTPProvider(RPCaddress, request_kwargs={'timeout': 120}))
+    if RPCaddress and RPCaddress.startswith(("ws://", "wss://")):
+        w3 = Web3(WebsocketProvider(RPCaddress, websocket_timeout=HTTP_TIMEOUT))
+    else:
+        w3 = Web3(PooledHTTPProvider(RPCaddress, request_kwargs={'timeout': HTTP_TIMEOUT}))
     from web3.middleware import geth_poa_middleware
     w3.middleware_onion.inject(geth_poa_middleware, layer=0)
 
@@ -50,8 +59,7 @@ def curl_post(method, txParameters=None, RPCaddress=None, ifPrint=False):
                "id": 1}
     if txParameters:
         payload["params"] = [txParameters]
-    headers = {'Content-type': 'application/json'}
-    response = requests.post(RPCaddress, json=payload, headers=headers)
+    response = post(RPCaddress, json=payload)
     response_json = response.json()
 
     if ifPrint:
@@ -71,55 +79,40 @@ def file_date(file):
     return when
 
 
-def init_accounts(w3, how_many):
+def derive_accounts(how_many):
+    """
+    (address bytes, private key bytes) of the first `how_many` accounts of the MNEMONIC.
+    """
+    if ACCOUNT_CACHE:
+        cache = AccountCache(MNEMONIC, HD_PATH, DIR_ACCOUNT_CACHE, ACCOUNT_CACHE_PASSWORD, DERIVE_PROCESSES)
+        return cache.accounts(how_many)
+
     master_key = HDPrivateKey.master_key_from_mnemonic(MNEMONIC)
-    root_keys = HDKey.from_path(master_key, "m/44'/60'/0'")
-    acct_priv_key = root_keys[-1]
+    path_key = HDKey.from_path(master_key, HD_PATH)[-1]
+    addresses, keys = HDPrivateKey.derive_packed(path_key, 0, how_many, DERIVE_PROCESSES)
+    return [(addresses[i * 20:(i + 1) * 20], keys[i * 32:(i + 1) * 32]) for i in range(how_many)]
+
+
+def init_accounts(w3, how_many):
+    """
+    The first `how_many` accounts, their nonces from the pending transaction
+    counts, read in concurrent batches (account_state.py)
+    """
+    derived = [(w3.toChecksumAddress(address), private_key) for address, private_key in derive_accounts(how_many)]
+    states = load_account_states([address for address, _ in derived])
+
     accounts = {}
-    for i in range(how_many):
-        keys = HDKey.from_path(
-            acct_priv_key, '{change}/{index}'.format(change=0, index=i))
-        private_key = keys[-1]
-        public_key = private_key.public_key
-        address = private_key.public_key.address()
-        address = w3.toChecksumAddress(address)
-        initial_nonce = AtomicNonce(w3, address)
+    for i, ((address, private_key), state) in enumerate(zip(derived, states)):
+        initial_nonce = AtomicNonce(w3, address, state.pending_nonce - 1)
 
         accounts[i] = {
-            "private_key": private_key._key.to_hex(),
+            "private_key": private_key.hex(),
             "address": address,
             "nonce": initial_nonce
         }
     return accounts
 
 
-def has_balance(w3, account):
-    balance = w3.eth.getBalance(account["address"])
-    balance = w3.fromWei(balance, 'ether')
-    if balance >= 1:
-        print("Account {} already has balance".format(account["address"]))
-        return True
-    else:
-        print("Account {} does not have enough balance".format(
-            account["address"]))
-        return False
-
-
-def transfer_funds(w3, sender, receiver, amount):
-    if not has_balance(w3, receiver):
-        amount = w3.toWei(amount, 'ether')
-        tx = {
-            'to': receiver["address"],
-            'value': amount,
-            'gas': GAS,
-            'gasPrice': GAS_PRICE,
-            'nonce': sender["nonce"].increment(),
-            'chainId': CHAIN_ID
-        }
-        signed = w3.eth.account.signTransaction(tx, sender["private_key"])
-        tx_hash = w3.toHex(w3.eth.sendRawTransaction(signed.rawTransaction))
-
-
 def load_contract(file_abi, file_bin, file_address=None):
     """
     Load contract from disk. Returns: address, ABI and Bin from the contract
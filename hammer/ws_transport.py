@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+@summary: JSON-RPC over long-lived WebSockets (RPC_TRANSPORT = "websocket")
+
+Besu answers JSON-RPC on a WebSocket too (--rpc-ws-enabled, port 8546). A
+WebSocketClient keeps one socket open and many requests in flight on it:
+requests are written as they come, a reader task matches every answer to
+its request by id. The ids of the prebuilt calls are unique over the
+accounts (see rpc_bodies.py), an answer to a batch is matched by its
+smallest id. No HTTP framing, headers or connection handling per request.
+
+The same sockets carry subscriptions: measure_tps.py follows `newHeads`
+instead of polling eth_blockNumber, see HeadWatcher.
+"""
+import json
+import asyncio
+from collections import deque
+from threading import Thread, Event
+from urllib.parse import urlsplit, urlunsplit
+
+import aiohttp
+
+from config import WS_CONNECTIONS, HTTP_TIMEOUT
+
+
+class SubscriptionError(Exception):
+    pass
+
+
+def websocket_url(url):
+    """ ws:// address of a node from its http:// one, on the Besu default port 8546 for 8545 """
+    parts = urlsplit(url)
+    netloc = parts.netloc[:-len(":8545")] + ":8546" if parts.netloc.endswith(":8545") else parts.netloc
+    return urlunsplit(({"http": "ws", "https": "wss"}.get(parts.scheme, parts.scheme), netloc,
+                       parts.path, parts.query, parts.fragment))
+
+
+def response_key(response):
+    """ Id of an answer, the smallest one of a batch answer. None when it has none (e.g. a parse error) """
+    if isinstance(response, list):
+        ids = [result["id"] for result in response if isinstance(result, dict) and isinstance(result.get("id"), int)]
+        return min(ids) if ids else None
+    return response.get("id") if isinstance(response, dict) else None
+
+
+class WebSocketClient:
+    """
+    >>> client = await WebSocketClient.connect(session, "ws://node:8546")
+    >>> response = await client.request(bodies.batch(0, 400), bodies.first_id)
+    >>> heads = await client.subscribe("newHeads")
+    >>> header = await heads.get()
+    """
+
+    def __init__(self, url, websocket):
+        self.url = url
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._websocket = websocket
+        self._pending = {}  # request key: futures of the requests sent with it, oldest first
+        self._subscriptions = {}  # subscription id: asyncio.Queue of its notifications, None when closed
+        self._control_id = 0  # ids of the calls made here are negative, the prebuilt ones are not
+        self._reader = asyncio.ensure_future(self.read())
+
+    @classmethod
+    async def connect(cls, session, url):
+        # max_msg_size=0: answers to large batches are not limited
+        return cls(url, await session.ws_connect(url, max_msg_size=0, autoping=True))
+
+    @property
+    def closed(self):
+        return self._websocket.closed or self._reader.done()
+
+    async def request(self, body, key, timeout=HTTP_TIMEOUT):
+        """ Sends a request body, whose id (or smallest id of a batch) is `key`, and waits for its answer """
+        if self.closed:
+            raise aiohttp.ClientConnectionError("WebSocket %s is closed" % self.url)
+        future = asyncio.get_event_loop().create_future()
+        self._pending.setdefault(key, deque()).append(future)
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await self._websocket.send_str(body.decode() if isinstance(body, bytes) else body)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.in_flight -= 1
+
+    async def call(self, method, params=()):
+        self._control_id -= 1
+        request = {"jsonrpc": "2.0", "method": method, "params": list(params), "id": self._control_id}
+        return await self.request(json.dumps(request), self._control_id)
+
+    async def subscribe(self, kind):
+        """ asyncio.Queue of the notifications of an eth_subscribe, it gets None when the socket closes """
+        response = await self.call("eth_subscribe", [kind])
+        if "result" not in response:
+            raise SubscriptionError(response.get("error"))
+        # notifications arriving before the answer was read are already queued
+        return self._subscriptions.setdefault(response["result"], asyncio.Queue())
+
+    def dispatch(self, response):
+        if isinstance(response, dict) and response.get("method") == "eth_subscription":
+            params = response["params"]
+            self._subscriptions.setdefault(params["subscription"], asyncio.Queue()).put_nowait(params["result"])
+            return
+        key = response_key(response)
+        if key is None and self._pending:
+            # answers without id, to a request the node could not read, go to the oldest request
+            key = next(iter(self._pending))
+        futures = self._pending.get(key)
+        if not futures:
+            return
+        future = futures.popleft()
+        if not futures:
+            del self._pending[key]
+        if not future.done():
+            future.set_result(response)
+
+    async def read(self):
+        try:
+            async for message in self._websocket:
+                if message.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                    self.dispatch(json.loads(message.data))
+                elif message.type == aiohttp.WSMsgType.ERROR:
+                    break
+        finally:
+            self.fail(aiohttp.ClientConnectionError("WebSocket %s closed" % self.url))
+
+    def fail(self, error):
+        """ The requests waiting for an answer fail as on a dead HTTP connection, subscriptions end """
+        for futures in self._pending.values():
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+        self._pending.clear()
+        for queue in self._subscriptions.values():
+            queue.put_nowait(None)
+
+    async def close(self):
+        await self._websocket.close()
+        await asyncio.gather(self._reader, return_exceptions=True)
+
+
+class WebSocketPool:
+    """
+    WS_CONNECTIONS sockets to a node, the requests go to them in turn.
+    Sockets are opened on first use with the aiohttp session of the broadcast,
+    and opened again when one closed.
+    """
+
+    def __init__(self, url, size=WS_CONNECTIONS):
+        self.url = url
+        self.size = size
+        self.clients = []
+        self.requests = 0
+        self.max_in_flight = 0
+        self._next = 0
+        self._session = None
+        self._lock = None
+
+    async def client(self, session):
+        if session is not self._session:
+            # a new broadcast, on a new event loop
+            self.fold_counters()
+            self._session, self.clients, self._lock = session, [None] * self.size, asyncio.Lock()
+        self._next = i = (self._next + 1) % self.size
+        async with self._lock:
+            client = self.clients[i]
+            if client is None or client.closed:
+                if client is not None:
+                    self.fold_counters(client)
+                client = self.clients[i] = await WebSocketClient.connect(session, self.url)
+        return client
+
+    async def request(self, session, body, key):
+        client = await self.client(session)
+        return await client.request(body, key)
+
+    def fold_counters(self, client=None):
+        """ Adds the counters of a client, or of all of them, before they are dropped """
+        for client in [client] if client is not None else [c for c in self.clients if c is not None]:
+            self.requests += client.requests
+            self.max_in_flight = max(self.max_in_flight, client.max_in_flight)
+            client.requests = 0
+
+    async def close(self):
+        self.fold_counters()
+        await asyncio.gather(*[client.close() for client in self.clients if client is not None],
+                             return_exceptions=True)
+
+    def stats(self):
+        clients = [client for client in self.clients if client is not None]
+        return {
+            "url": self.url,
+            "sockets": self.size,
+            "requests": self.requests + sum(client.requests for client in clients),
+            "max_in_flight_per_socket": max([self.max_in_flight] + [client.max_in_flight for client in clients])
+        }
+
+
+class HeadWatcher:
+    """
+    Number of the last block, pushed by a newHeads subscription, on a thread of its own
+
+    >>> heads = HeadWatcher("ws://node:8546").start()
+    >>> heads.wait(0.3)  # True when a block arrived since the last wait
+    >>> heads.number
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.number = None
+        self.error = None
+        self._new = Event()
+        self._thread = None
+
+    async def watch(self):
+        async with aiohttp.ClientSession() as session:
+            client = await WebSocketClient.connect(session, self.url)
+            heads = await client.subscribe("newHeads")
+            while True:
+                header = await heads.get()
+                if header is None:
+                    raise aiohttp.ClientConnectionError("WebSocket %s closed" % self.url)
+                self.number = int(header["number"], 16)
+                self._new.set()
+
+    def run(self):
+        try:
+            asyncio.run(self.watch())
+        except Exception as e:
+            self.error = e
+            self._new.set()
+
+    def start(self):
+        self._thread = Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait(self, timeout):
+        new = self._new.wait(timeout)
+        self._new.clear()
+        return new
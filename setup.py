@@ -14,6 +14,7 @@ setup(
         'eth_utils',
         'two1',
         'python-dotenv',
+        'aiohttp',
         'autopep8',
     ],
     author='Carlos Faria',
@@ -21,7 +22,7 @@ setup(
     description='Hammer to break blockchains',
     license='MIT',
     long_description=README,
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     keywords='ethereum bench tps performance',
     url='https://gitlab.com/public-mint/hammer',
     classifiers=[
@@ -32,7 +33,7 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
         'Topic :: Scientific/Engineering',
     ]
 )
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the modules of hammer/ import each other by their plain names
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "hammer"))
@@ -0,0 +1,56 @@
+import pytest
+
+from atomic_nonce import AtomicNonce, NonceError
+
+
+def test_reserve_after_increment():
+    nonce = AtomicNonce(None, "0x0", 41)
+    assert nonce.increment() == 42
+    assert nonce.reserve(4) == range(43, 47)
+    assert nonce.value == 46
+
+
+def test_released_nonces_go_to_a_reservation_they_hold():
+    nonce = AtomicNonce(None, "0x0", 41)
+    nonce.reserve(5)
+    nonce.release(range(43, 45))
+    assert nonce.reserve(4) == range(47, 51)
+    assert nonce.reserve(1) == range(43, 44)
+    assert nonce.increment() == 44
+    assert nonce.released() == []
+
+
+def test_release_of_the_last_nonces_rolls_back():
+    nonce = AtomicNonce(None, "0x0", -1)
+    nonce.reserve(10)
+    nonce.release(range(8, 10))
+    nonce.release(range(5, 8))
+    assert nonce.value == 4
+    assert nonce.released() == []
+
+
+def test_shared_nonce_keeps_the_state():
+    nonce = AtomicNonce(None, "0x0", 9)
+    nonce.reserve(4)
+    nonce.release(range(11, 13))
+    shared = nonce.shared()
+    assert shared.value == 13
+    assert shared.released() == [range(11, 13)]
+    assert shared.reserve(3) == range(14, 17)
+    assert shared.reserve(2) == range(11, 13)
+    assert shared.increment() == 17
+
+
+def test_release_checks_the_nonces():
+    nonce = AtomicNonce(None, "0x0", 9)
+    nonce.reserve(5)
+    with pytest.raises(NonceError):
+        nonce.release(range(13, 16))
+    nonce.release(range(11, 13))
+    with pytest.raises(NonceError):
+        nonce.release(range(12, 14))
+    with pytest.raises(NonceError):
+        nonce.shared().release(range(10, 12))
+    assert nonce.released() == [range(11, 13)]
+    assert nonce.reserve(2) == range(11, 13)
+    assert nonce.reserve(1) == range(15, 16)
@@ -0,0 +1,32 @@
+from batcher import batch_outcome
+
+POOL_FULL = {"code": -32000, "message": "Transaction pool is full"}
+
+
+def answer(id, result=None, error=None):
+    return {"jsonrpc": "2.0", "id": id, **({"error": error} if error else {"result": result})}
+
+
+def test_all_accepted():
+    response = [answer(101, "0xb"), answer(100, "0xa")]
+    assert batch_outcome(response, 2, first_id=100) == (2, [(0, "0xa"), (1, "0xb")], [], False, False)
+
+
+def test_pool_full_stops_the_consumed_transactions():
+    response = [answer(0, "0xa"), answer(1, error=POOL_FULL), answer(2, "0xc")]
+    consumed, hashes, errors, pool_full, failed = batch_outcome(response, 3)
+    assert (consumed, pool_full, failed, errors) == (1, True, False, [])
+    # accepted after the rejection: kept, sending it again gives "known transaction"
+    assert hashes == [(0, "0xa"), (2, "0xc")]
+
+
+def test_errors_and_missing_answers():
+    response = [answer(0, error={"code": -32000, "message": "nonce too low"}),
+                answer(1, error={"code": -32000, "message": "Known transaction"}), answer(7, "0xz")]
+    consumed, hashes, errors, pool_full, failed = batch_outcome(response, 3)
+    assert (consumed, hashes, pool_full, failed) == (3, [], False, False)
+    assert errors == [{"code": -32000, "message": "nonce too low"}, "No answer for this transaction"]
+
+
+def test_failed_batch():
+    assert batch_outcome({"error": "Connection refused"}, 3) == (0, [], ["Connection refused"], False, True)
@@ -0,0 +1,91 @@
+import pytest
+from eth_keys import keys
+
+import crypto
+from crypto import HDKey, HDPrivateKey, PrivateKey, available_backends, set_backend, sha3
+
+# Well known development mnemonic, never use it on a real network
+MNEMONIC = "test test test test test test test test test test test junk"
+ACCOUNTS = [
+    ("0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80",
+     "0xf39fd6e51aad88f6f4ce6ab8827279cfffb92266"),
+    ("0x59c6995e998f97a5a0044966f0945389dc9e86dae88c7a8412f4603b6b78690d",
+     "0x70997970c51812dc3a010c7d01b50e0d17dc79c8"),
+]
+
+# secp256k1: k * G
+POINTS = [
+    (1, 0x79be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798,
+     0x483ada7726a3c4655da4fbfc0e1108a8fd17b448a68554199c47d08ffb10d4b8),
+    (2, 0xc6047f9441ed7d6d3045406e95c07cd85c778e4b8cef3ca7abac09b95c709ee5,
+     0x1ae168fea63dc339a3c58419466ceaeef7f632653266d0e1236431a950cfe52a),
+]
+
+# BIP-32 test vector 1
+BIP32_SEED = bytes.fromhex("000102030405060708090a0b0c0d0e0f")
+BIP32_VECTORS = [
+    ("m", b"xprv9s21ZrQH143K3QTDL4LXw2F7HEK3wJUD2nW2nRk4stbPy6cq3jPPqjiChkVvvNKmPGJxWUtg6LnF5kejMRNNU3TGtRBeJgk33yuGBxrMPHi",
+     "0339a36013301597daef41fbe593a02cc513d0b55527ec2df1050e2e8ff49c85c2"),
+    ("m/0'", b"xprv9uHRZZhk6KAJC1avXpDAp4MDc3sQKNxDiPvvkX8Br5ngLNv1TxvUxt4cV1rGL5hj6KCesnDYUhd7oWgT11eZG7XnxHrnYeSvkzY7d2bhkJ7",
+     "035a784662a4a20a65bf6aab9ae98a6c068a81c52e4b032c0fb5400c706cfccc56"),
+]
+
+MESSAGES = [sha3(i.to_bytes(32, "big")) for i in range(8)]
+
+
+@pytest.fixture(params=available_backends())
+def backend(request):
+    previous = crypto.get_backend()
+    set_backend(request.param)
+    yield request.param
+    crypto._backend = previous
+
+
+def account_key(index):
+    return HDKey.from_path(HDPrivateKey.master_key_from_mnemonic(MNEMONIC), "m/44'/60'/0'/0/%d" % index)[-1]
+
+
+def test_every_backend_is_available():
+    assert set(available_backends()) == {"coincurve", "python", "two1"}
+
+
+@pytest.mark.parametrize("k, x, y", POINTS)
+def test_public_key(backend, k, x, y):
+    point = PrivateKey(k).public_key.point
+    assert (point.x, point.y) == (x, y)
+
+
+@pytest.mark.parametrize("path, xprv, public_key", BIP32_VECTORS)
+def test_bip32_vector(backend, path, xprv, public_key):
+    key = HDKey.from_path(HDPrivateKey.master_key_from_seed(BIP32_SEED), path)[-1]
+    assert key.to_b58check() == xprv
+    assert key.public_key.compressed_bytes.hex() == public_key
+
+
+@pytest.mark.parametrize("index", range(len(ACCOUNTS)))
+def test_mnemonic_accounts(backend, index):
+    key = account_key(index)
+    assert (hex(key._key.key), key.public_key.address()) == ACCOUNTS[index]
+
+
+def test_derive_many_matches_from_parent(backend):
+    parent = HDKey.from_path(HDPrivateKey.master_key_from_mnemonic(MNEMONIC), "m/44'/60'/0'/0")[-1]
+    derived = [(key._key.key, key.public_key.address()) for key in HDPrivateKey.derive_many(parent, range(20))]
+    one_by_one = [(key._key.key, key.public_key.address())
+                  for key in (HDPrivateKey.from_parent(parent, i) for i in range(20))]
+    assert derived == one_by_one
+    assert derived[:2] == [(int(private_key, 16), address) for private_key, address in ACCOUNTS]
+
+
+def test_signatures_match_eth_keys(backend):
+    key = account_key(0)
+    # eth_keys is the reference implementation of Ethereum signatures
+    reference = keys.PrivateKey(key._key.key.to_bytes(32, "big"))
+    expected = [(sig.r, sig.s, sig.v) for sig in map(reference.sign_msg_hash, MESSAGES)]
+
+    signatures = []
+    for message in MESSAGES:
+        sig, rec_id = key._key.raw_sign(message, do_hash=False)
+        signatures.append((sig.x, sig.y, rec_id))
+    assert signatures == expected
+    assert [(sig.x, sig.y, rec_id) for sig, rec_id in key._key.sign_many(MESSAGES, do_hash=False)] == expected
@@ -0,0 +1,49 @@
+import pytest
+
+import nonce_gaps
+from nonce_gaps import GapRepair, unacknowledged, pending_gap, gap_positions
+
+
+@pytest.fixture(autouse=True)
+def gaps():
+    nonce_gaps._gaps = None
+    yield nonce_gaps.nonce_gaps()
+    nonce_gaps._gaps = None
+
+
+def test_unacknowledged():
+    assert unacknowledged({0, 1, 3, 5}, 6) == [2, 4]
+    assert unacknowledged(set(range(6)), 6) == []
+
+
+def test_pending_gap():
+    # the node expects nonce 12 next: the bodies from nonce 10 on were acknowledged up to position 4
+    assert pending_gap(12, 10, {0, 1, 2, 3, 4}) == [2, 3, 4]
+    assert pending_gap(15, 10, {0, 1, 2, 3, 4}) == []
+    assert pending_gap(8, 10, {0, 1}) is None
+
+
+def test_gap_positions():
+    assert gap_positions({0, 2}, 3, 10, None) == ([1], "from_errors")
+    assert gap_positions({0, 1, 2}, 3, 10, None) == ([], "from_pending")
+    assert gap_positions({0, 1, 2}, 3, 10, 11) == ([1, 2], "from_pending")
+    assert gap_positions({0, 1, 2}, 3, 10, 13) == ([], "from_pending")
+
+
+def test_repaired_gap(gaps):
+    repair = GapRepair()
+    assert repair.check([1, 2], "from_errors")
+    assert repair.positions == [1, 2]
+    assert not repair.check([], "from_pending")
+    assert gaps.stats() == {"detected": 1, "from_errors": 1, "from_pending": 0, "repaired": 1,
+                            "unrepaired": 0, "resent": 2}
+
+
+def test_gap_not_repaired(gaps):
+    repair = GapRepair(rounds=2)
+    assert repair.check([3], "from_pending")
+    assert repair.check([3], "from_pending")
+    assert not repair.check([3], "from_pending")
+    assert not GapRepair().check(None, "from_pending")
+    assert gaps.stats() == {"detected": 2, "from_errors": 0, "from_pending": 2, "repaired": 0,
+                            "unrepaired": 2, "resent": 2}
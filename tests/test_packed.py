@@ -0,0 +1,98 @@
+import os
+
+import pytest
+from eth_utils import keccak
+
+from raw_tx_store import RawTxStore, pack_raw_txs
+from rpc_bodies import RequestBodies, encode_calls, ID_STRIDE
+from corpus import write_corpus, read_corpus, CorpusError
+
+RAW_TXS = [os.urandom(length) for length in (1, 110, 300, 55, 56)]
+
+
+def test_raw_tx_store_round_trip():
+    store = RawTxStore()
+    store.extend_packed(pack_raw_txs(RAW_TXS[:2]))
+    store.extend_packed(pack_raw_txs(RAW_TXS[2:]))
+    assert len(store) == len(RAW_TXS)
+    assert list(store) == RAW_TXS
+    assert store[-1] == RAW_TXS[-1]
+    assert bytes(store.packed()) == pack_raw_txs(RAW_TXS)
+    # indexed in place
+    assert list(RawTxStore(memoryview(pack_raw_txs(RAW_TXS)))) == RAW_TXS
+    with pytest.raises(IndexError):
+        store[len(RAW_TXS)]
+
+
+def test_raw_tx_store_truncated():
+    with pytest.raises(ValueError):
+        RawTxStore(pack_raw_txs(RAW_TXS)[:-1])
+
+
+def test_request_bodies():
+    bodies = RequestBodies.from_raw_txs(RAW_TXS, first_id=ID_STRIDE)
+    assert len(bodies) == len(RAW_TXS)
+    assert bodies.call(1) == (b'{"jsonrpc":"2.0","method":"eth_sendRawTransaction","params":["0x%s"],"id":%d}'
+                              % (RAW_TXS[1].hex().encode(), ID_STRIDE + 1))
+    assert bodies.batch(0, 2) == b"[%s,%s]" % (bodies.call(0), bodies.call(1))
+    assert bodies.tx_hash(2) == "0x" + keccak(RAW_TXS[2]).hex()
+
+
+def test_request_bodies_extended_by_jobs():
+    bodies = RequestBodies(ID_STRIDE)
+    bodies.extend(*encode_calls(RAW_TXS[:3], ID_STRIDE))
+    bodies.extend(*encode_calls(RAW_TXS[3:], ID_STRIDE + 3))
+    whole = RequestBodies.from_raw_txs(RAW_TXS, ID_STRIDE)
+    assert [bodies.call(i) for i in range(len(RAW_TXS))] == [whole.call(i) for i in range(len(RAW_TXS))]
+
+
+def test_request_bodies_packed_round_trip():
+    bodies = RequestBodies.from_raw_txs(RAW_TXS, first_id=7)
+    unpacked = RequestBodies.from_packed(memoryview(bodies.packed()), len(RAW_TXS), 7)
+    assert len(unpacked) == len(bodies)
+    assert unpacked.first_id == 7
+    for i in range(len(RAW_TXS)):
+        assert unpacked.call(i) == bodies.call(i)
+        assert unpacked.tx_hash(i) == bodies.tx_hash(i)
+    assert unpacked.batch(1, 4) == bodies.batch(1, 4)
+    with pytest.raises(ValueError):
+        RequestBodies.from_packed(bodies.packed()[:-1], len(RAW_TXS), 7)
+
+
+def corpus_accounts():
+    accounts = {}
+    for index in range(3):
+        raw_txs = [os.urandom(110) for _ in range(10 + index)]
+        signed_txs = RawTxStore()
+        signed_txs.extend_packed(pack_raw_txs(raw_txs))
+        accounts[index] = {
+            "address": "0x" + os.urandom(20).hex(),
+            "first_nonce": 5 * index,
+            "signed_txs": signed_txs,
+            "bodies": RequestBodies.from_raw_txs(raw_txs, ID_STRIDE * index)
+        }
+    return accounts
+
+
+def test_corpus_round_trip(tmp_path):
+    file = str(tmp_path / "corpus.bin")
+    accounts = corpus_accounts()
+    assert write_corpus(accounts, file, chain_id=2018) == os.path.getsize(file)
+
+    chain_id, replayed = read_corpus(file)
+    assert chain_id == 2018
+    assert list(replayed) == list(accounts)
+    for index, account in accounts.items():
+        bodies = replayed[index]["bodies"]
+        assert replayed[index]["address"] == account["address"]
+        assert replayed[index]["first_nonce"] == account["first_nonce"]
+        assert bodies.first_id == account["bodies"].first_id
+        assert [bodies.call(i) for i in range(len(bodies))] == \
+               [account["bodies"].call(i) for i in range(len(account["bodies"]))]
+
+
+def test_corpus_of_another_format(tmp_path):
+    file = tmp_path / "corpus.bin"
+    file.write_bytes(b"HAMRCRP1" + bytes(64))
+    with pytest.raises(CorpusError):
+        read_corpus(str(file))
@@ -0,0 +1,52 @@
+import json
+import os
+
+import pytest
+from web3 import Web3
+
+from config import GAS, GAS_PRICE, CHAIN_ID
+from tx_template import TransactionTemplate, signing_key, rlp_int, rlp_bytes
+
+PRIVATE_KEY = "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80"
+CONTRACT_ADDRESS = "0x1111111111111111111111111111111111111111"
+FILE_CONTRACT_ABI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "contract-abi.json")
+
+
+@pytest.fixture(scope="module")
+def abi():
+    with open(FILE_CONTRACT_ABI) as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("value, encoded", [(0, b"\x80"), (1, b"\x01"), (0x7f, b"\x7f"), (0x80, b"\x81\x80"),
+                                            (1024, b"\x82\x04\x00")])
+def test_rlp_int(value, encoded):
+    assert rlp_int(value) == encoded
+
+
+def test_rlp_bytes():
+    assert rlp_bytes(b"") == b"\x80"
+    assert rlp_bytes(b"\x01") == b"\x01"
+    assert rlp_bytes(b"dog") == b"\x83dog"
+    assert rlp_bytes(b"a" * 56) == b"\xb8\x38" + b"a" * 56
+
+
+def test_template_matches_web3(abi):
+    w3 = Web3()
+    contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=abi)
+    template = TransactionTemplate(abi, "set", CONTRACT_ADDRESS)
+    key = signing_key(PRIVATE_KEY)
+
+    args = [0, 1, 127, 128, 2 ** 64, 2 ** 256 - 1]
+    expected = []
+    for nonce, x in enumerate(args, 300):
+        tx = contract.functions.set(x=x).buildTransaction({
+            'gas': GAS,
+            'gasPrice': GAS_PRICE,
+            'nonce': nonce,
+            'chainId': CHAIN_ID
+        })
+        expected.append(bytes(w3.eth.account.signTransaction(tx, private_key=PRIVATE_KEY).rawTransaction))
+
+    assert template.sign_many(key, 300, [(x,) for x in args]) == expected
+    assert template.sign(key, 300, args[0]) == expected[0]